@@ -3,11 +3,29 @@ from backend.question_answering import QA
 from backend.web_search import WebSearch
 from backend.deep_research import DeepResearch
 from backend.chat_store import ChatStore
+from backend.context_builder import ContextBuilder
+from backend.semantic_cache import SemanticCache
+from backend.conversation_memory import ConversationMemory
+from backend.background_jobs import BackgroundJobs
+from backend.ingestion_jobs import IngestionJobStore, IngestionWorker
+from backend.retriever import Retriever
+from backend.document_qa import DocumentQA
+from llm.tokenizer import TokenCounter
+from llm.scheduler import get_scheduler
 import uuid
 import time
-from utils.utilities import response_stream, generate_conversation_title
+import os
+import hashlib
+from utils.utilities import stream_text, title_conversation
 from utils.logging_config import configure_logging_from_env
-from utils.env_loader import load_env
+from utils import tracing
+from utils.env_loader import load_env, get_optional
+
+# Load environment variables from .env (if present) before anything reads them;
+# the Settings sidebar below already starts the LLM scheduler
+load_env()
+configure_logging_from_env()
+tracing.configure_tracing_from_env()
 
 # Sidebar - Settings (always expanded)
 with st.sidebar.expander("Settings", expanded=True):
@@ -24,8 +42,71 @@ with st.sidebar.expander("Settings", expanded=True):
         step=0.1,
         key="temp_slider",
     )
+    show_timings = st.checkbox("Show timing breakdown", key="show_timings")
+    llm_metrics = get_scheduler().metrics()
+    st.caption(
+        f"LLM queue: {llm_metrics['queue_depth']} waiting, {llm_metrics['running']} running | "
+        f"wait p50 {llm_metrics['wait_p50']:.1f}s, p95 {llm_metrics['wait_p95']:.1f}s"
+    )
+
+@st.cache_resource
+def get_chat_store() -> ChatStore:
+    # one store (and per-thread connection pool) shared by all sessions and reruns
+    return ChatStore(write_behind=get_optional("CHAT_WRITE_BEHIND", "False") == "True")
+
+
+@st.cache_resource
+def get_token_counter(model_id: str) -> TokenCounter:
+    return TokenCounter(model_id)
+
+
+@st.cache_resource
+def get_semantic_cache() -> SemanticCache:
+    # shared by all sessions; only plain chat answers are cached
+    return SemanticCache(modes=("plain",))
+
+
+@st.cache_resource
+def get_conversation_memory(model_id: str) -> ConversationMemory:
+    # one per model so Ollama contexts and token counts match the model in use
+    return ConversationMemory(get_chat_store(), token_counter=get_token_counter(model_id))
+
+
+@st.cache_resource
+def get_background_jobs() -> BackgroundJobs:
+    return BackgroundJobs(max_workers=1)
+
+
+@st.cache_resource
+def get_ingestion_worker() -> IngestionWorker:
+    return IngestionWorker(IngestionJobStore())
+
+
+@st.cache_resource
+def get_retriever() -> Retriever:
+    # shared so the embedding model, query-embedding cache and search matrix are reused
+    reranker = None
+    if get_optional("RAG_RERANK", "False") == "True":
+        from backend.reranker import Reranker
+
+        reranker = Reranker()
+    return Retriever(reranker=reranker)
+
+
+@st.cache_resource
+def schedule_chat_retention() -> bool:
+    # once per server process: move archived and inactive conversations to the cold database
+    days = get_optional("CHAT_COLD_AFTER_DAYS", "")
+    if not days:
+        return False
+    get_background_jobs().submit("chat_retention", get_chat_store().move_to_cold, max_age_days=float(days))
+    return True
+
+
+semantic_cache = get_semantic_cache() if get_optional("SEMANTIC_CACHE", "False") == "True" else None
+AI = QA(model_name=llm_model, temperature=temperature, cache=semantic_cache)
+memory = get_conversation_memory(llm_model)
 
-AI = QA(model_name=llm_model, temperature=temperature)
 
 # Main Page
 st.title("WebRage Chatbot")
@@ -33,7 +114,8 @@ st.write("Ask me anything! I can help you with your questions.")
 st.write("This is a simple chat interface powered by LLM.")
 
 # Initialize persistent chat store
-store = ChatStore()
+store = get_chat_store()
+schedule_chat_retention()
 
 # Resolve user id from URL (anonymous) and ensure a conversation
 params = st.query_params
@@ -49,123 +131,191 @@ conversation_id = store.ensure_conversation(user_id, conversation_id)
 st.query_params["uid"] = user_id
 st.query_params["cid"] = conversation_id
 
+MESSAGE_PAGE_SIZE = 20
+CONVERSATION_PAGE_SIZE = 20
+SEARCH_RESULT_LIMIT = 10
+
+
+def load_message_page(before=None):
+    """Fetch one page of messages older than `before` and whether older ones exist."""
+    page = store.get_messages(user_id, conversation_id, before=before, limit=MESSAGE_PAGE_SIZE + 1)
+    has_earlier = len(page) > MESSAGE_PAGE_SIZE
+    return [{"id": m["id"], "role": m["role"], "content": m["content"]} for m in page[-MESSAGE_PAGE_SIZE:]], has_earlier
+
+
+def render_timings(rows):
+    """Per-stage timing breakdown of one answer, as recorded by the tracer."""
+    with st.expander("Timing breakdown"):
+        table = ["| Stage | ms | Details |", "|---|---:|---|"]
+        for r in rows:
+            details = ", ".join(f"{k}={v}" for k, v in r["attrs"].items() if v is not None)
+            if r["error"]:
+                details = f"{details}, failed: {r['error']}" if details else f"failed: {r['error']}"
+            table.append(f"| {'&nbsp;&nbsp;' * r['depth']}{r['name']} | {r['ms']:.1f} | {details} |")
+        st.markdown("\n".join(table), unsafe_allow_html=True)
+
+
 # Initialize session state for chat history and track loaded conversation
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if st.session_state.get("_loaded_cid") != conversation_id:
-    # Load messages for the selected conversation from the DB
-    msgs = store.get_messages(user_id, conversation_id)
-    st.session_state.messages = [{"role": m["role"], "content": m["content"]} for m in msgs]
+    # Load only the most recent page; older pages are fetched on demand
+    st.session_state.messages, st.session_state._has_earlier = load_message_page()
     st.session_state._loaded_cid = conversation_id
 
-# Load environment variables from .env (if present) and configure logging
-load_env()
-configure_logging_from_env()
+if st.session_state.get("_has_earlier") and st.button("Load earlier messages", key="load_earlier_btn"):
+    oldest = st.session_state.messages[0]["id"] if st.session_state.messages else None
+    earlier, st.session_state._has_earlier = load_message_page(before=oldest)
+    st.session_state.messages = earlier + st.session_state.messages
+    st.rerun()
 
 # Display chat messages from history on app rerun
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        if show_timings and message.get("timings"):
+            render_timings(message["timings"])
 
 # Removed mode indicator icons to simplify UI
 
 # Accept user input
 if prompt := st.chat_input("What is up?"):
-    # Controlla se il pulsante "Deep Research" è stato cliccato
-    if "deep_research" in st.session_state and st.session_state.deep_research:
-        # Usa un metodo diverso per processare la query
-        with st.chat_message("user"):
-            st.markdown(f"**[Deep Research Mode]** {prompt}")
-        user_msg_content = f"[Deep Research Mode] {prompt}"
-        st.session_state.messages.append({"role": "user", "content": user_msg_content})
-        store.append_message(user_id, conversation_id, "user", user_msg_content)
-        # Set conversation title if empty
-        conv = store.get_conversation(user_id, conversation_id)
-        if conv and not conv.get("title"):
-            try:
-                msgs = store.get_messages(user_id, conversation_id)
-                title = generate_conversation_title(AI, msgs, user_msg_content)
-            except Exception:
-                title = user_msg_content[:80]
-            store.rename_conversation(user_id, conversation_id, title)
-
-        # Risposta dell'assistente in modalità Deep Research
-        deep_research = DeepResearch()
-        start_time = time.time()  # Inizio del timer
-        with st.chat_message("assistant"):
-            response = deep_research.search(prompt)
-            response = st.write_stream((_ for _ in response))
-        generation_time = time.time() - start_time  # Calcolo del tempo di generazione
-        st.session_state.messages.append({"role": "assistant", "content": response})
-        store.append_message(user_id, conversation_id, "assistant", response)
-
-        # Mostra informazioni aggiuntive
-        st.markdown(
-            f"<small>Model: {llm_model} | Temperature: {temperature} | Generation Time: {generation_time:.2f}s</small>",
-            unsafe_allow_html=True
-        )
+    with tracing.span("chat.request", force=show_timings) as request_span:
+        # Controlla se il pulsante "Deep Research" è stato cliccato
+        if "deep_research" in st.session_state and st.session_state.deep_research:
+            # Usa un metodo diverso per processare la query
+            with st.chat_message("user"):
+                st.markdown(f"**[Deep Research Mode]** {prompt}")
+            user_msg_content = f"[Deep Research Mode] {prompt}"
+            msg_id = store.append_message(user_id, conversation_id, "user", user_msg_content)
+            st.session_state.messages.append({"id": msg_id, "role": "user", "content": user_msg_content})
 
-        # Resetta lo stato di "Deep Research"
-        st.session_state.deep_research = False
-    elif "web_search" in st.session_state and st.session_state.web_search:
-        # use the search method to retrieve the top5 results, append them to the prompt and then generate the response
-        web_search_client = WebSearch()
-        search_results = web_search_client.search(prompt, num_results=5)
-        search_context = "\n".join([f"- {result['title']}: {result['content']}" for result in search_results])
-        enhanced_prompt = f"{prompt}\n\nHere are some relevant search results:\n{search_context}"
-        with st.chat_message("user"):
-            st.markdown(f"**[Web Search]** {prompt}")
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        store.append_message(user_id, conversation_id, "user", prompt)
-        conv = store.get_conversation(user_id, conversation_id)
-        if conv and not conv.get("title"):
-            store.rename_conversation(user_id, conversation_id, prompt[:80])
-        # Risposta dell'assistente in modalità Web Search
-        start_time = time.time()  # Inizio del timer
-        with st.chat_message("assistant"):
-            response = st.write_stream(response_stream(AI, enhanced_prompt))
-        generation_time = time.time() - start_time  # Calcolo del tempo di generazione
-        st.session_state.messages.append({"role": "assistant", "content": response})
-        store.append_message(user_id, conversation_id, "assistant", response)
-        # Mostra informazioni aggiuntive
-        st.markdown(
-            f"<small>Model: {llm_model} | Temperature: {temperature} | Generation Time: {generation_time:.2f}s</small>",
-            unsafe_allow_html=True
-        )
-        # Resetta lo stato di "Web Search"
-        st.session_state.web_search = False
-    else:
-        # Modalità normale
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        store.append_message(user_id, conversation_id, "user", prompt)
-        conv = store.get_conversation(user_id, conversation_id)
-        if conv and not conv.get("title"):
-            store.rename_conversation(user_id, conversation_id, prompt[:80])
-
-        # Risposta dell'assistente in modalità normale
-        start_time = time.time()  # Inizio del timer
-        with st.chat_message("assistant"):
-            response = st.write_stream(response_stream(AI, prompt))
-        generation_time = time.time() - start_time  # Calcolo del tempo di generazione
-        st.session_state.messages.append({"role": "assistant", "content": response})
-        store.append_message(user_id, conversation_id, "assistant", response)
-
-        # Mostra informazioni aggiuntive
-        st.markdown(
-            f"<small>Model: {llm_model} | Temperature: {temperature} | Generation Time: {generation_time:.2f}s</small>",
-            unsafe_allow_html=True
+            # Risposta dell'assistente in modalità Deep Research
+            deep_research = DeepResearch()
+            start_time = time.time()  # Inizio del timer
+            with st.chat_message("assistant"):
+                response = deep_research.search(prompt)
+                response = st.write_stream((_ for _ in response))
+            generation_time = time.time() - start_time  # Calcolo del tempo di generazione
+            msg_id = store.append_message(user_id, conversation_id, "assistant", response)
+            st.session_state.messages.append({"id": msg_id, "role": "assistant", "content": response})
+
+            # Mostra informazioni aggiuntive
+            st.markdown(
+                f"<small>Model: {llm_model} | Temperature: {temperature} | Generation Time: {generation_time:.2f}s</small>",
+                unsafe_allow_html=True
+            )
+
+            # Resetta lo stato di "Deep Research"
+            st.session_state.deep_research = False
+        elif "web_search" in st.session_state and st.session_state.web_search:
+            # use the search method to retrieve the top5 results, append them to the prompt and then generate the response
+            web_search_client = WebSearch()
+            search_results = web_search_client.search(prompt, num_results=5)
+            packed = ContextBuilder(token_counter=get_token_counter(llm_model)).build(
+                prompt, search_results, budget_tokens=1536
+            )
+            search_context = packed["context"]
+            enhanced_prompt = f"{prompt}\n\nHere are some relevant search results:\n{search_context}"
+            with st.chat_message("user"):
+                st.markdown(f"**[Web Search]** {prompt}")
+            msg_id = store.append_message(user_id, conversation_id, "user", prompt)
+            st.session_state.messages.append({"id": msg_id, "role": "user", "content": prompt})
+            # Risposta dell'assistente in modalità Web Search
+            start_time = time.time()  # Inizio del timer
+            with st.chat_message("assistant"):
+                answer = memory.answer(AI, user_id, conversation_id, enhanced_prompt, mode="web_search")
+                response = st.write_stream(stream_text(answer))
+            generation_time = time.time() - start_time  # Calcolo del tempo di generazione
+            msg_id = store.append_message(user_id, conversation_id, "assistant", response)
+            st.session_state.messages.append({"id": msg_id, "role": "assistant", "content": response})
+            get_background_jobs().submit(("summary", conversation_id), memory.update_summary, AI, user_id, conversation_id)
+            # Mostra informazioni aggiuntive
+            st.markdown(
+                f"<small>Model: {llm_model} | Temperature: {temperature} | Generation Time: {generation_time:.2f}s</small>",
+                unsafe_allow_html=True
+            )
+            # Resetta lo stato di "Web Search"
+            st.session_state.web_search = False
+        elif st.session_state.get("documents"):
+            # answer from the uploaded documents
+            with st.chat_message("user"):
+                st.markdown(f"**[Documents]** {prompt}")
+            msg_id = store.append_message(user_id, conversation_id, "user", prompt)
+            st.session_state.messages.append({"id": msg_id, "role": "user", "content": prompt})
+            start_time = time.time()
+            doc_qa = DocumentQA(get_retriever(), token_counter=get_token_counter(llm_model))
+            with st.chat_message("assistant"):
+                prepared = doc_qa.prepare(prompt, user_id=user_id)
+                answer = memory.answer(AI, user_id, conversation_id, prepared["prompt"], mode="documents")
+                response = st.write_stream(stream_text(answer))
+                if prepared["sources"]:
+                    st.caption(ContextBuilder.format_sources(prepared["sources"]).replace("\n", "  \n"))
+            generation_time = time.time() - start_time
+            msg_id = store.append_message(user_id, conversation_id, "assistant", response)
+            st.session_state.messages.append({"id": msg_id, "role": "assistant", "content": response})
+            get_background_jobs().submit(("summary", conversation_id), memory.update_summary, AI, user_id, conversation_id)
+            retrieval_time = sum(v for k, v in prepared["timings"].items() if k.endswith("_s"))
+            degraded = ", ".join(prepared["timings"]["degraded"])
+            st.markdown(
+                f"<small>Model: {llm_model} | Temperature: {temperature} | Retrieval: {retrieval_time:.2f}s"
+                f"{f' (degraded: {degraded})' if degraded else ''} | Generation Time: {generation_time:.2f}s</small>",
+                unsafe_allow_html=True
+            )
+        else:
+            # Modalità normale
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            msg_id = store.append_message(user_id, conversation_id, "user", prompt)
+            st.session_state.messages.append({"id": msg_id, "role": "user", "content": prompt})
+
+            # Risposta dell'assistente in modalità normale
+            start_time = time.time()  # Inizio del timer
+            with st.chat_message("assistant"):
+                answer = memory.answer(AI, user_id, conversation_id, prompt)
+                response = st.write_stream(stream_text(answer))
+            generation_time = time.time() - start_time  # Calcolo del tempo di generazione
+            msg_id = store.append_message(user_id, conversation_id, "assistant", response)
+            st.session_state.messages.append({"id": msg_id, "role": "assistant", "content": response})
+            get_background_jobs().submit(("summary", conversation_id), memory.update_summary, AI, user_id, conversation_id)
+
+            # Mostra informazioni aggiuntive
+            st.markdown(
+                f"<small>Model: {llm_model} | Temperature: {temperature} | Generation Time: {generation_time:.2f}s</small>",
+                unsafe_allow_html=True
+            )
+
+    # the breakdown stays with the answer so it is shown again on reruns
+    timings = request_span.breakdown()
+    if show_timings and timings:
+        st.session_state.messages[-1]["timings"] = timings
+        render_timings(timings)
+
+    # Name the conversation after the first exchange without delaying the answer;
+    # the sidebar picks the title up on the next rerun.
+    conv = store.get_conversation(user_id, conversation_id)
+    if conv and not conv.get("title"):
+        get_background_jobs().submit(
+            ("title", conversation_id), title_conversation, AI, store, user_id, conversation_id
         )
 
 # (Old duplicated mode buttons removed)
 
 # Sidebar: Chats
 with st.sidebar.expander("Chats", expanded=True):
-    convs = store.list_conversations(user_id)
-    if not convs:
+    # fetch as many keyset pages of conversations as the user has asked for
+    convs = []
+    for _ in range(st.session_state.get("_conv_pages", 1)):
+        page = store.list_conversations(
+            user_id, before=convs[-1]["id"] if convs else None, limit=CONVERSATION_PAGE_SIZE
+        )
+        convs.extend(page)
+        if len(page) < CONVERSATION_PAGE_SIZE:
+            break
+    more_convs = len(convs) == CONVERSATION_PAGE_SIZE * st.session_state.get("_conv_pages", 1)
+    if not any(c["id"] == conversation_id for c in convs):
         conv = store.get_conversation(user_id, conversation_id)
-        convs = [conv] if conv else []
+        convs = ([conv] if conv else []) + convs
 
     labels = []
     ids = []
@@ -177,6 +327,19 @@ with st.sidebar.expander("Chats", expanded=True):
         if c["id"] == conversation_id:
             current_index = idx
 
+    search_query = st.text_input("Search messages", key="message_search")
+    if search_query.strip():
+        hits = store.search_messages(user_id, search_query, limit=SEARCH_RESULT_LIMIT)
+        if not hits:
+            st.caption("No matching messages.")
+        for hit in hits:
+            title = hit["conversation_title"] or f"Conversation {hit['conversation_id'][:8]}"
+            if st.button(title, key=f"search_hit_{hit['id']}", use_container_width=True):
+                st.query_params["uid"] = user_id
+                st.query_params["cid"] = hit["conversation_id"]
+                st.rerun()
+            st.caption(f"{hit['role']}: {hit['snippet']}")
+
     if labels:
         selected = st.selectbox(
             "Select conversation",
@@ -191,11 +354,16 @@ with st.sidebar.expander("Chats", expanded=True):
             st.query_params["cid"] = selected_cid
             st.rerun()
 
+    if more_convs and st.button("Older conversations", key="more_convs_btn"):
+        st.session_state._conv_pages = st.session_state.get("_conv_pages", 1) + 1
+        st.rerun()
+
     if st.button("New conversation", key="new_conv_btn"):
         new_cid = store.create_conversation(user_id)
         st.query_params["uid"] = user_id
         st.query_params["cid"] = new_cid
         st.session_state.messages = []
+        st.session_state._has_earlier = False
         st.session_state._loaded_cid = new_cid
         st.rerun()
 
@@ -225,6 +393,7 @@ with st.sidebar.expander("Modes", expanded=True):
     )
     dr_active = st.session_state.get("deep_research", False)
     ws_active = st.session_state.get("web_search", False)
+    docs_active = st.session_state.get("documents", False)
 
     if st.button(
         "Deep Research",
@@ -236,6 +405,7 @@ with st.sidebar.expander("Modes", expanded=True):
         st.session_state.deep_research = new_val
         if new_val:
             st.session_state.web_search = False
+            st.session_state.documents = False
         st.rerun()
 
     if st.button(
@@ -248,6 +418,20 @@ with st.sidebar.expander("Modes", expanded=True):
         st.session_state.web_search = new_val
         if new_val:
             st.session_state.deep_research = False
+            st.session_state.documents = False
+        st.rerun()
+
+    if st.button(
+        "Documents",
+        key="documents_btn",
+        type=("primary" if docs_active else "secondary"),
+        use_container_width=True,
+    ):
+        new_val = not docs_active
+        st.session_state.documents = new_val
+        if new_val:
+            st.session_state.deep_research = False
+            st.session_state.web_search = False
         st.rerun()
 
 # Sidebar: Upload (move to bottom)
@@ -257,5 +441,29 @@ with st.sidebar.expander("Upload", expanded=True):
         type=["pdf", "docx", "txt"],
         key="doc_uploader",
     )
-    if uploaded_file:
-        st.success(f"Uploaded: {uploaded_file.name}")
+    worker = get_ingestion_worker()
+    submitted = st.session_state.setdefault("_submitted_uploads", set())
+    if uploaded_file and uploaded_file.file_id not in submitted:
+        data = uploaded_file.getvalue()
+        # name uploads by content so re-uploading the same file is skipped by the ingestion manifest;
+        # one directory per user, so each user's copy is ingested (and owned) separately
+        upload_dir = os.path.join("chat_data", "uploads", hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:16])
+        os.makedirs(upload_dir, exist_ok=True)
+        upload_path = os.path.join(upload_dir, f"{hashlib.sha256(data).hexdigest()[:16]}_{os.path.basename(uploaded_file.name)}")
+        with open(upload_path, "wb") as f:
+            f.write(data)
+        worker.submit(user_id, uploaded_file.name, upload_path)
+        submitted.add(uploaded_file.file_id)
+        st.success(f"Uploaded: {uploaded_file.name} (queued for ingestion)")
+
+    @st.fragment(run_every=3)
+    def show_ingestion_jobs():
+        for job in worker.jobs.list_jobs(user_id, limit=5):
+            line = f"{job['file_name']}: {job['status']} | {job['chunks']} chunks"
+            if job["duration_s"] is not None:
+                line += f" | {job['duration_s']:.1f}s"
+            if job["error"]:
+                line += f" | {job['error'][:80]}"
+            st.caption(line)
+
+    show_ingestion_jobs()
@@ -1,4 +1,5 @@
 from .retriever import Retriever
 from .question_answering import QA
+from .document_qa import DocumentQA
 
-__all__ = ['Retriever', 'QA']
\ No newline at end of file
+__all__ = ['Retriever', 'QA', 'DocumentQA']
\ No newline at end of file
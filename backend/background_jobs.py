@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Hashable, Optional
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class BackgroundJobs:
+    """Small thread pool for work that must stay off the response critical path.
+
+    Jobs are submitted with a key; a job whose key is already queued or running
+    is not submitted twice, so reruns of the Streamlit script can schedule the
+    same job freely. Failures are logged, never raised into the caller.
+    """
+
+    def __init__(self, max_workers: int = 1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webrag-bg")
+        self._pending: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs) -> Optional[Future]:
+        """Run `fn(*args, **kwargs)` in the background unless `key` is already pending."""
+        with self._lock:
+            if key in self._pending:
+                return None
+            future = self._executor.submit(self._run, key, fn, *args, **kwargs)
+            self._pending[key] = future
+        return future
+
+    def _run(self, key: Hashable, fn: Callable, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logger.error("Background job %s failed: %s", key, e)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def is_pending(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
@@ -1,141 +1,704 @@
+import sys
 import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import atexit
+import bz2
 import csv
+import gzip
+import json
+import lzma
+import re
 import sqlite3
+import threading
+import time
 import uuid
+import zlib
 from datetime import datetime, timezone
 from typing import List, Optional, Dict, Any
 
+from backend.chat_store_migration import create_cold_schema, create_schema, migrate
+from utils.logging_config import get_logger
+from utils.tracing import current_span, traced
+
+logger = get_logger(__name__)
+
+
+# word tokens as the FTS5 unicode61 tokenizer splits them (underscore is a separator)
+_SEARCH_TOKEN = re.compile(r"[^\W_]+")
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _ms_to_iso(ms: Optional[int]) -> Optional[str]:
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat(timespec="milliseconds")
 
-def _utc_now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+
+def _conversation_row(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["uuid"],
+        "title": row["title"],
+        "created_at": _ms_to_iso(row["created_at"]),
+        "updated_at": _ms_to_iso(row["updated_at"]),
+        "archived": row["archived"],
+    }
+
+
+def _message_row(row: sqlite3.Row) -> Dict[str, Any]:
+    return {"id": row["uuid"], "role": row["role"], "content": row["content"], "created_at": _ms_to_iso(row["created_at"])}
 
 
 class ChatStore:
     """Simple SQLite-based store for conversations and messages.
 
-    Schema:
-      - conversations(id TEXT PK, user_id TEXT, title TEXT, created_at TEXT, updated_at TEXT, archived INT)
-      - messages(id TEXT PK, conversation_id TEXT FK, user_id TEXT, role TEXT, content TEXT, created_at TEXT)
+    Schema (version 4, see `backend.chat_store_migration`):
+      - conversations(seq INT PK, uuid TEXT UNIQUE, user_id TEXT, title TEXT, created_at INT, updated_at INT,
+        archived INT, cold INT)
+      - messages(seq INT PK, uuid TEXT UNIQUE, conversation_seq INT FK, role TEXT, content TEXT, created_at INT)
+      - conversation_summaries(conversation_seq INT PK FK, summary TEXT, message_count INT, updated_at INT)
+      - messages_fts: FTS5 index over message content and owner, synced by triggers
+
+    Rows are keyed and ordered by their INTEGER rowid (`seq`) and timestamps are
+    epoch milliseconds; the public API still identifies rows by UUID and returns
+    ISO-8601 timestamps. Message ownership is checked through the conversation.
+    Databases in the previous layout are migrated when the store opens.
+
+    Each thread keeps one open connection in WAL mode (readers do not block the
+    writer) with synchronous=NORMAL and a busy timeout, so a call costs a
+    statement execution rather than a connect; repeated queries are served from
+    the connection's prepared-statement cache.
+
+    With `write_behind=True`, `append_message` only queues the message; a writer
+    thread commits queued messages in one transaction every `flush_interval_ms`
+    or once `flush_max_messages` are waiting. Queued messages are merged into
+    `get_messages`, so readers in this process see their own writes, and the
+    queue is flushed on `flush()`, `close()` and interpreter exit. A failing
+    batch is retried up to `write_retries` times, then written row by row; rows
+    that still fail are logged and dropped, so one bad message cannot stall
+    the queue.
+
+    `move_to_cold` is the retention job: messages of archived and long-inactive
+    conversations move, compressed, to a separate cold database (`cold_db_path`)
+    and the freed pages are returned with an incremental vacuum. Conversation
+    rows and summaries stay, so listings are unchanged; a cold conversation is
+    restored when its messages are read or appended to. Search covers only
+    messages in the hot database.
     """
 
-    def __init__(self, db_path: str = "chat_data/chat.db") -> None:
+    def __init__(
+        self,
+        db_path: str = "chat_data/chat.db",
+        busy_timeout_ms: int = 5000,
+        write_behind: bool = False,
+        flush_interval_ms: int = 50,
+        flush_max_messages: int = 100,
+        cold_db_path: Optional[str] = None,
+        write_retries: int = 3,
+    ) -> None:
         self.db_path = db_path
+        self.cold_db_path = cold_db_path or os.path.join(os.path.dirname(db_path), "chat_archive.db")
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._conns: Dict[int, sqlite3.Connection] = {}
+        self._conns_lock = threading.Lock()
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self._init_db()
 
+        self.write_behind = write_behind
+        self.flush_interval_ms = flush_interval_ms
+        self.flush_max_messages = flush_max_messages
+        self.write_retries = write_retries
+        self._cond = threading.Condition()
+        self._pending: List[tuple] = []
+        self._inflight: List[tuple] = []
+        self._flush_waiters = 0
+        self._stopped = False
+        self._writer = None
+        if write_behind:
+            self._writer = threading.Thread(target=self._writer_loop, name="chat-store-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
     def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        conn = sqlite3.connect(
+            self.db_path,
+            isolation_level=None,
+            check_same_thread=False,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=256,
+        )
         conn.row_factory = sqlite3.Row
+        # lets move_to_cold return freed pages; only takes effect on a new, empty database
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        self._local.conn = conn
+        with self._conns_lock:
+            # close connections left behind by threads that have exited
+            alive = {t.ident for t in threading.enumerate()}
+            for ident in [i for i in self._conns if i not in alive]:
+                self._conns.pop(ident).close()
+            self._conns[threading.get_ident()] = conn
         return conn
 
+    def close(self) -> None:
+        """Flush queued writes, stop the writer and close every pooled connection.
+
+        Later calls reopen connections and write synchronously.
+        """
+        if self._writer is not None:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+            self._writer.join()
+            self._writer = None
+        with self._conns_lock:
+            for conn in self._conns.values():
+                conn.close()
+            self._conns.clear()
+            self._local = threading.local()
+
     def _init_db(self) -> None:
-        with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    title TEXT,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL,
-                    archived INTEGER NOT NULL DEFAULT 0
-                )
-                """
-            )
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS messages (
-                    id TEXT PRIMARY KEY,
-                    conversation_id TEXT NOT NULL,
-                    user_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY(conversation_id) REFERENCES conversations(id)
-                )
-                """
-            )
-            cur.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_conversations_user_updated
-                ON conversations(user_id, updated_at DESC)
-                """
-            )
-            cur.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_messages_conv_created
-                ON messages(conversation_id, created_at)
-                """
-            )
+        conn = self._connect()
+        migrate(conn)
+        create_schema(conn)
 
     # Conversations
+    @traced("chat_store.create_conversation")
     def create_conversation(self, user_id: str, title: Optional[str] = None) -> str:
         conv_id = str(uuid.uuid4())
-        now = _utc_now_iso()
+        now = _now_ms()
         with self._connect() as conn:
             conn.execute(
-                "INSERT INTO conversations(id, user_id, title, created_at, updated_at, archived) VALUES(?,?,?,?,?,0)",
+                "INSERT INTO conversations(uuid, user_id, title, created_at, updated_at, archived) VALUES(?,?,?,?,?,0)",
                 (conv_id, user_id, title, now, now),
             )
         return conv_id
 
-    def list_conversations(self, user_id: str) -> List[Dict[str, Any]]:
+    @traced("chat_store.list_conversations")
+    def list_conversations(
+        self, user_id: str, before: Optional[str] = None, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """List active conversations, most recently updated first.
+
+        Args:
+            user_id: Owner of the conversations.
+            before: Keyset cursor; the id of the last conversation of the previous
+                page. Only conversations ordered after it are returned.
+            limit: Maximum number of conversations (all if None).
+        """
+        query = "SELECT uuid, title, created_at, updated_at, archived FROM conversations WHERE user_id=? AND archived=0"
+        params: list = [user_id]
         with self._connect() as conn:
-            cur = conn.execute(
-                "SELECT id, title, created_at, updated_at, archived FROM conversations WHERE user_id=? AND archived=0 ORDER BY updated_at DESC",
-                (user_id,),
-            )
-            rows = [dict(row) for row in cur.fetchall()]
+            if before is not None:
+                cursor = conn.execute(
+                    "SELECT updated_at, seq FROM conversations WHERE uuid=? AND user_id=?", (before, user_id)
+                ).fetchone()
+                if cursor is None:
+                    return []
+                query += " AND (updated_at, seq) < (?, ?)"
+                params += [cursor["updated_at"], cursor["seq"]]
+            query += " ORDER BY updated_at DESC, seq DESC"
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+            rows = [_conversation_row(row) for row in conn.execute(query, params).fetchall()]
         return rows
 
+    @traced("chat_store.get_conversation")
     def get_conversation(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
         with self._connect() as conn:
             cur = conn.execute(
-                "SELECT id, title, created_at, updated_at, archived FROM conversations WHERE id=? AND user_id=?",
+                "SELECT uuid, title, created_at, updated_at, archived FROM conversations WHERE uuid=? AND user_id=?",
                 (conversation_id, user_id),
             )
             row = cur.fetchone()
-        return dict(row) if row else None
+        return _conversation_row(row) if row else None
 
+    @traced("chat_store.rename_conversation")
     def rename_conversation(self, user_id: str, conversation_id: str, title: str) -> None:
         with self._connect() as conn:
             conn.execute(
-                "UPDATE conversations SET title=?, updated_at=? WHERE id=? AND user_id=?",
-                (title, _utc_now_iso(), conversation_id, user_id),
+                "UPDATE conversations SET title=?, updated_at=? WHERE uuid=? AND user_id=?",
+                (title, _now_ms(), conversation_id, user_id),
             )
 
+    @traced("chat_store.archive_conversation")
     def archive_conversation(self, user_id: str, conversation_id: str) -> None:
         with self._connect() as conn:
             conn.execute(
-                "UPDATE conversations SET archived=1, updated_at=? WHERE id=? AND user_id=?",
-                (_utc_now_iso(), conversation_id, user_id),
+                "UPDATE conversations SET archived=1, updated_at=? WHERE uuid=? AND user_id=?",
+                (_now_ms(), conversation_id, user_id),
             )
 
     # Messages
+    @traced("chat_store.append_message")
     def append_message(self, user_id: str, conversation_id: str, role: str, content: str) -> str:
         msg_id = str(uuid.uuid4())
-        now = _utc_now_iso()
+        row = (msg_id, conversation_id, user_id, role, content, _now_ms())
+        if self._writer is not None:
+            with self._cond:
+                self._pending.append(row)
+                if len(self._pending) >= self.flush_max_messages:
+                    self._cond.notify_all()
+            return msg_id
+        self._write_batch([row], strict=True)
+        return msg_id
+
+    @traced("chat_store.write_batch")
+    def _write_batch(self, rows: List[tuple], strict: bool = False) -> None:
+        """Insert messages and bump their conversations' updated_at in one transaction.
+
+        A message whose conversation does not exist or belongs to another user
+        is not inserted. With `strict` that raises ValueError and nothing is
+        written; otherwise the dropped message ids are logged.
+        """
+        current_span().set(messages=len(rows))
+        latest: Dict[tuple, int] = {}
+        for _, conversation_id, user_id, _, _, created_at in rows:
+            key = (conversation_id, user_id)
+            latest[key] = max(latest.get(key, 0), created_at)
+        conversation_ids = list({cid for cid, _ in latest})
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # bring cold conversations back first so the new messages order after the old ones
+            restored = [
+                self._restore_locked(conn, row["seq"], row["uuid"])
+                for row in conn.execute(
+                    f"SELECT seq, uuid FROM conversations WHERE cold=1 AND uuid IN ({','.join('?' * len(conversation_ids))})",
+                    conversation_ids,
+                ).fetchall()
+            ]
+            inserted = conn.executemany(
+                "INSERT INTO messages(uuid, conversation_seq, role, content, created_at) "
+                "SELECT ?, seq, ?, ?, ? FROM conversations WHERE uuid=? AND user_id=?",
+                [(m, role, content, ts, cid, uid) for m, cid, uid, role, content, ts in rows],
+            ).rowcount
+            if inserted != len(rows):
+                owners = dict(conn.execute(
+                    f"SELECT uuid, user_id FROM conversations WHERE uuid IN ({','.join('?' * len(conversation_ids))})",
+                    conversation_ids,
+                ).fetchall())
+                dropped = [r[0] for r in rows if owners.get(r[1]) != r[2]]
+                if strict:
+                    raise ValueError(f"Unknown conversation or wrong owner for message(s) {', '.join(dropped)}")
+                logger.error("Dropped %d messages for unknown or foreign conversations: %s", len(dropped), dropped)
+            conn.executemany(
+                "UPDATE conversations SET updated_at=? WHERE uuid=? AND user_id=? AND updated_at<?",
+                [(ts, cid, uid, ts) for (cid, uid), ts in latest.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if restored:
+            self._drop_cold(restored)
+
+    def _writer_loop(self) -> None:
+        interval = self.flush_interval_ms / 1000
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # let a batch build up unless it is full, requested or we are shutting down
+                deadline = time.monotonic() + interval
+                while (
+                    len(self._pending) < self.flush_max_messages
+                    and not self._stopped
+                    and not self._flush_waiters
+                ):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                self._inflight = batch
+            self._write_with_retries(batch, interval)
+            with self._cond:
+                self._inflight = []
+                self._cond.notify_all()
+
+    def _write_with_retries(self, batch: List[tuple], interval: float) -> None:
+        """Write a queued batch, retrying a bounded number of times, then row by row."""
+        for attempt in range(self.write_retries + 1):
+            try:
+                self._write_batch(batch)
+                return
+            except Exception as e:
+                logger.error(
+                    "Write-behind flush of %d messages failed (attempt %d/%d): %s",
+                    len(batch), attempt + 1, self.write_retries + 1, e,
+                )
+            if attempt < self.write_retries and not self._stopped:
+                time.sleep(interval * 2 ** attempt)
+        if len(batch) == 1:
+            logger.error("Dropping message %s of conversation %s: it could not be written", batch[0][0], batch[0][1])
+            return
+        # isolate the rows that fail so the rest of the batch is still committed
+        for row in batch:
+            try:
+                self._write_batch([row])
+            except Exception as e:
+                logger.error("Dropping message %s of conversation %s: %s", row[0], row[1], e)
+
+    @traced("chat_store.flush")
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until every queued message is committed.
+
+        Args:
+            timeout: Seconds to wait at most (no limit if None).
+
+        Raises:
+            TimeoutError: If messages are still queued when `timeout` expires.
+        """
+        if self._writer is None:
+            return
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                while (self._pending or self._inflight) and self._writer is not None and self._writer.is_alive():
+                    wait = 0.1
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError(
+                                f"{len(self._pending) + len(self._inflight)} messages still queued after {timeout}s"
+                            )
+                        wait = min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._flush_waiters -= 1
+
+    def _unflushed(self, user_id: str, conversation_id: str) -> List[Dict[str, Any]]:
+        with self._cond:
+            rows = self._inflight + self._pending
+        return [
+            {"id": r[0], "role": r[3], "content": r[4], "created_at": _ms_to_iso(r[5])}
+            for r in rows
+            if r[1] == conversation_id and r[2] == user_id
+        ]
+
+    @traced("chat_store.get_messages")
+    def get_messages(
+        self,
+        user_id: str,
+        conversation_id: str,
+        before: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return messages of a conversation in chronological order.
+
+        Without `limit` the whole conversation is returned. With `limit`, the
+        most recent `limit` messages older than `before` are returned, so pages
+        are fetched newest-first with a keyset cursor and no OFFSET scans.
+
+        Args:
+            user_id: Owner of the conversation.
+            conversation_id: Conversation to read.
+            before: Keyset cursor; the id of the oldest message already loaded.
+            limit: Page size (all messages if None).
+        """
+        # snapshot the queue before reading, so a batch committed in between is seen at least once;
+        # queued messages are newer than every stored one and stay in queue order
+        queued = self._unflushed(user_id, conversation_id) if self._writer is not None else []
+        conn = self._connect()
+        while True:
+            # the cold flag and the messages are read in one snapshot, so a concurrent
+            # move_to_cold cannot empty the conversation between the two reads
+            conn.execute("BEGIN")
+            try:
+                conv = conn.execute(
+                    "SELECT seq, cold FROM conversations WHERE uuid=? AND user_id=?", (conversation_id, user_id)
+                ).fetchone()
+                page = None
+                if conv is not None and not conv["cold"]:
+                    page = self._read_messages(conn, conv["seq"], before, limit, queued)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if conv is None:
+                return []
+            if not conv["cold"]:
+                break
+            self._restore(conv["seq"], conversation_id)
+        if page is None:
+            return []
+        rows, queued = page
+        if queued:
+            stored = {r["id"] for r in rows}
+            rows.extend(m for m in queued if m["id"] not in stored)
+            if limit is not None:
+                rows = rows[-limit:]
+        return rows
+
+    def _read_messages(
+        self, conn: sqlite3.Connection, seq: int, before: Optional[str], limit: Optional[int], queued: List[Dict[str, Any]]
+    ) -> Optional[tuple]:
+        """Read a page of stored messages; returns (rows, queued messages still to append) or None if `before` is unknown."""
+        query = "SELECT uuid, role, content, created_at FROM messages WHERE conversation_seq=?"
+        params: list = [seq]
+        if before is not None:
+            row = conn.execute("SELECT seq FROM messages WHERE uuid=? AND conversation_seq=?", (before, seq)).fetchone()
+            if row is not None:
+                query += " AND seq < ?"
+                params.append(row["seq"])
+                queued = []
+            else:
+                idx = next((i for i, m in enumerate(queued) if m["id"] == before), None)
+                if idx is None:
+                    return None
+                queued = queued[:idx]
+        if limit is None:
+            query += " ORDER BY seq ASC"
+            rows = [_message_row(row) for row in conn.execute(query, params).fetchall()]
+        else:
+            query += " ORDER BY seq DESC LIMIT ?"
+            params.append(limit)
+            rows = [_message_row(row) for row in conn.execute(query, params).fetchall()][::-1]
+        return rows, queued
+
+    @traced("chat_store.search_messages")
+    def search_messages(self, user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Full-text search over the messages of the user's active conversations, best match first.
+
+        Every word of `query` must occur in a message (case- and
+        diacritic-insensitive); FTS5 query syntax is not interpreted. Messages
+        still queued by write-behind are not searchable until flushed.
+
+        Args:
+            user_id: Owner of the conversations searched.
+            query: Free-text query.
+            limit: Maximum number of results.
+
+        Returns:
+            Dicts with the message `id`, `conversation_id`, `conversation_title`,
+            `role`, `created_at`, a `snippet` with the matches in bold and the
+            BM25 `score` (higher is better).
+        """
+        terms = _SEARCH_TOKEN.findall(query)
+        if not terms:
+            return []
+        match = "content:(" + " ".join(f'"{t}"' for t in terms) + ")"
+        owner = _SEARCH_TOKEN.findall(user_id)
+        if owner:
+            match = f'owner:"{" ".join(owner)}" AND {match}'
         with self._connect() as conn:
-            conn.execute(
-                "INSERT INTO messages(id, conversation_id, user_id, role, content, created_at) VALUES(?,?,?,?,?,?)",
-                (msg_id, conversation_id, user_id, role, content, now),
+            rows = conn.execute(
+                """
+                SELECT m.uuid, c.uuid AS conversation_uuid, c.title, m.role, m.created_at,
+                       snippet(messages_fts, 0, '**', '**', '…', 12) AS snippet,
+                       bm25(messages_fts, 1.0, 0.0) AS rank
+                FROM messages_fts
+                JOIN messages m ON m.seq = messages_fts.rowid
+                JOIN conversations c ON c.seq = m.conversation_seq
+                WHERE messages_fts MATCH ? AND c.user_id = ? AND c.archived = 0
+                ORDER BY rank
+                LIMIT ?
+                """,
+                (match, user_id, limit),
+            ).fetchall()
+        return [
+            {
+                "id": r["uuid"],
+                "conversation_id": r["conversation_uuid"],
+                "conversation_title": r["title"],
+                "role": r["role"],
+                "created_at": _ms_to_iso(r["created_at"]),
+                "snippet": r["snippet"],
+                "score": -r["rank"],
+            }
+            for r in rows
+        ]
+
+    # Cold tier
+    def _cold_connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.cold_db_path, isolation_level=None, timeout=self.busy_timeout_ms / 1000)
+        create_cold_schema(conn)
+        return conn
+
+    @traced("chat_store.move_to_cold")
+    def move_to_cold(
+        self,
+        max_age_days: Optional[float] = 90,
+        include_archived: bool = True,
+        limit: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """Move messages of archived and inactive conversations to the cold database.
+
+        Each conversation moves in its own transaction: its messages are written
+        to the cold database as one compressed payload, then deleted from the hot
+        tables and the conversation is flagged `cold`. A crash in between leaves
+        the messages in the hot tables and a stale payload that the next run
+        replaces. Freed pages are returned to the filesystem afterwards if the
+        database uses incremental auto-vacuum (databases created before
+        retention existed are switched once by the migration CLI's `--vacuum`).
+
+        Args:
+            max_age_days: Move conversations not updated for this many days (None to skip).
+            include_archived: Also move archived conversations regardless of age.
+            limit: Maximum number of conversations moved in this run.
+
+        Returns:
+            Dict with the number of `conversations` and `messages` moved and
+            `freed_pages` released by the vacuum.
+        """
+        conditions, condition_params = [], []
+        if include_archived:
+            conditions.append("archived = 1")
+        if max_age_days is not None:
+            conditions.append("updated_at < ?")
+            condition_params.append(_now_ms() - int(max_age_days * 86400000))
+        if not conditions:
+            return {"conversations": 0, "messages": 0, "freed_pages": 0}
+        self.flush()
+        eligible = f"cold = 0 AND ({' OR '.join(conditions)})"
+        query = (
+            f"SELECT seq, uuid, user_id FROM conversations WHERE {eligible} "
+            "AND EXISTS (SELECT 1 FROM messages m WHERE m.conversation_seq = conversations.seq) ORDER BY updated_at"
+        )
+        params = list(condition_params)
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        conn = self._connect()
+        candidates = conn.execute(query, params).fetchall()
+        moved = messages = 0
+        cold = self._cold_connect()
+        try:
+            for c in candidates:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # the conversation may have been restored or written to since it was selected
+                    if conn.execute(
+                        f"SELECT 1 FROM conversations WHERE seq=? AND {eligible}", [c["seq"]] + condition_params
+                    ).fetchone() is None:
+                        conn.execute("COMMIT")
+                        continue
+                    rows = conn.execute(
+                        "SELECT uuid, role, content, created_at FROM messages WHERE conversation_seq=? ORDER BY seq",
+                        (c["seq"],),
+                    ).fetchall()
+                    payload = zlib.compress(json.dumps([tuple(r) for r in rows], ensure_ascii=False).encode("utf-8"))
+                    cold.execute(
+                        "INSERT OR REPLACE INTO cold_messages(conversation_uuid, user_id, message_count, payload, moved_at) "
+                        "VALUES(?,?,?,?,?)",
+                        (c["uuid"], c["user_id"], len(rows), payload, _now_ms()),
+                    )
+                    conn.execute("DELETE FROM messages WHERE conversation_seq=?", (c["seq"],))
+                    conn.execute("UPDATE conversations SET cold=1 WHERE seq=?", (c["seq"],))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                moved += 1
+                messages += len(rows)
+        finally:
+            cold.close()
+        freed = self._incremental_vacuum(conn) if moved else 0
+        logger.info("Moved %d conversations (%d messages) to cold storage, freed %d pages", moved, messages, freed)
+        return {"conversations": moved, "messages": messages, "freed_pages": freed}
+
+    def _incremental_vacuum(self, conn: sqlite3.Connection) -> int:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # a full VACUUM would lock the database for its whole duration; the one-time
+            # switch is left to the migration CLI
+            logger.warning(
+                "Skipping vacuum: incremental auto-vacuum is off for %s; run "
+                "`python -m backend.chat_store_migration %s --vacuum` once to enable it",
+                self.db_path, self.db_path,
             )
-            conn.execute(
-                "UPDATE conversations SET updated_at=? WHERE id=?",
-                (now, conversation_id),
+            return 0
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # the pragma frees one page per step; executescript steps it to completion
+        conn.executescript("PRAGMA incremental_vacuum;")
+        # the file only shrinks once the WAL is checkpointed
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        return free
+
+    def _restore(self, seq: int, conversation_id: str) -> None:
+        """Move a cold conversation's messages back into the hot tables."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            still_cold = conn.execute("SELECT cold FROM conversations WHERE seq=?", (seq,)).fetchone()
+            restored = self._restore_locked(conn, seq, conversation_id) if still_cold and still_cold["cold"] else None
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if restored:
+            self._drop_cold([restored])
+
+    def _restore_locked(self, conn: sqlite3.Connection, seq: int, conversation_id: str) -> str:
+        """Insert the cold payload of a conversation inside the caller's write transaction."""
+        cold = self._cold_connect()
+        try:
+            row = cold.execute(
+                "SELECT payload FROM cold_messages WHERE conversation_uuid=?", (conversation_id,)
+            ).fetchone()
+        finally:
+            cold.close()
+        if row is None:
+            logger.warning("Cold conversation %s has no stored messages", conversation_id)
+        else:
+            conn.executemany(
+                "INSERT OR IGNORE INTO messages(uuid, conversation_seq, role, content, created_at) VALUES(?,?,?,?,?)",
+                [(m, seq, role, content, ts) for m, role, content, ts in json.loads(zlib.decompress(row[0]))],
             )
-        return msg_id
-
-    def get_messages(self, user_id: str, conversation_id: str) -> List[Dict[str, Any]]:
+        conn.execute("UPDATE conversations SET cold=0 WHERE seq=?", (seq,))
+        return conversation_id
+
+    def _drop_cold(self, conversation_ids: List[str]) -> None:
+        # after the hot commit; a payload left by a crash here is replaced when the conversation moves again
+        cold = self._cold_connect()
+        try:
+            cold.executemany("DELETE FROM cold_messages WHERE conversation_uuid=?", [(c,) for c in conversation_ids])
+        finally:
+            cold.close()
+
+    # Summaries
+    @traced("chat_store.get_summary")
+    def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Return the rolling summary of a conversation and how many messages it covers."""
         with self._connect() as conn:
             cur = conn.execute(
-                "SELECT id, role, content, created_at FROM messages WHERE conversation_id=? AND user_id=? ORDER BY created_at ASC",
-                (conversation_id, user_id),
+                "SELECT s.summary, s.message_count, s.updated_at FROM conversation_summaries s "
+                "JOIN conversations c ON c.seq = s.conversation_seq WHERE c.uuid=?",
+                (conversation_id,),
             )
-            rows = [dict(row) for row in cur.fetchall()]
-        return rows
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return {"summary": row["summary"], "message_count": row["message_count"], "updated_at": _ms_to_iso(row["updated_at"])}
 
+    @traced("chat_store.set_summary")
+    def set_summary(self, conversation_id: str, summary: str, message_count: int) -> None:
+        """Store the rolling summary covering the first `message_count` messages."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO conversation_summaries(conversation_seq, summary, message_count, updated_at) "
+                "SELECT seq, ?, ?, ? FROM conversations WHERE uuid=? "
+                "ON CONFLICT(conversation_seq) DO UPDATE SET summary=excluded.summary, "
+                "message_count=excluded.message_count, updated_at=excluded.updated_at",
+                (summary, message_count, _now_ms(), conversation_id),
+            )
+
+    @traced("chat_store.ensure_conversation")
     def ensure_conversation(self, user_id: str, conversation_id: Optional[str]) -> str:
         """Return a valid conversation id; create if missing/invalid."""
         if conversation_id:
@@ -153,11 +716,12 @@ class ChatStore:
         Args:
             max_content_len: Maximum characters of message content to display.
         """
+        self.flush()
         with self._connect() as conn:
             # Fetch conversations and messages in two queries for speed.
             conv_rows = conn.execute(
                 """
-                SELECT id, user_id, title, created_at, updated_at, archived
+                SELECT seq, uuid, user_id, title, created_at, updated_at, archived
                 FROM conversations
                 ORDER BY updated_at DESC
                 """
@@ -165,25 +729,25 @@ class ChatStore:
 
             msg_rows = conn.execute(
                 """
-                SELECT id, conversation_id, user_id, role, content, created_at
+                SELECT conversation_seq, role, content, created_at
                 FROM messages
-                ORDER BY created_at ASC
+                ORDER BY seq ASC
                 """
             ).fetchall()
 
-        # Group messages by conversation id
-        messages_by_conv: Dict[str, List[sqlite3.Row]] = {}
+        # Group messages by conversation
+        messages_by_conv: Dict[int, List[sqlite3.Row]] = {}
         for r in msg_rows:
-            messages_by_conv.setdefault(r["conversation_id"], []).append(r)
+            messages_by_conv.setdefault(r["conversation_seq"], []).append(r)
 
         print("=== ChatStore Debug Dump ===")
         print(f"Conversations: {len(conv_rows)}")
         for idx, conv in enumerate(conv_rows, start=1):
-            conv_id = conv["id"]
+            conv_id = conv["uuid"]
             user = conv["user_id"]
             archived = int(conv["archived"]) if conv["archived"] is not None else 0
-            created = conv["created_at"]
-            updated = conv["updated_at"]
+            created = _ms_to_iso(conv["created_at"])
+            updated = _ms_to_iso(conv["updated_at"])
 
             print(
                 f"\n[{idx}] Conversation {conv_id} | user={user} | archived={archived}\n"
@@ -192,94 +756,211 @@ class ChatStore:
                 f"    updated_at={updated}"
             )
 
-            msgs = messages_by_conv.get(conv_id, [])
+            msgs = messages_by_conv.get(conv["seq"], [])
             print(f"    messages ({len(msgs)}):")
             for m in msgs:
-                ts = m["created_at"]
+                ts = _ms_to_iso(m["created_at"])
                 role = m["role"]
-                m_user = m["user_id"]
+                m_user = user
                 content = m["content"] or ""
                 if max_content_len and len(content) > max_content_len:
                     content = content[: max_content_len - 1] + "…"
                 print(f"      - [{ts}] {role}@{m_user}: {content}")
 
-    def export_csv(
+    @traced("chat_store.export")
+    def export(
         self,
         out_path: Optional[str] = None,
+        fmt: str = "csv",
         include_archived: bool = True,
+        since: Optional[Any] = None,
+        compression: Optional[str] = None,
         max_content_len: Optional[int] = None,
+        batch_size: int = 1000,
     ) -> str:
-        """Export conversations and messages to a single CSV file.
+        """Stream conversations and messages to a CSV, JSONL or Parquet file.
 
-        Each row contains conversation metadata and a message (if any).
-        Conversations without messages are still included with empty message fields.
+        Rows are read from the cursor `batch_size` at a time and written as they
+        arrive, so memory stays bounded whatever the size of the history. Each
+        row holds conversation metadata and one message; conversations without
+        messages get one row with empty message fields. Messages of cold
+        conversations are read from the cold database (except with `since`,
+        which only looks at hot messages). Conversations come in creation order
+        and their messages chronologically, which follows the indexes and needs
+        no sort.
 
         Args:
-            out_path: Destination CSV path. Defaults to chat_data/chat_export.csv
+            out_path: Destination path. Defaults to chat_data/chat_export.<fmt>[.<compression>].
+            fmt: "csv", "jsonl" or "parquet" (requires pyarrow).
             include_archived: Whether to include archived conversations.
+            since: Incremental export; only messages created after this ISO-8601
+                timestamp, datetime or epoch-ms value (conversations without new
+                messages are left out).
+            compression: "gzip", "bz2" or "xz" for CSV/JSONL; a Parquet codec
+                such as "zstd" or "snappy" for Parquet.
             max_content_len: If provided, truncate message content to this length.
+            batch_size: Rows fetched per `fetchmany`.
 
         Returns:
-            The path to the written CSV file.
+            The path to the written file.
         """
+        if fmt not in ("csv", "jsonl", "parquet"):
+            raise ValueError(f"Unsupported export format: {fmt}")
+        if fmt != "parquet" and compression not in (None,) + tuple(_COMPRESSORS):
+            raise ValueError(f"Unsupported compression for {fmt}: {compression}")
+        self.flush()
         if out_path is None:
-            out_dir = os.path.dirname(self.db_path) or "."
-            out_path = os.path.join(out_dir, "chat_export.csv")
+            suffix = _COMPRESSED_SUFFIX[compression] if compression and fmt != "parquet" else ""
+            out_path = os.path.join(os.path.dirname(self.db_path) or ".", f"chat_export.{fmt}{suffix}")
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
 
         query = (
-            "SELECT c.id AS conv_id, c.user_id AS conv_user_id, c.title AS conv_title, "
+            "SELECT c.uuid AS conv_id, c.user_id AS conv_user_id, c.title AS conv_title, "
             "c.created_at AS conv_created_at, c.updated_at AS conv_updated_at, c.archived AS conv_archived, "
-            "m.id AS msg_id, m.user_id AS msg_user_id, m.role AS msg_role, m.content AS msg_content, m.created_at AS msg_created_at "
-            "FROM conversations c LEFT JOIN messages m ON m.conversation_id = c.id "
+            "m.uuid AS msg_id, c.user_id AS msg_user_id, m.role AS msg_role, m.content AS msg_content, m.created_at AS msg_created_at, "
+            "c.cold AS conv_cold "
         )
-        params: tuple = ()
-        if include_archived:
-            query += "ORDER BY c.updated_at DESC, m.created_at ASC"
+        where, params = [], []
+        if since is None:
+            query += "FROM conversations c LEFT JOIN messages m ON m.conversation_seq = c.seq "
+            order = "ORDER BY c.seq, m.seq"
         else:
-            query += "WHERE c.archived = 0 ORDER BY c.updated_at DESC, m.created_at ASC"
-
-        with self._connect() as conn:
-            rows = conn.execute(query, params).fetchall()
+            query += "FROM messages m JOIN conversations c ON c.seq = m.conversation_seq "
+            where.append("m.created_at > ?")
+            params.append(_to_ms(since))
+            order = "ORDER BY m.seq"
+        if not include_archived:
+            where.append("c.archived = 0")
+        if where:
+            query += "WHERE " + " AND ".join(where) + " "
+        query += order
+
+        def cold_rows(row, cold):
+            # a cold conversation comes out of the LEFT JOIN as one row without a message
+            payload = cold.execute(
+                "SELECT payload FROM cold_messages WHERE conversation_uuid=?", (row["conv_id"],)
+            ).fetchone()
+            if payload is None:
+                return [row]
+            return [
+                dict(row, msg_id=m, msg_role=role, msg_content=content, msg_created_at=ts)
+                for m, role, content, ts in json.loads(zlib.decompress(payload[0]))
+            ] or [row]
+
+        def batches(iso: bool):
+            cur = self._connect().execute(query, params)
+            conv_iso = (None, None, None)
+            cold = None
+            try:
+                while True:
+                    fetched = cur.fetchmany(batch_size)
+                    if not fetched:
+                        return
+                    out = []
+                    for r in fetched:
+                        row = dict(r)
+                        if row.pop("conv_cold") and row["msg_id"] is None:
+                            cold = cold or self._cold_connect()
+                            rows = cold_rows(row, cold)
+                        else:
+                            rows = [row]
+                        for row in rows:
+                            content = row["msg_content"]
+                            if content is not None and max_content_len is not None and max_content_len >= 0:
+                                row["msg_content"] = content[:max_content_len]
+                            if iso:
+                                # rows of one conversation are consecutive; convert its timestamps once
+                                if conv_iso[0] != row["conv_id"]:
+                                    conv_iso = (row["conv_id"], _ms_to_iso(row["conv_created_at"]), _ms_to_iso(row["conv_updated_at"]))
+                                row["conv_created_at"], row["conv_updated_at"] = conv_iso[1], conv_iso[2]
+                                row["msg_created_at"] = _ms_to_iso(row["msg_created_at"])
+                            out.append(row)
+                    yield out
+            finally:
+                if cold is not None:
+                    cold.close()
+
+        if fmt == "parquet":
+            _write_parquet(out_path, batches(iso=False), compression)
+        else:
+            opener = _COMPRESSORS[compression] if compression else open
+            with opener(out_path, "wt", newline="", encoding="utf-8") as f:
+                if fmt == "csv":
+                    writer = csv.writer(f)
+                    writer.writerow(EXPORT_FIELDS)
+                    for rows in batches(iso=True):
+                        writer.writerows([row[k] for k in EXPORT_FIELDS] for row in rows)
+                else:
+                    for rows in batches(iso=True):
+                        f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+        return out_path
 
-        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
-        fieldnames = [
-            "conv_id",
-            "conv_user_id",
-            "conv_title",
-            "conv_created_at",
-            "conv_updated_at",
-            "conv_archived",
-            "msg_id",
-            "msg_user_id",
-            "msg_role",
-            "msg_content",
-            "msg_created_at",
-        ]
+    @traced("chat_store.export_csv")
+    def export_csv(
+        self,
+        out_path: Optional[str] = None,
+        include_archived: bool = True,
+        max_content_len: Optional[int] = None,
+    ) -> str:
+        """Export conversations and messages to a single CSV file (see `export`).
 
-        with open(out_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for r in rows:
-                content = r["msg_content"] if r["msg_content"] is not None else ""
-                if max_content_len is not None and max_content_len >= 0 and len(content) > max_content_len:
-                    content = content[: max_content_len]
-                writer.writerow(
-                    {
-                        "conv_id": r["conv_id"],
-                        "conv_user_id": r["conv_user_id"],
-                        "conv_title": r["conv_title"],
-                        "conv_created_at": r["conv_created_at"],
-                        "conv_updated_at": r["conv_updated_at"],
-                        "conv_archived": r["conv_archived"],
-                        "msg_id": r["msg_id"],
-                        "msg_user_id": r["msg_user_id"],
-                        "msg_role": r["msg_role"],
-                        "msg_content": content,
-                        "msg_created_at": r["msg_created_at"],
-                    }
-                )
+        Args:
+            out_path: Destination CSV path. Defaults to chat_data/chat_export.csv
+            include_archived: Whether to include archived conversations.
+            max_content_len: If provided, truncate message content to this length.
 
-        return out_path
+        Returns:
+            The path to the written CSV file.
+        """
+        return self.export(out_path, "csv", include_archived=include_archived, max_content_len=max_content_len)
+
+
+EXPORT_FIELDS = [
+    "conv_id",
+    "conv_user_id",
+    "conv_title",
+    "conv_created_at",
+    "conv_updated_at",
+    "conv_archived",
+    "msg_id",
+    "msg_user_id",
+    "msg_role",
+    "msg_content",
+    "msg_created_at",
+]
+
+_TIMESTAMP_FIELDS = ("conv_created_at", "conv_updated_at", "msg_created_at")
+
+_COMPRESSORS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+_COMPRESSED_SUFFIX = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+
+def _to_ms(value: Any) -> int:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    if isinstance(value, str):
+        return _to_ms(datetime.fromisoformat(value))
+    return int(value)
+
+
+def _write_parquet(out_path: str, batches, compression: Optional[str]) -> None:
+    """Write export batches as row groups of one Parquet file, timestamps as UTC milliseconds."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)") from e
+
+    timestamp = pa.timestamp("ms", tz="UTC")
+    schema = pa.schema(
+        [(f, timestamp) if f in _TIMESTAMP_FIELDS else (f, pa.int64()) if f == "conv_archived" else (f, pa.string())
+         for f in EXPORT_FIELDS]
+    )
+    with pq.ParquetWriter(out_path, schema, compression=compression or "snappy") as writer:
+        for rows in batches:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
 
 if __name__ == "__main__":
     store = ChatStore()
\ No newline at end of file
@@ -0,0 +1,467 @@
+'''
+Schema management for the chat database.
+
+Schema version 2 stores integer epoch-ms timestamps and orders rows by an
+INTEGER rowid (`seq`); UUIDs remain as a unique secondary column so the public
+ids do not change. Version 1 databases (TEXT UUID keys, ISO-8601 timestamps)
+are migrated online: rows are copied into staging tables in small
+transactions while the old tables stay in use, then a short final
+transaction copies what changed meanwhile and swaps the tables.
+
+Schema version 3 adds `messages_fts`, an FTS5 index over message content and
+the owning user, kept in sync with `messages` by triggers.
+
+Schema version 4 adds `conversations.cold`, set while a conversation's messages
+live in the cold database (see `create_cold_schema`) instead of `messages`.
+
+Usage (migrate a database and print a before/after size and latency report):
+    python -m backend.chat_store_migration chat_data/chat.db --vacuum
+
+`--vacuum` also switches the database to incremental auto-vacuum, which the
+chat store's retention job needs to return freed pages. That takes one full
+VACUUM, so it is done here rather than by the running app.
+'''
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import json
+import random
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional
+
+from utils.logging_config import configure_logging_from_env, get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA_VERSION = 4
+
+# ISO-8601 TEXT (with offset) to integer epoch milliseconds, evaluated by SQLite
+_ISO_TO_MS = "CAST(ROUND((julianday({}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def _tables(suffix: str = "") -> List[str]:
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS conversations{suffix} (
+            seq INTEGER PRIMARY KEY,
+            uuid TEXT NOT NULL UNIQUE,
+            user_id TEXT NOT NULL,
+            title TEXT,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            archived INTEGER NOT NULL DEFAULT 0,
+            cold INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS messages{suffix} (
+            seq INTEGER PRIMARY KEY,
+            uuid TEXT NOT NULL UNIQUE,
+            conversation_seq INTEGER NOT NULL REFERENCES conversations{suffix}(seq),
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS conversation_summaries{suffix} (
+            conversation_seq INTEGER PRIMARY KEY REFERENCES conversations{suffix}(seq),
+            summary TEXT NOT NULL,
+            message_count INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+        """,
+    ]
+
+
+_INDEXES = [
+    # covers list_conversations (filter, keyset order and every selected column)
+    """
+    CREATE INDEX IF NOT EXISTS idx_conversations_user_list
+    ON conversations(user_id, archived, updated_at, seq, uuid, title, created_at)
+    """,
+    # entries are (conversation_seq, rowid), i.e. messages of a conversation in insertion order
+    """
+    CREATE INDEX IF NOT EXISTS idx_messages_conversation
+    ON messages(conversation_seq)
+    """,
+]
+
+
+# Full-text index over message content. It stores no text of its own (external
+# content read through the view); `owner` is indexed so a search is restricted
+# to one user's messages inside the index rather than after ranking everyone's.
+_SEARCH = [
+    """
+    CREATE VIEW IF NOT EXISTS messages_search_source AS
+    SELECT m.seq AS seq, m.content AS content, c.user_id AS owner
+    FROM messages m JOIN conversations c ON c.seq = m.conversation_seq
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, owner,
+        content='messages_search_source', content_rowid='seq',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, owner)
+        SELECT new.seq, new.content, user_id FROM conversations WHERE seq = new.conversation_seq;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, owner)
+        SELECT 'delete', old.seq, old.content, user_id FROM conversations WHERE seq = old.conversation_seq;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, owner)
+        SELECT 'delete', old.seq, old.content, user_id FROM conversations WHERE seq = old.conversation_seq;
+        INSERT INTO messages_fts(rowid, content, owner)
+        SELECT new.seq, new.content, user_id FROM conversations WHERE seq = new.conversation_seq;
+    END
+    """,
+]
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (name,)).fetchone() is not None
+
+
+def _create_core(conn: sqlite3.Connection) -> None:
+    for ddl in _tables() + _INDEXES:
+        conn.execute(ddl)
+
+
+def _create_search(conn: sqlite3.Connection) -> None:
+    """Add the full-text index and index the existing messages in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not _has_table(conn, "messages_fts"):
+            for ddl in _SEARCH:
+                conn.execute(ddl)
+            conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    """Create the current schema (idempotent)."""
+    _create_core(conn)
+    if "cold" not in {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}:
+        conn.execute("ALTER TABLE conversations ADD COLUMN cold INTEGER NOT NULL DEFAULT 0")
+    if not _has_table(conn, "messages_fts"):
+        _create_search(conn)
+    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+
+def create_cold_schema(conn: sqlite3.Connection) -> None:
+    """Create the cold-tier schema: one zlib-compressed JSON payload of messages per conversation."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cold_messages (
+            conversation_uuid TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            message_count INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            moved_at INTEGER NOT NULL
+        )
+        """
+    )
+
+
+def _is_legacy(conn: sqlite3.Connection) -> bool:
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+    return bool(columns) and "uuid" not in columns
+
+
+def _copy_conversations(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"""
+        INSERT OR IGNORE INTO conversations_v2(seq, uuid, user_id, title, created_at, updated_at, archived)
+        SELECT rowid, id, user_id, title, {_ISO_TO_MS.format('created_at')}, {_ISO_TO_MS.format('updated_at')}, archived
+        FROM conversations
+        WHERE rowid > (SELECT COALESCE(MAX(seq), 0) FROM conversations_v2)
+        """
+    )
+
+
+def _copy_messages(conn: sqlite3.Connection, limit: int) -> int:
+    cur = conn.execute(
+        f"""
+        INSERT INTO messages_v2(seq, uuid, conversation_seq, role, content, created_at)
+        SELECT m.rowid, m.id, c.seq, m.role, m.content, {_ISO_TO_MS.format('m.created_at')}
+        FROM messages m JOIN conversations_v2 c ON c.uuid = m.conversation_id
+        WHERE m.rowid > (SELECT COALESCE(MAX(seq), 0) FROM messages_v2)
+        ORDER BY m.rowid
+        LIMIT ?
+        """,
+        (limit,),
+    )
+    return cur.rowcount
+
+
+def migrate(
+    conn: sqlite3.Connection,
+    batch_size: int = 5000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> bool:
+    """Bring a chat database to the current schema.
+
+    A legacy (version 1) database is migrated online: messages are copied in
+    `batch_size` transactions, so other connections keep reading and writing
+    the old tables meanwhile, and an interrupted migration resumes where it
+    stopped. The final transaction copies rows added since, refreshes
+    conversation fields that may have changed, and swaps the tables.
+
+    Args:
+        conn: Autocommit connection to the database.
+        batch_size: Messages copied per transaction.
+        progress: Optional callback receiving the number of messages copied so far.
+
+    Returns:
+        True if a legacy database was migrated.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return False
+    if not _is_legacy(conn):
+        create_schema(conn)
+        return False
+
+    logger.info("Migrating chat database to schema version %d", SCHEMA_VERSION)
+    for ddl in _tables("_v2"):
+        conn.execute(ddl)
+    copied = conn.execute("SELECT COUNT(*) FROM messages_v2").fetchone()[0]
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _copy_conversations(conn)
+            n = _copy_messages(conn, batch_size)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        copied += n
+        if progress is not None:
+            progress(copied)
+        if n < batch_size:
+            break
+
+    has_summaries = _has_table(conn, "conversation_summaries")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _copy_conversations(conn)
+        while _copy_messages(conn, batch_size) == batch_size:
+            pass
+        conn.execute(
+            f"""
+            UPDATE conversations_v2 SET (title, updated_at, archived) = (
+                SELECT c.title, {_ISO_TO_MS.format('c.updated_at')}, c.archived
+                FROM conversations c WHERE c.id = conversations_v2.uuid
+            )
+            """
+        )
+        if has_summaries:
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO conversation_summaries_v2(conversation_seq, summary, message_count, updated_at)
+                SELECT c.seq, s.summary, s.message_count, {_ISO_TO_MS.format('s.updated_at')}
+                FROM conversation_summaries s JOIN conversations_v2 c ON c.uuid = s.conversation_id
+                """
+            )
+            conn.execute("DROP TABLE conversation_summaries")
+        conn.execute("DROP TABLE messages")
+        conn.execute("DROP TABLE conversations")
+        conn.execute("ALTER TABLE conversations_v2 RENAME TO conversations")
+        conn.execute("ALTER TABLE messages_v2 RENAME TO messages")
+        conn.execute("ALTER TABLE conversation_summaries_v2 RENAME TO conversation_summaries")
+        _create_core(conn)
+        conn.execute("PRAGMA user_version=2")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    # indexing the messages for search holds the write lock, so it gets its own transaction
+    create_schema(conn)
+    logger.info("Chat database migrated (%d messages)", copied)
+    return True
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    if not samples:
+        return {"p50_ms": 0.0, "p95_ms": 0.0}
+    return {
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+    }
+
+
+def _time(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return _percentiles(samples)
+
+
+def storage_stats(db_path: str) -> Dict[str, object]:
+    """File size, page usage and (when the dbstat table is available) bytes per table/index."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        messages = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        try:
+            objects = {name: size for name, size in conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")}
+        except sqlite3.OperationalError:
+            objects = None
+    finally:
+        conn.close()
+    used = (pages - free) * page_size
+    return {
+        "file_bytes": os.path.getsize(db_path),
+        "used_bytes": used,
+        "free_bytes": free * page_size,
+        "messages": messages,
+        "bytes_per_message": used / messages if messages else 0.0,
+        "objects": objects,
+    }
+
+
+def _sample(db_path: str, n: int, id_column: str = "id") -> List[tuple]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            f"SELECT {id_column}, user_id FROM conversations ORDER BY random() LIMIT ?", (n,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+# Hot queries of the chat UI, as each schema version runs them; parameters are
+# (conversation id, user id) of a sampled conversation, or (user id,) for listing.
+LEGACY_QUERIES = {
+    "get_conversation": (
+        "SELECT id, title, created_at, updated_at, archived FROM conversations WHERE id=? AND user_id=?", False
+    ),
+    "list_conversations": (
+        "SELECT id, title, created_at, updated_at, archived FROM conversations WHERE user_id=? AND archived=0 "
+        "ORDER BY updated_at DESC LIMIT 20", True
+    ),
+    "get_messages_page": (
+        "SELECT id, role, content, created_at FROM messages WHERE conversation_id=? AND user_id=? "
+        "ORDER BY created_at DESC LIMIT 20", False
+    ),
+    "get_messages_all": (
+        "SELECT id, role, content, created_at FROM messages WHERE conversation_id=? AND user_id=? "
+        "ORDER BY created_at ASC", False
+    ),
+}
+
+CURRENT_QUERIES = {
+    "get_conversation": (
+        "SELECT uuid, title, created_at, updated_at, archived FROM conversations WHERE uuid=? AND user_id=?", False
+    ),
+    "list_conversations": (
+        "SELECT uuid, title, created_at, updated_at, archived FROM conversations WHERE user_id=? AND archived=0 "
+        "ORDER BY updated_at DESC, seq DESC LIMIT 20", True
+    ),
+    "get_messages_page": (
+        "SELECT m.uuid, m.role, m.content, m.created_at FROM messages m "
+        "JOIN conversations c ON c.seq = m.conversation_seq WHERE c.uuid=? AND c.user_id=? "
+        "ORDER BY m.seq DESC LIMIT 20", False
+    ),
+    "get_messages_all": (
+        "SELECT m.uuid, m.role, m.content, m.created_at FROM messages m "
+        "JOIN conversations c ON c.seq = m.conversation_seq WHERE c.uuid=? AND c.user_id=? "
+        "ORDER BY m.seq ASC", False
+    ),
+}
+
+
+def query_latency(db_path: str, queries: Dict[str, tuple], sample: List[tuple], repeat: int = 50) -> Dict[str, Dict[str, float]]:
+    """p50/p95 latency of each hot query over randomly picked sampled conversations."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        result = {}
+        for name, (sql, by_user) in queries.items():
+            def run():
+                cid, uid = random.choice(sample)
+                return [dict(r) for r in conn.execute(sql, (uid,) if by_user else (cid, uid)).fetchall()]
+            result[name] = _time(run, repeat)
+        return result
+    finally:
+        conn.close()
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> None:
+    """Switch a database to incremental auto-vacuum; rewrites the whole file with a VACUUM."""
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Migrate a chat database to the current schema and report the effect.")
+    parser.add_argument("db_path", help="Path to chat.db")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Messages copied per transaction")
+    parser.add_argument(
+        "--vacuum", action="store_true",
+        help="VACUUM after migrating so freed pages are returned, and enable incremental auto-vacuum",
+    )
+    parser.add_argument("--repeat", type=int, default=50, help="Timed runs per query")
+    args = parser.parse_args(argv)
+
+    configure_logging_from_env()
+    conn = sqlite3.connect(args.db_path, isolation_level=None)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        switched = args.vacuum and conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        if switched:
+            enable_incremental_vacuum(conn)
+        conn.close()
+        print(json.dumps({
+            "migrated": False, "reason": "already at the current schema", "incremental_vacuum_enabled": switched,
+        }))
+        return 0
+    legacy = _is_legacy(conn)
+    conn.close()
+
+    # version 2 and later databases only gain tables and columns, so they run the current queries throughout
+    sample = _sample(args.db_path, 20, "id" if legacy else "uuid") if legacy or version >= 2 else []
+    report = {"from_version": version, "before": {"storage": storage_stats(args.db_path)}}
+    if sample:
+        before_queries = LEGACY_QUERIES if legacy else CURRENT_QUERIES
+        report["before"]["latency"] = query_latency(args.db_path, before_queries, sample, args.repeat)
+
+    conn = sqlite3.connect(args.db_path, isolation_level=None)
+    t0 = time.perf_counter()
+    migrate(conn, batch_size=args.batch_size)
+    report["migration_s"] = time.perf_counter() - t0
+    if args.vacuum:
+        enable_incremental_vacuum(conn)
+    conn.close()
+
+    report["after"] = {"storage": storage_stats(args.db_path)}
+    if sample:
+        report["after"]["latency"] = query_latency(args.db_path, CURRENT_QUERIES, sample, args.repeat)
+    report["migrated"] = True
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
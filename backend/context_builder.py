@@ -0,0 +1,202 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import re
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Any, Optional
+
+from llm.tokenizer import TokenCounter
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\S+")
+
+
+class ContextBuilder:
+    """Split sources into passages and pack the most relevant ones into a token budget.
+
+    Sources are dicts with at least a `content` field (optionally `title`, `url`
+    and `score`, as returned by `WebSearch.search`). Passages are scored with the
+    reranker if given, otherwise with embedding similarity, otherwise with the
+    source's own score. Packing is greedy by score with ties broken by source and
+    passage position, so the same inputs always produce the same prompt.
+    """
+
+    def __init__(
+        self,
+        token_counter: Optional[TokenCounter] = None,
+        reranker=None,
+        embedding_model=None,
+        max_passage_tokens: int = 200,
+    ):
+        self.token_counter = token_counter or TokenCounter()
+        self.reranker = reranker
+        self.embedding_model = embedding_model
+        self.max_passage_tokens = max_passage_tokens
+
+    def split(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Split every source into passages of at most `max_passage_tokens` tokens.
+
+        Paragraphs are kept whole when they fit, otherwise they are split on
+        sentence boundaries, and sentences that are still too long on words.
+        Exact duplicate passages (common across query reformulations) are dropped.
+        """
+        passages = []
+        seen = set()
+        for source_idx, source in enumerate(sources):
+            content = source.get("content") or ""
+            for text in self._split_text(content):
+                if text in seen:
+                    continue
+                seen.add(text)
+                passages.append(
+                    {
+                        "text": text,
+                        "source_idx": source_idx,
+                        "position": len(passages),
+                        "score": 0.0,
+                    }
+                )
+        return passages
+
+    def _split_text(self, content: str) -> List[str]:
+        count = self.token_counter.count
+        limit = self.max_passage_tokens
+        pieces = []
+        for paragraph in content.split("\n\n"):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if count(paragraph) <= limit:
+                pieces.append(paragraph)
+                continue
+            current = ""
+            for sentence in _SENTENCE_END.split(paragraph):
+                for unit in self._split_words(sentence) if count(sentence) > limit else [sentence]:
+                    candidate = f"{current} {unit}".strip()
+                    if current and count(candidate) > limit:
+                        pieces.append(current)
+                        current = unit
+                    else:
+                        current = candidate
+            if current:
+                pieces.append(current)
+        return pieces
+
+    def _split_words(self, sentence: str) -> List[str]:
+        # tokenize once; the tokens of a run of words are those overlapping its character span
+        spans = self.token_counter.offsets(sentence)
+        starts = [s for s, _ in spans]
+        ends = [e for _, e in spans]
+        words = list(_WORD.finditer(sentence))
+        units = []
+        first = 0
+        for i in range(1, len(words)):
+            n_tokens = bisect_left(starts, words[i].end()) - bisect_right(ends, words[first].start())
+            if n_tokens > self.max_passage_tokens:
+                units.append(" ".join(w.group() for w in words[first:i]))
+                first = i
+        if words:
+            units.append(" ".join(w.group() for w in words[first:]))
+        return units
+
+    def score(self, query: str, passages: List[Dict[str, Any]], sources: List[Dict[str, Any]]) -> None:
+        """Fill in the `score` field of each passage (higher is more relevant)."""
+        if not passages:
+            return
+        texts = [p["text"] for p in passages]
+        if self.reranker is not None:
+            scores = self.reranker.rerank(query, texts)
+        elif self.embedding_model is not None:
+            import numpy as np
+
+            q = np.asarray(self.embedding_model.encode(query, "search_query"), dtype=np.float32).reshape(-1)
+            docs = np.asarray(self.embedding_model.encode_batch(texts, "search_document"), dtype=np.float32)
+            norms = np.linalg.norm(docs, axis=1) * (np.linalg.norm(q) or 1.0)
+            scores = (docs @ q / np.where(norms == 0, 1.0, norms)).tolist()
+        else:
+            scores = [float(sources[p["source_idx"]].get("score") or 0.0) for p in passages]
+        for passage, s in zip(passages, scores):
+            passage["score"] = float(s)
+
+    def build(
+        self,
+        query: str,
+        sources: List[Dict[str, Any]],
+        budget_tokens: int = 2048,
+    ) -> Dict[str, Any]:
+        """Build a prompt context of at most `budget_tokens` tokens.
+
+        Args:
+            query: The user query the passages are scored against.
+            sources: Source dicts with `content` and optional `title`, `url`, `score`.
+            budget_tokens: Maximum size of the returned context, in target-model tokens.
+
+        Returns:
+            Dict with the rendered `context`, its `tokens` count, the packed
+            `passages` and the cited `sources` ({"id", "title", "url"}). The
+            context ends with a numbered source list so answers can cite [n].
+        """
+        passages = self.split(sources)
+        self.score(query, passages, sources)
+        ranked = sorted(passages, key=lambda p: (-p["score"], p["source_idx"], p["position"]))
+
+        count = self.token_counter.count
+        selected = []
+        used = 0
+        for passage in ranked:
+            cost = count(self._render_passage(passage, passage["source_idx"] + 1)) + 1
+            if used + cost > budget_tokens:
+                continue
+            selected.append(passage)
+            used += cost
+
+        # Token counts are not strictly additive, so verify the final render.
+        while True:
+            context, cited = self._render(selected, sources)
+            tokens = count(context)
+            if tokens <= budget_tokens or not selected:
+                break
+            selected.remove(min(selected, key=lambda p: (p["score"], -p["source_idx"], -p["position"])))
+
+        logger.debug(
+            "Packed %d/%d passages from %d sources into %d/%d tokens",
+            len(selected), len(passages), len(cited), tokens, budget_tokens,
+        )
+        return {"context": context, "tokens": tokens, "passages": selected, "sources": cited}
+
+    def _render(self, selected: List[Dict[str, Any]], sources: List[Dict[str, Any]]):
+        # number sources by first appearance and keep passages in reading order
+        ordered = sorted(selected, key=lambda p: (p["source_idx"], p["position"]))
+        ids: Dict[int, int] = {}
+        cited = []
+        lines = []
+        for passage in ordered:
+            idx = passage["source_idx"]
+            if idx not in ids:
+                ids[idx] = len(ids) + 1
+                cited.append(
+                    {
+                        "id": ids[idx],
+                        "title": sources[idx].get("title") or "",
+                        "url": sources[idx].get("url") or "",
+                    }
+                )
+            lines.append(self._render_passage(passage, ids[idx]))
+        if not lines:
+            return "", cited
+        return "\n".join(lines) + "\n\nSources:\n" + self.format_sources(cited), cited
+
+    @staticmethod
+    def _render_passage(passage: Dict[str, Any], source_id: int) -> str:
+        return f"[{source_id}] {passage['text']}"
+
+    @staticmethod
+    def format_sources(sources: List[Dict[str, Any]]) -> str:
+        """Render the cited sources as a numbered reference list."""
+        return "\n".join(
+            f"[{s['id']}] {s['title']} {s['url']}".rstrip() for s in sources
+        )
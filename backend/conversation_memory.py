@@ -0,0 +1,173 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+from backend.chat_store import ChatStore
+from llm.tokenizer import TokenCounter
+from llm.scheduler import BACKGROUND, RequestCancelled
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class ConversationMemory:
+    """Bounded conversation history for multi-turn prompts.
+
+    Older turns are folded into a rolling LLM-generated summary stored in the
+    chat DB; only the most recent turns are sent verbatim, within a token budget.
+    When Ollama returns a token context for a conversation it is reused on the
+    next turn so the server does not re-encode the transcript, until it grows
+    past `max_context_tokens` and the prompt is rebuilt from the summary.
+    """
+
+    def __init__(
+        self,
+        store: ChatStore,
+        token_counter: Optional[TokenCounter] = None,
+        history_budget: int = 1024,
+        summary_budget: int = 256,
+        summary_step: int = 4,
+        recent_messages: int = 6,
+        max_context_tokens: int = 4096,
+        reuse_context: bool = True,
+        max_conversations: int = 256,
+    ):
+        self.store = store
+        self.token_counter = token_counter or TokenCounter()
+        self.history_budget = history_budget
+        self.summary_budget = summary_budget
+        self.summary_step = summary_step
+        self.recent_messages = recent_messages
+        self.max_context_tokens = max_context_tokens
+        self.reuse_context = reuse_context
+        self.max_conversations = max_conversations
+        # (conversation_id, model_id) -> (ollama context, message count it covers)
+        self._contexts: "OrderedDict[Tuple[str, str], Tuple[list, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prior(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        # the current question is appended to the store before answering
+        if messages and messages[-1]["role"] == "user":
+            return messages[:-1]
+        return messages
+
+    def build_history(
+        self,
+        user_id: str,
+        conversation_id: str,
+        messages: Optional[List[Dict[str, str]]] = None,
+    ) -> str:
+        """Render the summary plus as many recent turns as fit in `history_budget` tokens."""
+        if messages is None:
+            messages = self.store.get_messages(user_id, conversation_id)
+        prior = self._prior(messages)
+        count = self.token_counter.count
+        summary = self.store.get_summary(conversation_id)
+        covered = summary["message_count"] if summary else 0
+
+        parts = []
+        if summary and summary["summary"]:
+            text = self.token_counter.truncate(summary["summary"], self.summary_budget)
+            parts.append(f"CONVERSATION SUMMARY: {text}")
+        budget = self.history_budget - sum(count(p) for p in parts)
+
+        recent = []
+        for m in reversed(prior[covered:]):
+            line = f"{m['role'].upper()}: {m['content']}"
+            cost = count(line) + 1
+            if cost > budget:
+                if not recent and budget > 0:
+                    recent.append(self.token_counter.truncate(line, budget - 1))
+                break
+            recent.append(line)
+            budget -= cost
+        if recent:
+            parts.append("RECENT MESSAGES:\n" + "\n".join(reversed(recent)))
+        return "\n".join(parts)
+
+    def _remember(self, key: Tuple[str, str], context: list, message_count: int) -> None:
+        with self._lock:
+            self._contexts[key] = (context, message_count)
+            self._contexts.move_to_end(key)
+            while len(self._contexts) > self.max_conversations:
+                self._contexts.popitem(last=False)
+
+    def answer(self, qa, user_id: str, conversation_id: str, question: str, mode: str = "plain") -> str:
+        """Answer `question` in the context of the conversation.
+
+        Args:
+            qa: The QA instance to answer with.
+            user_id: Owner of the conversation.
+            conversation_id: Conversation the question belongs to.
+            question: The prompt to answer (may include retrieved context).
+            mode: Answer mode, forwarded to `QA.run` for cache scoping.
+
+        Returns:
+            The model's answer.
+        """
+        messages = self.store.get_messages(user_id, conversation_id)
+        prior = self._prior(messages)
+        if not prior:
+            return qa.run(question, mode=mode)
+
+        if self.reuse_context:
+            key = (conversation_id, qa.model.model_id)
+            with self._lock:
+                cached = self._contexts.get(key)
+            try:
+                if cached and cached[1] == len(prior) and len(cached[0]) <= self.max_context_tokens:
+                    response, context = qa.model.generate(question, context=cached[0])
+                else:
+                    history = self.build_history(user_id, conversation_id, messages)
+                    prompt = qa.model.history_template.format(history=history, question=question)
+                    response, context = qa.model.generate(prompt)
+                # the assistant reply is appended after this returns
+                self._remember(key, context, len(prior) + 2)
+                return response
+            except RequestCancelled:
+                raise
+            except Exception as e:
+                logger.warning("Ollama context reuse failed, falling back to history prompt: %s", e)
+
+        history = self.build_history(user_id, conversation_id, messages)
+        return qa.run(question, mode=mode, history=history)
+
+    def update_summary(self, qa, user_id: str, conversation_id: str, max_input_tokens: int = 2048) -> bool:
+        """Fold turns that left the recent window into the rolling summary.
+
+        The summary is only regenerated once at least `summary_step` new messages
+        have left the window, so the extra LLM call is amortized over several turns.
+
+        Returns:
+            True if the summary was updated.
+        """
+        messages = self.store.get_messages(user_id, conversation_id)
+        summary = self.store.get_summary(conversation_id)
+        covered = summary["message_count"] if summary else 0
+        target = len(messages) - self.recent_messages
+        if target - covered < self.summary_step:
+            return False
+
+        per_message = max(1, max_input_tokens // max(1, target - covered))
+        new_turns = "\n".join(
+            self.token_counter.truncate(f"{m['role']}: {m['content']}", per_message)
+            for m in messages[covered:target]
+        )
+        previous = summary["summary"] if summary else "(none)"
+        prompt = (
+            "You are maintaining a running summary of a chat conversation.\n"
+            "Update the summary with the new messages. Keep names, facts, decisions and open questions; "
+            "be concise and write plain prose.\n\n"
+            f"Current summary:\n{previous}\n\nNew messages:\n{new_turns}\n\nUpdated summary:"
+        )
+        text = (qa.run(prompt, mode="summary", priority=BACKGROUND) or "").strip()
+        if not text:
+            return False
+        self.store.set_summary(conversation_id, text, target)
+        logger.debug("Updated summary of %s to cover %d messages", conversation_id, target)
+        return True
@@ -0,0 +1,80 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+from typing import Any, Dict, Optional
+
+from backend.retriever import Retriever
+from backend.context_builder import ContextBuilder
+from llm.tokenizer import TokenCounter
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class DocumentQA:
+    """Retrieval-augmented prompts over the ingested documents.
+
+    Retrieves chunks with `Retriever` (embed, search, optional rerank, each
+    within its time budget), packs them into `context_budget` tokens with
+    `ContextBuilder` and renders the prompt the answering model streams from.
+    When nothing relevant is retrieved the query is passed through unchanged.
+    """
+
+    def __init__(
+        self,
+        retriever: Optional[Retriever] = None,
+        token_counter: Optional[TokenCounter] = None,
+        context_budget: int = 1536,
+        top_k: int = 8,
+        min_score: Optional[float] = None,
+    ):
+        """
+        Args:
+            retriever: Retriever to use (a default one is created lazily).
+            token_counter: Counts tokens for the answering model.
+            context_budget: Maximum tokens of retrieved context in the prompt.
+            top_k: Chunks handed to the context builder.
+            min_score: Optional minimum retrieval score for a chunk to be used.
+        """
+        self.retriever = retriever or Retriever()
+        self.context_builder = ContextBuilder(token_counter=token_counter)
+        self.context_budget = context_budget
+        self.top_k = top_k
+        self.min_score = min_score
+
+    def prepare(self, query: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Retrieve and pack context for `query`.
+
+        Args:
+            query: The user question.
+            user_id: User asking; their uploads are searched along with the shared
+                documents (only shared documents if None).
+
+        Returns:
+            Dict with the `prompt` to send to the LLM, the packed `context`, the
+            cited `sources` and `timings` (per-stage seconds and `degraded` stages).
+        """
+        timings: Dict[str, Any] = {}
+        sources = self.retriever.retrieve_sources(query, top_k=self.top_k, timings=timings, user_id=user_id)
+        if self.min_score is not None:
+            sources = [s for s in sources if s["score"] >= self.min_score]
+
+        t0 = time.perf_counter()
+        packed = self.context_builder.build(query, sources, budget_tokens=self.context_budget)
+        timings["pack_s"] = time.perf_counter() - t0
+        logger.info(
+            "Document retrieval: %d chunks, %d context tokens, timings %s",
+            len(sources), packed["tokens"], {k: round(v, 3) if isinstance(v, float) else v for k, v in timings.items()},
+        )
+
+        if not packed["context"]:
+            prompt = query
+        else:
+            prompt = (
+                f"Answer the question using the following excerpts from the user's documents. "
+                f"Cite excerpts as [n]; if they do not contain the answer, say so.\n\n"
+                f"Question: {query}\n\nDocument excerpts:\n{packed['context']}"
+            )
+        return {"prompt": prompt, "context": packed["context"], "sources": packed["sources"], "timings": timings}
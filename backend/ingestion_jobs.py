@@ -0,0 +1,182 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Any
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class IngestionJobStore:
+    """SQLite-backed status of document ingestion jobs.
+
+    Schema:
+      - ingestion_jobs(id TEXT PK, user_id TEXT, file_name TEXT, file_path TEXT, status TEXT,
+        chunks INT, error TEXT, created_at TEXT, started_at TEXT, finished_at TEXT, duration_s REAL)
+
+    Status is one of queued, running, done, failed.
+    """
+
+    def __init__(self, db_path: str = "chat_data/jobs.db") -> None:
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    chunks INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    duration_s REAL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status_created
+                ON ingestion_jobs(status, created_at)
+                """
+            )
+
+    def create_job(self, user_id: str, file_name: str, file_path: str) -> str:
+        job_id = str(uuid.uuid4())
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO ingestion_jobs(id, user_id, file_name, file_path, status, created_at) VALUES(?,?,?,?,'queued',?)",
+                (job_id, user_id, file_name, file_path, _utc_now_iso()),
+            )
+        return job_id
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically mark the oldest queued job as running and return it."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM ingestion_jobs WHERE status='queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE ingestion_jobs SET status='running', started_at=? WHERE id=?",
+                (_utc_now_iso(), row["id"]),
+            )
+            conn.execute("COMMIT")
+        return dict(row)
+
+    def update_progress(self, job_id: str, chunks: int) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE ingestion_jobs SET chunks=? WHERE id=?", (chunks, job_id))
+
+    def finish_job(self, job_id: str, chunks: int, duration_s: float, error: Optional[str] = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingestion_jobs SET status=?, chunks=?, error=?, finished_at=?, duration_s=? WHERE id=?",
+                ("failed" if error else "done", chunks, error, _utc_now_iso(), duration_s, job_id),
+            )
+
+    def requeue_running(self) -> int:
+        """Put jobs left running by a previous process back in the queue."""
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE ingestion_jobs SET status='queued', started_at=NULL WHERE status='running'")
+            return cur.rowcount
+
+    def list_jobs(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            cur = conn.execute(
+                "SELECT * FROM ingestion_jobs WHERE user_id=? ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit),
+            )
+            rows = [dict(row) for row in cur.fetchall()]
+        return rows
+
+
+class IngestionWorker:
+    """Background thread that ingests queued uploads one at a time.
+
+    The ingestion pipeline (and its embedding model) is created lazily on the
+    first job. Progress is written to the job store after every committed batch,
+    and committed chunks are immediately visible to new VectorStore readers.
+    Chunks are stored with the uploader's user id, so only that user retrieves them.
+    """
+
+    def __init__(self, jobs: IngestionJobStore, pipeline_factory=None, poll_interval: float = 2.0):
+        self.jobs = jobs
+        self._pipeline_factory = pipeline_factory
+        self._pipeline = None
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        requeued = self.jobs.requeue_running()
+        if requeued:
+            logger.info("Requeued %d interrupted ingestion jobs", requeued)
+        self._thread = threading.Thread(target=self._loop, name="ingestion-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id: str, file_name: str, file_path: str) -> str:
+        """Queue a file for ingestion and wake the worker."""
+        job_id = self.jobs.create_job(user_id, file_name, file_path)
+        self._wakeup.set()
+        return job_id
+
+    def _get_pipeline(self):
+        if self._pipeline is None:
+            if self._pipeline_factory is not None:
+                self._pipeline = self._pipeline_factory()
+            else:
+                from data_ingestion.ingestion_pipeline import IngestionPipeline
+
+                self._pipeline = IngestionPipeline()
+        return self._pipeline
+
+    def _loop(self) -> None:
+        while True:
+            job = self.jobs.claim_next()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        start = time.perf_counter()
+        chunks = 0
+
+        def progress(counts):
+            nonlocal chunks
+            chunks = counts["new"] + counts["duplicate"] + counts["unchanged"]
+            self.jobs.update_progress(job_id, chunks)
+
+        try:
+            logger.info("Ingesting %s (job %s)", job["file_name"], job_id)
+            self._get_pipeline().run(job["file_path"], progress=progress, user_id=job["user_id"])
+            self.jobs.finish_job(job_id, chunks, time.perf_counter() - start)
+        except Exception as e:
+            logger.error("Ingestion job %s failed: %s", job_id, e)
+            self.jobs.finish_job(job_id, chunks, time.perf_counter() - start, error=str(e))
@@ -3,23 +3,41 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from llm.llm import LLM
+from llm.scheduler import INTERACTIVE
 
 class QA:
 
-    def __init__(self, model_name: str = "llama3.1:8b", temperature: float = 0.1):
+    def __init__(self, model_name: str = "llama3.1:8b", temperature: float = 0.1, cache=None):
         """
         Initialize the QA class.
+
+        :param cache: Optional SemanticCache consulted before calling the LLM.
         """
         self.model = LLM(
             model_id=model_name, 
             temperature=temperature)
+        self.cache = cache
         
 
-    def run(self, query: str) -> str:
+    def run(self, query: str, mode: str = "plain", history: str = None, priority: int = INTERACTIVE, timeout: float = None) -> str:
         """
         Run the QA process.
+
+        :param mode: Answer mode ("plain", "web_search", "deep_research" or "documents"), used to scope the cache.
+            Internal prompts use their own modes ("title", "summary"), which the cache does not accept.
+        :param history: Optional rendered conversation history. Answers that depend on
+            history are never served from or written to the cache.
+        :param priority: LLM scheduler priority; use BACKGROUND for work nobody is waiting on.
+        :param timeout: Seconds before the LLM request is cancelled.
         """
-        response = self.model.chat(query)
+        use_cache = self.cache is not None and self.cache.accepts(mode) and not history
+        if use_cache:
+            cached = self.cache.lookup(query, self.model.model_id, self.model.temperature, mode)
+            if cached is not None:
+                return cached
+        response = self.model.chat(query, history=history, priority=priority, timeout=timeout)
+        if use_cache:
+            self.cache.store(query, response, self.model.model_id, self.model.temperature, mode)
         return response
     
     def test(self):
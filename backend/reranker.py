@@ -2,6 +2,8 @@
 import torch
 from typing import Optional
 
+from utils.tracing import current_span, traced
+
 
 class Reranker:
     """Lightweight reranker wrapper around a causal LM reranker checkpoint.
@@ -106,11 +108,13 @@ class Reranker:
         probs = torch.nn.functional.log_softmax(stacked, dim=1)[:, 1].exp().tolist()
         return probs
 
+    @traced("reranker.rerank")
     def rerank(self, query: str, documents: list[str], instruction: Optional[str] = None) -> list[float]:
         """Given a single query and a list of document strings, return a list of scores.
 
         Scores are floats in [0,1] where higher means more relevant.
         """
+        current_span().set(documents=len(documents))
         if not documents:
             return []
         self._ensure_model_loaded()
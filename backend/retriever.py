@@ -2,32 +2,228 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
 from data_ingestion.vector_store import VectorStore
 from data_ingestion.chunking_embedding import Embedder
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
 
 class Retriever:
-    
-    def __init__(self, vector_store: VectorStore, embedder: Embedder):
-        self.vector_store = vector_store
-        self.embedder = embedder
+    """Retrieve stored document chunks for a query.
+
+    Stages run against per-stage time budgets (seconds) so latency stays
+    predictable; a stage that cannot fit degrades instead of blocking:
+
+    - embed: query embeddings are LRU-cached; a failed embedding returns no results
+    - search: cosine search over the vector store, reloaded when ingestion wrote to it;
+      a failed reload or search returns no results
+    - rerank: optional; the candidate list is shrunk to what the reranker is expected
+      to score within its budget (from a running per-document cost estimate), but to
+      no fewer than 2 so the estimate keeps being refreshed; rerank is skipped when
+      earlier stages overran. The reranker model is loaded before its first timed call.
+
+    Which stages degraded is reported in the `timings` dict.
+
+    Chunks of uploaded documents carry their owner's user id (per occurrence, in
+    the metadata's `sources`); they are only returned to that user. Chunks with
+    an occurrence without an owner (documents ingested from the command line)
+    are shared.
+    """
 
-    def retrieve(self, query: str, top_k: int = 3) -> list:
+    def __init__(
+        self,
+        vector_store: Optional[VectorStore] = None,
+        embedder: Optional[Embedder] = None,
+        reranker=None,
+        candidates: int = 20,
+        query_cache_size: int = 256,
+        embed_budget: float = 0.5,
+        search_budget: float = 0.5,
+        rerank_budget: float = 1.5,
+    ):
+        self._provided_vector_store = vector_store
+        self._provided_embedder = embedder
+        self.vector_store = None
+        self.embedder = None
+        self.reranker = reranker
+        self.candidates = candidates
+        self.query_cache_size = query_cache_size
+        self.embed_budget = embed_budget
+        self.search_budget = search_budget
+        self.rerank_budget = rerank_budget
+
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        # running estimate of rerank seconds per document, learned from past calls
+        self._rerank_per_doc: Optional[float] = None
+        self._reranker_loaded = False
+
+    def _ensure_loaded(self):
+        if self.vector_store is None:
+            self.vector_store = self._provided_vector_store or VectorStore()
+        if self.embedder is None:
+            self.embedder = self._provided_embedder or Embedder()
+        if self.reranker is not None and not self._reranker_loaded:
+            # load outside the timed rerank, or the load would be taken for per-document cost
+            self._reranker_loaded = True
+            load = getattr(self.reranker, "_ensure_model_loaded", None)
+            if load is not None:
+                try:
+                    load()
+                except Exception as e:
+                    logger.error("Loading the reranker failed: %s", e)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query, reusing the embedding of a recently seen identical query."""
+        with self._lock:
+            cached = self._query_cache.get(query)
+            if cached is not None:
+                self._query_cache.move_to_end(query)
+                return cached
+        vec = np.asarray(self.embedder.model.encode(query, "search_query"), dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._query_cache[query] = vec
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vec
+
+    def retrieve(
+        self, query: str, top_k: int = 3, timings: Optional[Dict[str, Any]] = None, user_id: Optional[str] = None
+    ) -> list:
         """
         Retrieve the top_k most relevant documents for a given query.
-        
+
         Args:
             query (str): The query string to search for.
             top_k (int): The number of top documents to retrieve.
-        
+            timings (dict): Optional dict filled with per-stage seconds and the
+                list of `degraded` stages.
+            user_id (str): User the documents are retrieved for; only shared
+                chunks and their own uploads are returned (only shared if None).
+
         Returns:
-            list: A list of tuples containing the document ID and its relevance score.
+            list: A list of (guid, data, score) tuples, best first, where data is the
+            stored record (text, embedding, metadata).
         """
-        # Embed the query
-        query_embedding = self.embedder.encode([query])[0]
-        
-        # Retrieve the top_k documents from the vector store
-        results = self.vector_store.search(query_embedding, top_k)
-        results = [(guid, self.vector_score.vector_store[guid], score) for guid, score in results if self.vector_store.get_data(guid)["text"] is not None]
-        
-        return results
-        
\ No newline at end of file
+        timings = timings if timings is not None else {}
+        timings.setdefault("degraded", [])
+        self._ensure_loaded()
+        over_budget = False
+
+        t0 = time.perf_counter()
+        try:
+            query_embedding = self.embed_query(query)
+        except Exception as e:
+            logger.error("Query embedding failed, answering without documents: %s", e)
+            timings["degraded"].append("embed")
+            return []
+        timings["embed_s"] = time.perf_counter() - t0
+        over_budget |= timings["embed_s"] > self.embed_budget
+
+        t0 = time.perf_counter()
+        n = max(top_k, self.candidates) if self.reranker is not None else top_k
+        try:
+            self.vector_store.reload_if_changed()
+            # other users' chunks are filtered out after ranking; fetch more until n remain
+            fetch = n
+            while True:
+                hits = self.vector_store.search(query_embedding, fetch)
+                results = []
+                for guid, score in hits:
+                    data = self.vector_store.get_data(guid)
+                    if data is not None and data["text"] is not None and self._visible(data.get("metadata") or {}, user_id):
+                        results.append((guid, data, score))
+                if len(results) >= n or len(hits) < fetch:
+                    break
+                fetch *= 4
+            results = results[:n]
+        except Exception as e:
+            logger.error("Vector search failed, answering without documents: %s", e)
+            timings["degraded"].append("search")
+            return []
+        timings["search_s"] = time.perf_counter() - t0
+        over_budget |= timings["search_s"] > self.search_budget
+
+        if self.reranker is not None and len(results) > 1:
+            if over_budget:
+                timings["degraded"].append("rerank")
+            else:
+                results = self._rerank(query, results, timings)
+        return results[:top_k]
+
+    def _rerank(self, query: str, results: list, timings: Dict[str, Any]) -> list:
+        n = len(results)
+        if self._rerank_per_doc:
+            # even when the estimate says nothing fits, score 2 so a stale estimate can recover
+            n = max(2, min(n, int(self.rerank_budget / self._rerank_per_doc)))
+        if n < len(results):
+            timings["degraded"].append("rerank_candidates")
+        t0 = time.perf_counter()
+        try:
+            scores = self.reranker.rerank(query, [data["text"] for _, data, _ in results[:n]])
+        except Exception as e:
+            logger.error("Rerank failed, keeping vector scores: %s", e)
+            timings["degraded"].append("rerank")
+            return results
+        elapsed = time.perf_counter() - t0
+        timings["rerank_s"] = elapsed
+        per_doc = elapsed / n
+        self._rerank_per_doc = per_doc if self._rerank_per_doc is None else 0.7 * self._rerank_per_doc + 0.3 * per_doc
+        reranked = sorted(
+            ((guid, data, float(s)) for (guid, data, _), s in zip(results, scores)),
+            key=lambda r: -r[2],
+        )
+        # candidates the reranker had no time for keep their order after the scored ones
+        return reranked + results[n:]
+
+    def retrieve_sources(
+        self, query: str, top_k: int = 5, timings: Optional[Dict[str, Any]] = None, user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve chunks as source dicts for `ContextBuilder`.
+
+        Args:
+            query (str): The query string to search for.
+            top_k (int): The number of chunks to return.
+            timings (dict): Optional dict filled as in `retrieve`.
+            user_id (str): User the documents are retrieved for, as in `retrieve`.
+
+        Returns:
+            list: Dicts with `content`, `title` (file name and page), `url` (empty)
+            and `score`.
+        """
+        sources = []
+        for _, data, score in self.retrieve(query, top_k, timings, user_id):
+            title = self._title(data.get("metadata") or {}, user_id)
+            sources.append({"content": data["text"], "title": title, "url": "", "score": score})
+        return sources
+
+    @staticmethod
+    def _refs(metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # records written before dedup reference only themselves
+        return metadata.get("sources") or [metadata]
+
+    @classmethod
+    def _visible(cls, metadata: Dict[str, Any], user_id: Optional[str]) -> bool:
+        return any(ref.get("user_id") in (None, user_id) for ref in cls._refs(metadata))
+
+    @classmethod
+    def _title(cls, metadata: Dict[str, Any], user_id: Optional[str] = None) -> str:
+        # never name another user's file
+        refs = [ref for ref in cls._refs(metadata) if ref.get("user_id") in (None, user_id)]
+        first = refs[0]
+        title = os.path.basename(first.get("file_path") or "document")
+        if first.get("page") is not None:
+            title += f" p.{first['page']}"
+        if len(refs) > 1:
+            # deduplicated chunks occur in several places
+            title += f" (+{len(refs) - 1} more)"
+        return title
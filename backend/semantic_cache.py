@@ -0,0 +1,159 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Iterable, Dict, Tuple
+
+import numpy as np
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class SemanticCache:
+    """In-memory semantic cache of LLM answers keyed by prompt embedding.
+
+    Entries are scoped by (mode, model, temperature): a lookup only matches
+    answers produced under the same scope. Modes not listed in `modes` bypass
+    the cache entirely, which is how fresh-information modes (web search, deep
+    research) avoid serving stale answers.
+
+    A lookup hits when the cosine similarity between normalized prompt
+    embeddings reaches `threshold`. Entries expire after `ttl_seconds`, and the
+    least recently used one is evicted once `max_entries` is reached. The
+    embedding model is loaded on first use unless one is passed in. Entries and
+    indexes are only touched under a lock, and prompts are embedded outside it,
+    so one instance can be shared across Streamlit sessions.
+    """
+
+    def __init__(
+        self,
+        embedding_model=None,
+        threshold: float = 0.92,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 1000,
+        modes: Iterable[str] = ("plain",),
+    ):
+        self._provided_model = embedding_model
+        self.embedding_model = None
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.modes = set(modes)
+
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._index: Dict[Tuple, Optional[Tuple[list, np.ndarray]]] = {}
+        self._next_id = 0
+        self._last: Optional[Tuple[str, np.ndarray]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _ensure_model_loaded(self):
+        if self.embedding_model is not None:
+            return
+        with self._lock:
+            if self.embedding_model is not None:
+                return
+            if self._provided_model is not None:
+                self.embedding_model = self._provided_model
+            else:
+                from embedding.modernbert import EmbeddingModel
+
+                self.embedding_model = EmbeddingModel()
+
+    def accepts(self, mode: str) -> bool:
+        """Return True if answers for `mode` may be served from the cache."""
+        return mode in self.modes
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        # lookup and store are called back to back for a miss, so memoize the last prompt;
+        # read the (prompt, embedding) pair once, as another session may replace it meanwhile
+        last = self._last
+        if last is not None and last[0] == prompt:
+            return last[1]
+        self._ensure_model_loaded()
+        vec = np.asarray(self.embedding_model.encode(prompt, "search_query"), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        self._last = (prompt, vec)
+        return vec
+
+    @staticmethod
+    def _scope(mode: str, model: str, temperature: float) -> Tuple:
+        return (mode, model, round(float(temperature), 3))
+
+    def _expire(self, now: float) -> None:
+        expired = [k for k, e in self._entries.items() if now - e["created_at"] > self.ttl_seconds]
+        for k in expired:
+            self._remove(k)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._index[entry["scope"]] = None
+
+    def _scope_index(self, scope: Tuple) -> Optional[Tuple[list, np.ndarray]]:
+        index = self._index.get(scope)
+        if index is None:
+            ids = [k for k, e in self._entries.items() if e["scope"] == scope]
+            if not ids:
+                return None
+            index = (ids, np.vstack([self._entries[k]["embedding"] for k in ids]))
+            self._index[scope] = index
+        return index
+
+    def lookup(self, prompt: str, model: str, temperature: float, mode: str = "plain") -> Optional[str]:
+        """Return a cached answer for a semantically similar prompt, or None."""
+        if not self.accepts(mode):
+            return None
+        vec = self._embed(prompt)
+        scope = self._scope(mode, model, temperature)
+        with self._lock:
+            self._expire(time.time())
+            index = self._scope_index(scope)
+            if index is None:
+                self.misses += 1
+                return None
+            ids, matrix = index
+            sims = matrix @ vec
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            logger.debug("Semantic cache hit (%.3f) for prompt: %s", sims[best], prompt[:80])
+            return self._entries[entry_id]["answer"]
+
+    def store(self, prompt: str, answer: str, model: str, temperature: float, mode: str = "plain") -> None:
+        """Cache `answer` for `prompt` under the given scope."""
+        if not self.accepts(mode) or not answer:
+            return
+        vec = self._embed(prompt)
+        scope = self._scope(mode, model, temperature)
+        with self._lock:
+            self._entries[self._next_id] = {
+                "scope": scope,
+                "prompt": prompt,
+                "answer": answer,
+                "embedding": vec,
+                "created_at": time.time(),
+            }
+            self._next_id += 1
+            self._index[scope] = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
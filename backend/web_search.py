@@ -1,6 +1,7 @@
 import os
 from tavily import TavilyClient
 from utils.logging_config import configure_logging_from_env, get_logger
+from utils.tracing import traced
 
 # Ensure logging is configured according to environment (DEBUG env var)
 configure_logging_from_env()
@@ -25,6 +26,7 @@ class WebSearch:
         self.client = client or TavilyClient(api_key=api_key)
         self.logger = logger
 
+    @traced("web_search.search")
     def search(self, query: str, num_results: int = 5) -> list:
         """Perform a web search using the Tavily API.
 
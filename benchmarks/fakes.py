@@ -0,0 +1,301 @@
+'''
+Deterministic stand-ins for the models and services used by the app, plus a
+synthetic corpus generator, so benchmarks run offline and give the same
+workload on every machine and commit.
+
+The fakes implement just the interfaces the repo's injection hooks expect:
+
+- FakeTokenizer: `TokenChunker(tokenizer=...)` and `Reranker(tokenizer=...)`
+- FakeEmbeddingModel: `Embedder(model=...)` (and so `Retriever(embedder=...)`)
+- fake_reranker_model(): `Reranker(model=...)` (needs torch)
+- LexicalReranker: in place of a `Reranker` (e.g. `Retriever(reranker=...)`)
+- FakeSearchClient: `WebSearch(client=...)`
+- fake_llm(): a request function for `LLMScheduler.run`
+
+Timings measured with fakes cover the repo's own code around the models
+(batching, tokenization bookkeeping, storage, queues), not model inference.
+'''
+
+import random
+import re
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_WORD = re.compile(r"\S+")
+
+
+def stable_hash(text: str) -> int:
+    """Hash that is identical across processes (unlike `hash`, which is salted)."""
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def synthetic_vocabulary(size: int = 5000, seed: int = 0) -> List[str]:
+    """Pronounceable pseudo-words, so tokenizers and full-text search see word-like input."""
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def synthetic_corpus(
+    n_docs: int,
+    paragraphs: int = 8,
+    sentences: int = 5,
+    words: int = 14,
+    vocabulary: int = 5000,
+    seed: int = 0,
+) -> List[str]:
+    """
+    Generate documents of paragraphs separated by blank lines.
+
+    Word frequencies follow a Zipf distribution, and each document draws half of
+    its words from a small set of topic words of its own, so documents are
+    distinguishable by content (needed for meaningful retrieval).
+
+    :param n_docs: Number of documents.
+    :param paragraphs: Paragraphs per document.
+    :param sentences: Sentences per paragraph.
+    :param words: Words per sentence.
+    :param vocabulary: Vocabulary size.
+    :param seed: Random seed; the same arguments always give the same corpus.
+    :return: List of document texts.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = np.asarray(synthetic_vocabulary(vocabulary, seed))
+    weights = 1.0 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    per_doc = paragraphs * sentences * words
+    docs = []
+    for _ in range(n_docs):
+        topic = rng.choice(vocab, size=20, replace=False)
+        background = rng.choice(vocab, size=per_doc, p=weights)
+        mask = rng.random(per_doc) < 0.5
+        picked = np.where(mask, rng.choice(topic, size=per_doc), background).tolist()
+        paras = []
+        for p in range(paragraphs):
+            sents = []
+            for s in range(sentences):
+                start = (p * sentences + s) * words
+                sent = picked[start:start + words]
+                sents.append(sent[0].capitalize() + " " + " ".join(sent[1:]) + ".")
+            paras.append(" ".join(sents))
+        docs.append("\n\n".join(paras))
+    return docs
+
+
+def synthetic_queries(docs: List[str], n: int, words: int = 4, seed: int = 0) -> List[Dict]:
+    """
+    Sample queries from document text; each query remembers the document it came from.
+
+    :return: List of {"query", "doc"} dicts (`doc` is the source document's index).
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        i = rng.randrange(len(docs))
+        tokens = _WORD.findall(docs[i].lower())
+        start = rng.randrange(max(1, len(tokens) - words))
+        queries.append({"query": " ".join(t.strip(".") for t in tokens[start:start + words]), "doc": i})
+    return queries
+
+
+class FakeTokenizer:
+    """
+    Whitespace tokenizer with a hashed vocabulary.
+
+    Implements the subset of the Hugging Face fast-tokenizer API used by
+    `TokenChunker` (offsets) and `Reranker` (batch encoding, padding).
+    """
+
+    def __init__(self, vocab_size: int = 4096):
+        self.vocab_size = vocab_size
+        self.pad_token_id = 0
+
+    def _id(self, token: str) -> int:
+        # 0 is reserved for padding
+        return 1 + stable_hash(token) % (self.vocab_size - 1)
+
+    def convert_tokens_to_ids(self, token: str) -> int:
+        return self._id(token)
+
+    def encode(self, text: str, add_special_tokens: bool = False) -> List[int]:
+        return [self._id(m.group()) for m in _WORD.finditer(text)]
+
+    def __call__(
+        self,
+        text,
+        add_special_tokens: bool = False,
+        return_offsets_mapping: bool = False,
+        truncation=None,
+        max_length: Optional[int] = None,
+        **kwargs,
+    ) -> Dict:
+        if isinstance(text, str):
+            matches = list(_WORD.finditer(text))
+            enc = {"input_ids": [self._id(m.group()) for m in matches]}
+            if return_offsets_mapping:
+                enc["offset_mapping"] = [(m.start(), m.end()) for m in matches]
+            return enc
+        ids = [self.encode(t) for t in text]
+        if truncation and max_length:
+            ids = [i[:max_length] for i in ids]
+        return {"input_ids": ids}
+
+    def pad(self, inputs: Dict, padding=True, return_tensors: Optional[str] = None, max_length: Optional[int] = None):
+        """Left-pad a batch (as the reranker's tokenizer is configured) and build the attention mask."""
+        ids = inputs["input_ids"]
+        width = max(len(i) for i in ids)
+        padded = [[self.pad_token_id] * (width - len(i)) + list(i) for i in ids]
+        mask = [[0] * (width - len(i)) + [1] * len(i) for i in ids]
+        if return_tensors == "pt":
+            import torch
+
+            return {"input_ids": torch.tensor(padded), "attention_mask": torch.tensor(mask)}
+        return {"input_ids": padded, "attention_mask": mask}
+
+
+class FakeEmbeddingModel:
+    """
+    Feature-hashing bag-of-words embedder with the `EmbeddingModel` interface.
+
+    Texts sharing words get similar vectors, so nearest-neighbour results are
+    meaningful, and the same text always gets the same vector.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in _WORD.findall(text.lower()):
+            h = stable_hash(token.strip(".,;:!?"))
+            vec[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def encode(self, query: str, type_query: str) -> np.ndarray:
+        if type_query not in ["search_query", "search_document"]:
+            raise ValueError("Type must be 'search_query' or 'search_document'")
+        return self._vector(query).reshape(1, -1)
+
+    def encode_batch(self, queries: list, type_query: str, batch_size: int = 32) -> np.ndarray:
+        if type_query not in ["search_query", "search_document"]:
+            raise ValueError("Type must be 'search_query' or 'search_document'")
+        if not queries:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack([self._vector(q) for q in queries])
+
+    def similarity(self, query_embeddings: np.ndarray, doc_embeddings: np.ndarray) -> np.ndarray:
+        return np.asarray(query_embeddings) @ np.asarray(doc_embeddings).T
+
+
+def fake_reranker_model(vocab_size: int = 4096, dim: int = 64, seed: int = 0):
+    """
+    Tiny causal-LM-shaped torch module for `Reranker(model=...)`.
+
+    Compute grows with batch size and sequence length like a real model's, so
+    padding and batching effects show up, but only the last position's logits
+    are produced.
+    """
+    import torch
+
+    class _Output:
+        def __init__(self, logits):
+            self.logits = logits
+
+    class FakeRerankerModel(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            torch.manual_seed(seed)
+            self.embed = torch.nn.Embedding(vocab_size, dim)
+            self.mix = torch.nn.Linear(dim, dim)
+            self.head = torch.nn.Linear(dim, vocab_size)
+
+        def forward(self, input_ids, attention_mask=None, **kwargs):
+            h = torch.tanh(self.mix(self.embed(input_ids)))
+            if attention_mask is not None:
+                h = h * attention_mask.unsqueeze(-1)
+            return _Output(self.head(h.sum(dim=1, keepdim=True)))
+
+    return FakeRerankerModel().eval()
+
+
+class LexicalReranker:
+    """
+    `Reranker` stand-in scoring documents by how densely they contain the query's words.
+
+    Its ranking differs from embedding similarity (so reranking changes
+    results) and it is cheap enough to score a whole corpus, which makes
+    exhaustive reranking usable as ground truth for rerank cascades.
+    """
+
+    def __init__(self):
+        # document text -> (token counts, token total); documents repeat across queries
+        self._counts: Dict[str, tuple] = {}
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        return [t.strip(".,;:!?").lower() for t in _WORD.findall(text)]
+
+    def rerank(self, query: str, documents: List[str], instruction: Optional[str] = None) -> List[float]:
+        terms = set(self._tokens(query))
+        scores = []
+        for doc in documents:
+            counts = self._counts.get(doc)
+            if counts is None:
+                tokens = self._tokens(doc)
+                bag: Dict[str, int] = {}
+                for t in tokens:
+                    bag[t] = bag.get(t, 0) + 1
+                counts = self._counts[doc] = (bag, len(tokens))
+            bag, total = counts
+            x = sum(bag.get(t, 0) for t in terms) / (total ** 0.5) if total else 0.0
+            scores.append(x / (1.0 + x))
+        return scores
+
+
+class FakeSearchClient:
+    """`TavilyClient` stand-in returning canned results after an optional simulated latency."""
+
+    def __init__(self, latency_s: float = 0.0, results: int = 5):
+        self.latency_s = latency_s
+        self.results = results
+        self.calls = 0
+
+    def search(self, query: str, num_results: int = 5, **kwargs) -> Dict:
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        n = min(num_results, self.results)
+        return {
+            "results": [
+                {"title": f"Result {i} for {query}", "url": f"https://example.com/{i}", "content": f"{query} ({i})"}
+                for i in range(n)
+            ]
+        }
+
+
+def fake_llm(tokens: int = 64, token_latency_s: float = 0.0, first_token_s: float = 0.0):
+    """
+    Request function for `LLMScheduler.run` that streams `tokens` tokens.
+
+    Like `LLM._stream_chain`, it checks for cancellation between tokens.
+    """
+
+    def call(request) -> str:
+        if first_token_s:
+            time.sleep(first_token_s)
+        parts = []
+        for i in range(tokens):
+            if token_latency_s:
+                time.sleep(token_latency_s)
+            request.check()
+            parts.append(f"tok{i} ")
+        return "".join(parts)
+
+    return call
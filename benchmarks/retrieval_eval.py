@@ -0,0 +1,363 @@
+'''
+Retrieval quality vs. latency evaluation.
+
+Usage:
+    python -m benchmarks.retrieval_eval
+    python -m benchmarks.retrieval_eval --corpus fixtures/ --queries 200 --k 5
+    python -m benchmarks.retrieval_eval --models real
+
+For each retrieval configuration (chunking, rerank candidate count) the
+fixture corpus is chunked, embedded and loaded into a VectorStore, and every
+query goes through `Retriever.retrieve` as in the app. Results are scored
+against exact-search ground truth computed over the reference chunking:
+
+- without a reranker: the exact nearest neighbours by cosine similarity
+  (float64 brute force over all chunk embeddings)
+- with a reranker: the reranker's top chunks over the whole corpus, so a
+  cascade is measured against what reranking everything would return
+
+Configurations chunked differently from the reference are scored at document
+level (hits and ground truth mapped to their source documents, duplicates
+dropped). Every configuration is also scored against the document each query
+was sampled from (`source_*`), which needs no ground truth.
+
+Reported per configuration: recall@k, MRR of the exact top hit, nDCG@k
+(gain k - exact rank), source hit rate and MRR, p50/p95 query latency,
+build time, index memory and peak memory traced while querying.
+
+The corpus is synthetic (`benchmarks.fakes`) unless `--corpus` names a
+directory of .txt files; queries are word spans sampled from the documents.
+Models are the offline fakes unless `--models real` (which loads the
+embedding and reranker checkpoints; exhaustive reranking then takes a while,
+so keep the corpus and `--queries` small).
+'''
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import json
+import logging
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.fakes import FakeEmbeddingModel, FakeTokenizer, LexicalReranker, synthetic_corpus, synthetic_queries
+from benchmarks.run import RESULTS_DIR, git_revision, latency_stats, vector_store_at
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+REFERENCE_CHUNKING = "tokens_256"
+
+
+def default_configurations(candidates=(10, 20, 50)) -> List[Dict]:
+    """
+    Configurations evaluated by default.
+
+    Each is a dict with `name`, `chunking` ("paragraph" or "tokens_<target>")
+    and `candidates` (chunks passed to the reranker, or None for no reranking).
+    """
+    configs = [{"name": "exact", "chunking": REFERENCE_CHUNKING, "candidates": None}]
+    configs += [{"name": f"rerank_{n}", "chunking": REFERENCE_CHUNKING, "candidates": n} for n in candidates]
+    configs += [
+        {"name": "paragraph", "chunking": "paragraph", "candidates": None},
+        {"name": "tokens_128", "chunking": "tokens_128", "candidates": None},
+        {"name": "tokens_512", "chunking": "tokens_512", "candidates": None},
+    ]
+    return configs
+
+
+def make_chunker(chunking: str, tokenizer=None):
+    """Build the chunker named by a configuration's `chunking`."""
+    from data_ingestion.chunking_embedding import Chunker, TokenChunker
+
+    if chunking == "paragraph":
+        return Chunker()
+    target = int(chunking.split("_", 1)[1])
+    # same max/target ratio as the pipeline's default (256/480)
+    return TokenChunker(tokenizer=tokenizer, target_tokens=target, max_tokens=target * 15 // 8)
+
+
+def chunk_corpus(docs: List[str], chunking: str, tokenizer=None) -> List[tuple]:
+    """
+    Chunk every document separately.
+
+    :return: List of (chunk text, source document index) tuples.
+    """
+    chunker = make_chunker(chunking, tokenizer)
+    return [(c, i) for i, doc in enumerate(docs) for c, _ in chunker.chunk_segments(doc.split("\n\n"))]
+
+
+def exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> List[int]:
+    """Indices of the k rows most cosine-similar to `query`, by float64 brute force (ties by index)."""
+    m = matrix.astype(np.float64)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    m /= np.where(norms == 0, 1.0, norms)
+    q = np.asarray(query, dtype=np.float64).reshape(-1)
+    sims = m @ (q / (np.linalg.norm(q) or 1.0))
+    return np.argsort(-sims, kind="stable")[:k].tolist()
+
+
+def ranking_metrics(retrieved: List, truth: List, k: int) -> Dict[str, float]:
+    """
+    Score one ranked result list against a ground-truth ranking.
+
+    :param retrieved: Retrieved items, best first.
+    :param truth: Ground-truth items, best first.
+    :param k: Cutoff.
+    :return: Dict with recall@k, MRR of the ground-truth top item and graded nDCG@k.
+    """
+    retrieved, truth = retrieved[:k], truth[:k]
+    if not truth:
+        return {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+    gains = {item: len(truth) - rank for rank, item in enumerate(truth)}
+    dcg = sum(gains.get(item, 0) / np.log2(rank + 2) for rank, item in enumerate(retrieved))
+    ideal = sum(gain / np.log2(rank + 2) for rank, gain in enumerate(sorted(gains.values(), reverse=True)))
+    return {
+        "recall": len(set(retrieved) & set(truth)) / len(truth),
+        "mrr": 1.0 / (retrieved.index(truth[0]) + 1) if truth[0] in retrieved else 0.0,
+        "ndcg": dcg / ideal,
+    }
+
+
+def _documents(chunk_ids: List[int], chunks: List[tuple]) -> List[int]:
+    """Map chunk indices to their source documents, keeping the first occurrence of each."""
+    seen = []
+    for j in chunk_ids:
+        doc = chunks[j][1]
+        if doc not in seen:
+            seen.append(doc)
+    return seen
+
+
+class _Index:
+    """One chunking of the corpus, embedded and loaded into a VectorStore."""
+
+    def __init__(self, docs: List[str], chunking: str, embedder, tokenizer, path: str):
+        from data_ingestion.vector_store import VectorStore
+
+        t0 = time.perf_counter()
+        self.chunks = chunk_corpus(docs, chunking, tokenizer)
+        texts = [c for c, _ in self.chunks]
+        self.embeddings = np.vstack([np.asarray(e, dtype=np.float32).reshape(-1) for e in embedder.embed_batch(texts)])
+        self.store = VectorStore()
+        self.store.add_many(
+            (f"chunk-{j}", text, self.embeddings[j], {"doc": doc, "chunk_index": j})
+            for j, (text, doc) in enumerate(self.chunks)
+        )
+        # build the search matrix now so the first query is not charged for it
+        self.store.search(self.embeddings[0], 1)
+        self.build_s = time.perf_counter() - t0
+        self.store_mb = os.path.getsize(os.path.join(path, "vector_store.json")) / 2**20
+
+
+def evaluate(
+    docs: List[str],
+    queries: List[Dict],
+    configs: List[Dict],
+    embedder,
+    reranker,
+    tokenizer=None,
+    k: int = 5,
+    memory_queries: int = 20,
+) -> List[Dict]:
+    """
+    Evaluate retrieval configurations on a corpus.
+
+    :param docs: Document texts.
+    :param queries: {"query", "doc"} dicts (`doc` is the index of the document the query is about).
+    :param configs: Configurations (see `default_configurations`).
+    :param embedder: Embedder used to index and to embed queries.
+    :param reranker: Reranker for configurations with `candidates`.
+    :param tokenizer: Tokenizer for token chunkings (None loads the embedding model's tokenizer).
+    :param k: Number of results per query.
+    :param memory_queries: Queries re-run under tracemalloc to measure peak query memory.
+    :return: One result dict per configuration, in order.
+    """
+    # the reference chunking is evaluated first because it defines the ground truth
+    chunkings = sorted({c["chunking"] for c in configs} | {REFERENCE_CHUNKING}, key=lambda c: c != REFERENCE_CHUNKING)
+    query_vecs = [np.asarray(embedder.model.encode(q["query"], "search_query"), dtype=np.float32).reshape(-1) for q in queries]
+    truth = {}
+    reference = None
+    results = {}
+    for chunking in chunkings:
+        workdir = tempfile.mkdtemp(prefix="retrieval_eval_")
+        try:
+            with vector_store_at(workdir):
+                index = _Index(docs, chunking, embedder, tokenizer, workdir)
+                if chunking == REFERENCE_CHUNKING:
+                    reference = index
+                    texts = [c for c, _ in index.chunks]
+                    truth["embedding"] = [exact_top_k(index.embeddings, v, k) for v in query_vecs]
+                    if any(c["candidates"] for c in configs):
+                        truth["rerank"] = [
+                            np.argsort(-np.asarray(reranker.rerank(q["query"], texts)), kind="stable")[:k].tolist()
+                            for q in queries
+                        ]
+                for config in (c for c in configs if c["chunking"] == chunking):
+                    results[config["name"]] = _evaluate_config(
+                        config, index, reference, truth, queries, embedder, reranker, k, memory_queries
+                    )
+                    logger.info("Evaluated %s", config["name"])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return [results[c["name"]] for c in configs]
+
+
+def _evaluate_config(config, index, reference, truth, queries, embedder, reranker, k, memory_queries) -> Dict:
+    from backend.retriever import Retriever
+
+    # a budget no query reaches (the retriever divides it, so it must be finite)
+    unlimited = 1e9
+    retriever = Retriever(
+        vector_store=index.store,
+        embedder=embedder,
+        reranker=reranker if config["candidates"] else None,
+        candidates=config["candidates"] or k,
+        # no query cache and no time budgets: every query does the full configured work
+        query_cache_size=0,
+        embed_budget=unlimited,
+        search_budget=unlimited,
+        rerank_budget=unlimited,
+    )
+    ground_truth = truth["rerank" if config["candidates"] else "embedding"]
+    chunk_level = index is reference
+    scores = {"recall": [], "mrr": [], "ndcg": [], "source_hit": [], "source_mrr": []}
+    latencies, search_s, rerank_s = [], [], []
+    for q, gt in zip(queries, ground_truth):
+        timings = {}
+        t0 = time.perf_counter()
+        hits = retriever.retrieve(q["query"], k, timings)
+        latencies.append(time.perf_counter() - t0)
+        search_s.append(timings.get("search_s", 0.0))
+        rerank_s.append(timings.get("rerank_s", 0.0))
+        ids = [int(guid.rsplit("-", 1)[1]) for guid, _, _ in hits]
+        docs = _documents(ids, index.chunks)
+        if chunk_level:
+            m = ranking_metrics(ids, gt, k)
+        else:
+            m = ranking_metrics(docs, _documents(gt, reference.chunks), k)
+        for name, value in m.items():
+            scores[name].append(value)
+        scores["source_hit"].append(float(q["doc"] in docs))
+        scores["source_mrr"].append(1.0 / (docs.index(q["doc"]) + 1) if q["doc"] in docs else 0.0)
+
+    tracemalloc.start()
+    for q in queries[:memory_queries]:
+        retriever.retrieve(q["query"], k)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    lat = latency_stats(latencies)
+    return {
+        "name": config["name"],
+        "chunking": config["chunking"],
+        "candidates": config["candidates"],
+        "level": "chunk" if chunk_level else "document",
+        "ground_truth": "rerank" if config["candidates"] else "embedding",
+        "chunks": len(index.chunks),
+        "queries": len(queries),
+        "k": k,
+        f"recall@{k}": float(np.mean(scores["recall"])),
+        "mrr": float(np.mean(scores["mrr"])),
+        f"ndcg@{k}": float(np.mean(scores["ndcg"])),
+        f"source_hit@{k}": float(np.mean(scores["source_hit"])),
+        "source_mrr": float(np.mean(scores["source_mrr"])),
+        "latency": lat,
+        "search_p50_ms": float(np.percentile(search_s, 50) * 1000),
+        "rerank_p50_ms": float(np.percentile(rerank_s, 50) * 1000),
+        "build_s": index.build_s,
+        "index_mb": index.store._index[0].nbytes / 2**20,
+        "store_mb": index.store_mb,
+        "query_peak_mb": peak / 2**20,
+    }
+
+
+def load_corpus(path: Optional[str], n_docs: int, seed: int) -> List[str]:
+    """Documents from a directory of .txt files, or a synthetic corpus when `path` is None."""
+    if path is None:
+        return synthetic_corpus(n_docs, seed=seed)
+    docs = []
+    for root, _, names in os.walk(path):
+        for name in sorted(names):
+            if name.lower().endswith(".txt"):
+                with open(os.path.join(root, name), 'r', encoding='utf-8', errors='replace') as f:
+                    docs.append(f.read())
+    if not docs:
+        raise ValueError(f"No .txt documents found under {path}")
+    return docs
+
+
+def format_table(rows: List[Dict]) -> str:
+    """Plain-text summary table of evaluation results."""
+    k = rows[0]["k"] if rows else 0
+    header = f"{'config':14s} {'level':9s} {'recall@'+str(k):>9s} {'mrr':>6s} {'ndcg@'+str(k):>7s} {'src_hit':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'index MB':>9s}"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(
+            f"{r['name']:14s} {r['level']:9s} {r[f'recall@{k}']:9.3f} {r['mrr']:6.3f} {r[f'ndcg@{k}']:7.3f} "
+            f"{r[f'source_hit@{k}']:7.3f} {r['latency']['p50_ms']:8.2f} {r['latency']['p95_ms']:8.2f} {r['index_mb']:9.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Retrieval quality vs. latency for each retrieval configuration.")
+    parser.add_argument("--corpus", help="directory of .txt fixture documents (default: synthetic corpus)")
+    parser.add_argument("--docs", type=int, default=300, help="synthetic documents")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", nargs="+", type=int, default=[10, 20, 50], help="rerank candidate counts")
+    parser.add_argument("--models", choices=["fake", "real"], default="fake")
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimension")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default: benchmarks/results/retrieval-<time>-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    from data_ingestion.chunking_embedding import Embedder
+
+    docs = load_corpus(args.corpus, args.docs, args.seed)
+    queries = synthetic_queries(docs, args.queries, seed=args.seed)
+    if args.models == "real":
+        from backend.reranker import Reranker
+
+        embedder, reranker, tokenizer = Embedder(), Reranker(), None
+    else:
+        embedder, reranker, tokenizer = Embedder(model=FakeEmbeddingModel(args.dim)), LexicalReranker(), FakeTokenizer()
+
+    logging.disable(logging.INFO)
+    try:
+        rows = evaluate(docs, queries, default_configurations(args.candidates), embedder, reranker, tokenizer, args.k)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    revision = git_revision()
+    report = {
+        "meta": {
+            **revision,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "documents": len(docs),
+            "args": {k: v for k, v in vars(args).items() if k != "out"},
+        },
+        "results": {r["name"]: r for r in rows},
+    }
+    out = args.out
+    if out is None:
+        commit = (revision["commit"] or "nogit")[:10] + ("-dirty" if revision["dirty"] else "")
+        out = os.path.join(RESULTS_DIR, f"retrieval-{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(format_table(rows))
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+'''
+Offline benchmark suite.
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --suites vector_store --sizes 1000 10000 100000 1000000
+    python -m benchmarks.run --compare benchmarks/results/old.json benchmarks/results/new.json
+
+Every suite runs on synthetic data with the deterministic fakes from
+`benchmarks.fakes` injected through the constructors' hooks, in a temporary
+directory, so no model download, network access or existing data is needed
+and repeated runs do the same work. Results are written as JSON (with the git
+commit they were measured at) to `benchmarks/results/`, and `--compare`
+prints the ratio of every metric between two result files.
+
+Suites whose dependencies are missing are reported as skipped.
+'''
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.fakes import (
+    FakeEmbeddingModel,
+    FakeSearchClient,
+    FakeTokenizer,
+    fake_llm,
+    fake_reranker_model,
+    synthetic_corpus,
+    synthetic_queries,
+)
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """
+    Summarize per-operation latencies.
+
+    :param samples: Durations in seconds.
+    :return: Dict with count, mean, p50, p95 and max in milliseconds and operations per second.
+    """
+    a = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        "count": int(len(a)),
+        "mean_ms": float(a.mean()),
+        "p50_ms": float(np.percentile(a, 50)),
+        "p95_ms": float(np.percentile(a, 95)),
+        "max_ms": float(a.max()),
+        "ops_per_s": float(len(a) / (a.sum() / 1000)) if a.sum() else 0.0,
+    }
+
+
+def _timed(fn: Callable, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - t0, result
+
+
+@contextlib.contextmanager
+def vector_store_at(path: str):
+    """Point the JSON vector store at `path` (it keeps its file under a module-level DATA_PATH)."""
+    from data_ingestion import vector_store
+
+    previous = vector_store.DATA_PATH
+    vector_store.DATA_PATH = path
+    try:
+        # the store prints a line per write
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        vector_store.DATA_PATH = previous
+
+
+def _chunk_pool(docs: List[str]) -> List[str]:
+    return [p for d in docs for p in d.split("\n\n")]
+
+
+def bench_vector_store(args, workdir: str) -> Dict:
+    """Add, single-record update, load, matrix build and search at each store size."""
+    from data_ingestion.vector_store import VectorStore
+
+    rng = np.random.default_rng(args.seed)
+    texts = _chunk_pool(synthetic_corpus(100, seed=args.seed))
+    results = {}
+    for n in args.sizes:
+        path = os.path.join(workdir, f"vs_{n}")
+        os.makedirs(path)
+        embeddings = rng.standard_normal((n, args.dim), dtype=np.float32)
+        records = [
+            (f"guid-{i}", texts[i % len(texts)], embeddings[i], {"file_path": "synthetic.txt", "chunk_index": i})
+            for i in range(n)
+        ]
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        with vector_store_at(path):
+            store = VectorStore()
+            add_s, _ = _timed(store.add_many, records)
+            del records
+            add_one_s, _ = _timed(store.add_data, "guid-extra", texts[0], embeddings[0], {"file_path": "synthetic.txt"})
+            del store
+            load_s, store = _timed(VectorStore)
+            matrix_s, _ = _timed(store.search, queries[0], args.top_k)
+            samples = [_timed(store.search, q, args.top_k)[0] for q in queries]
+            results[str(n)] = {
+                "vectors": n,
+                "dim": args.dim,
+                "add_many_s": add_s,
+                "add_many_per_s": n / add_s,
+                "add_one_s": add_one_s,
+                "load_s": load_s,
+                "first_search_s": matrix_s,
+                "search": latency_stats(samples),
+                "file_mb": os.path.getsize(os.path.join(path, "vector_store.json")) / 2**20,
+                "matrix_mb": store._index[0].nbytes / 2**20,
+            }
+        shutil.rmtree(path)
+    return results
+
+
+def bench_chunking(args, workdir: str) -> Dict:
+    """Throughput of the paragraph chunker and of the token chunker (with a fake tokenizer)."""
+    from data_ingestion.chunking_embedding import Chunker, TokenChunker
+
+    docs = synthetic_corpus(args.docs, seed=args.seed)
+    mb = sum(len(d) for d in docs) / 2**20
+    results = {}
+    for name, chunker in (("chunker", Chunker()), ("token_chunker", TokenChunker(tokenizer=FakeTokenizer()))):
+        elapsed, chunks = _timed(lambda: [c for d in docs for c in chunker.chunk_segments(d.split("\n\n"))])
+        results[name] = {
+            "docs": len(docs),
+            "chunks": len(chunks),
+            "seconds": elapsed,
+            "docs_per_s": len(docs) / elapsed,
+            "chunks_per_s": len(chunks) / elapsed,
+            "mb_per_s": mb / elapsed,
+        }
+        if isinstance(chunker, TokenChunker):
+            results[name]["chunk_tokens"] = chunker.token_length_report()
+    return results
+
+
+def bench_embedding(args, workdir: str) -> Dict:
+    """Embedder throughput per chunk and in batches of several sizes (fake model)."""
+    from data_ingestion.chunking_embedding import Embedder
+
+    chunks = _chunk_pool(synthetic_corpus(args.docs, seed=args.seed))
+    embedder = Embedder(model=FakeEmbeddingModel(args.dim))
+    elapsed, _ = _timed(embedder.embed, chunks)
+    results = {"embed": {"chunks": len(chunks), "seconds": elapsed, "chunks_per_s": len(chunks) / elapsed}}
+    for batch in (1, 8, 32, 128):
+        elapsed, _ = _timed(lambda: [embedder.embed_batch(chunks[i:i + batch]) for i in range(0, len(chunks), batch)])
+        results[f"embed_batch_{batch}"] = {
+            "chunks": len(chunks),
+            "seconds": elapsed,
+            "chunks_per_s": len(chunks) / elapsed,
+        }
+    return results
+
+
+def bench_reranker(args, workdir: str) -> Dict:
+    """Reranker throughput and padding overhead by number of documents per call (fake model)."""
+    from backend.reranker import Reranker
+
+    tokenizer = FakeTokenizer()
+    reranker = Reranker(tokenizer=tokenizer, model=fake_reranker_model(tokenizer.vocab_size), device="cpu")
+    docs = _chunk_pool(synthetic_corpus(40, seed=args.seed))[:256]
+    query = synthetic_queries(docs, 1, seed=args.seed)[0]["query"]
+    reranker.rerank(query, docs[:2])  # warm-up
+    results = {}
+    for batch in (1, 4, 16, 64, 256):
+        calls = [docs[i:i + batch] for i in range(0, len(docs), batch)]
+        samples = [_timed(reranker.rerank, query, c)[0] for c in calls]
+        lengths = [[len(tokenizer.encode(reranker._format_instruction(None, query, d))) for d in c] for c in calls]
+        padded = sum(max(ls) * len(ls) for ls in lengths)
+        results[f"batch_{batch}"] = {
+            "documents": len(docs),
+            "docs_per_s": len(docs) / sum(samples),
+            "call": latency_stats(samples),
+            "padding_ratio": 1 - sum(map(sum, lengths)) / padded,
+        }
+    return results
+
+
+def bench_chat_store(args, workdir: str) -> Dict:
+    """ChatStore operations per second, with synchronous and write-behind appends."""
+    from backend.chat_store import ChatStore
+
+    words = " ".join(synthetic_corpus(20, seed=args.seed)).split()
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for write_behind in (False, True):
+        path = os.path.join(workdir, f"chat_{int(write_behind)}")
+        store = ChatStore(db_path=os.path.join(path, "chat.db"), write_behind=write_behind)
+        users = [f"user-{u}" for u in range(10)]
+        convs = [(u, store.create_conversation(u, f"Conversation {i}")) for i, u in enumerate(users * 10)]
+        contents = [" ".join(rng.choice(words, size=40)) for _ in range(256)]
+
+        t0 = time.perf_counter()
+        for i in range(args.messages):
+            u, c = convs[i % len(convs)]
+            store.append_message(u, c, "user" if i % 2 == 0 else "assistant", contents[i % len(contents)])
+        store.flush()
+        append_s = time.perf_counter() - t0
+
+        picks = [convs[i] for i in rng.integers(len(convs), size=200)]
+        queries = [" ".join(rng.choice(words, size=2)) for _ in range(200)]
+        result = {
+            "messages": args.messages,
+            "append_per_s": args.messages / append_s,
+            "get_messages_page": latency_stats([_timed(store.get_messages, u, c, limit=50)[0] for u, c in picks]),
+            "list_conversations": latency_stats([_timed(store.list_conversations, u, limit=20)[0] for u, _ in picks]),
+            "get_conversation": latency_stats([_timed(store.get_conversation, u, c)[0] for u, c in picks]),
+            "search_messages": latency_stats(
+                [_timed(store.search_messages, u, q)[0] for (u, _), q in zip(picks, queries)]
+            ),
+        }
+        export_s, _ = _timed(store.export, os.path.join(path, "export.jsonl"), fmt="jsonl")
+        result["export_messages_per_s"] = args.messages / export_s
+        store.close()
+        result["db_mb"] = os.path.getsize(os.path.join(path, "chat.db")) / 2**20
+        results["write_behind" if write_behind else "sync"] = result
+    return results
+
+
+def bench_ingestion(args, workdir: str) -> Dict:
+    """Full ingestion of synthetic TXT files, then an incremental re-run over the unchanged files."""
+    from data_ingestion.chunking_embedding import Embedder, TokenChunker
+    from data_ingestion.dedup import ChunkDeduplicator
+    from data_ingestion.ingestion_pipeline import IngestionPipeline
+    from data_ingestion.manifest import IngestionManifest
+
+    data = os.path.join(workdir, "ingest_data")
+    files_dir = os.path.join(workdir, "ingest_files")
+    os.makedirs(data)
+    os.makedirs(files_dir)
+    docs = synthetic_corpus(args.docs, seed=args.seed)
+    files = []
+    per_file = max(1, len(docs) // args.files)
+    for i in range(0, len(docs), per_file):
+        path = os.path.join(files_dir, f"doc_{i:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(docs[i:i + per_file]))
+        files.append(path)
+    mb = sum(os.path.getsize(p) for p in files) / 2**20
+
+    with vector_store_at(data):
+        pipeline = IngestionPipeline(
+            manifest=IngestionManifest(path=os.path.join(data, "ingest_manifest.json")),
+            dedup=ChunkDeduplicator(path=os.path.join(data, "dedup_index.json")),
+            chunker=TokenChunker(tokenizer=FakeTokenizer()),
+            embedder=Embedder(model=FakeEmbeddingModel(args.dim)),
+        )
+        stages = {name: {"items": 0, "busy_s": 0.0, "stall_s": 0.0} for name in ("extract", "chunk", "embed", "store")}
+        counts = {"new": 0, "duplicate": 0}
+        t0 = time.perf_counter()
+        for path in files:
+            report = pipeline.run(path)
+            for name, totals in stages.items():
+                for key in totals:
+                    totals[key] += report[name][key]
+            for key in counts:
+                counts[key] += report[key]
+        elapsed = time.perf_counter() - t0
+        rerun_s, _ = _timed(lambda: [pipeline.run(p) for p in files])
+
+    return {
+        "files": len(files),
+        "mb": mb,
+        "seconds": elapsed,
+        "mb_per_s": mb / elapsed,
+        "chunks_per_s": (counts["new"] + counts["duplicate"]) / elapsed,
+        **counts,
+        "stages": stages,
+        "unchanged_rerun_s": rerun_s,
+    }
+
+
+def bench_web_search(args, workdir: str) -> Dict:
+    """Per-call overhead of the WebSearch wrapper around a fake client."""
+    from backend.web_search import WebSearch
+
+    search = WebSearch(api_key="offline", client=FakeSearchClient())
+    return {"search": latency_stats([_timed(search.search, f"query {i}")[0] for i in range(1000)])}
+
+
+def bench_llm_scheduler(args, workdir: str) -> Dict:
+    """Request throughput and queueing through the LLM scheduler with a fake streaming model."""
+    from llm.scheduler import LLMScheduler
+
+    results = {}
+    for concurrency in (1, 4):
+        scheduler = LLMScheduler(max_concurrency=concurrency)
+        fn = fake_llm(tokens=64, token_latency_s=0.0002)
+        samples = []
+        lock = threading.Lock()
+
+        def client():
+            for _ in range(args.llm_requests // 8):
+                elapsed, _ = _timed(scheduler.run, fn)
+                with lock:
+                    samples.append(elapsed)
+
+        threads = [threading.Thread(target=client) for _ in range(8)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        metrics = scheduler.metrics()
+        results[f"concurrency_{concurrency}"] = {
+            "requests": len(samples),
+            "requests_per_s": len(samples) / elapsed,
+            "request": latency_stats(samples),
+            "wait_p50_ms": metrics["wait_p50"] * 1000,
+            "wait_p95_ms": metrics["wait_p95"] * 1000,
+        }
+    return results
+
+
+SUITES = {
+    "vector_store": bench_vector_store,
+    "chunking": bench_chunking,
+    "embedding": bench_embedding,
+    "reranker": bench_reranker,
+    "chat_store": bench_chat_store,
+    "ingestion": bench_ingestion,
+    "web_search": bench_web_search,
+    "llm_scheduler": bench_llm_scheduler,
+}
+
+
+def git_revision() -> Dict:
+    """Commit of the working tree and whether it has uncommitted changes (None outside git)."""
+    root = os.path.join(os.path.dirname(__file__), '..')
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip() != ""
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def run(args) -> Dict:
+    """
+    Run the selected suites.
+
+    :param args: Parsed command-line arguments.
+    :return: Dict with "meta" (commit, machine, arguments) and per-suite "results".
+    """
+    meta = {
+        **git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+    }
+    results = {}
+    for name in args.suites:
+        workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+        try:
+            t0 = time.perf_counter()
+            # per-call INFO logs (web search, ingestion) would dominate the timings
+            logging.disable(logging.INFO)
+            try:
+                results[name] = SUITES[name](args, workdir)
+            finally:
+                logging.disable(logging.NOTSET)
+            logger.info("Suite %s finished in %.1fs", name, time.perf_counter() - t0)
+        except ImportError as e:
+            logger.warning("Skipping suite %s: %s", name, e)
+            results[name] = {"skipped": str(e)}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {"meta": meta, "results": results}
+
+
+def _flatten(value, prefix: str = "") -> Dict[str, float]:
+    if isinstance(value, dict):
+        flat = {}
+        for k, v in value.items():
+            flat.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def compare(base_path: str, new_path: str) -> List[tuple]:
+    """
+    Pair up the numeric metrics of two result files.
+
+    :return: List of (metric, base value, new value, new/base ratio) tuples for metrics in both.
+    """
+    with open(base_path, 'r') as f:
+        base = _flatten(json.load(f)["results"])
+    with open(new_path, 'r') as f:
+        new = _flatten(json.load(f)["results"])
+    return [(k, base[k], new[k], new[k] / base[k] if base[k] else None) for k in base if k in new]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake models and synthetic data.")
+    parser.add_argument("--suites", nargs="+", choices=list(SUITES), default=list(SUITES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000],
+                        help="vector store sizes (1000000 needs several GB of memory and disk)")
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimension")
+    parser.add_argument("--queries", type=int, default=200, help="search queries per store size")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--docs", type=int, default=500, help="synthetic documents for chunking/embedding/ingestion")
+    parser.add_argument("--files", type=int, default=20, help="files the ingestion documents are spread over")
+    parser.add_argument("--messages", type=int, default=20000, help="chat messages appended per ChatStore mode")
+    parser.add_argument("--llm-requests", type=int, default=200, help="requests sent through the LLM scheduler")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        for metric, old, new, ratio in compare(*args.compare):
+            print(f"{metric:70s} {old:14.4f} {new:14.4f} {'' if ratio is None else f'{ratio:8.3f}x'}")
+        return 0
+
+    report = run(args)
+    out = args.out
+    if out is None:
+        commit = (report["meta"]["commit"] or "nogit")[:10] + ("-dirty" if report["meta"]["dirty"] else "")
+        out = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+'''
+Bulk ingestion of a directory tree or list of files.
+
+Usage:
+    python -m data_ingestion.bulk_ingest docs/ reports/q3.pdf --workers 4
+
+Extraction and chunking run in a process pool across files; embedding and
+store writes run in the main process with one shared model, batching chunks
+from different files together. Completed files are appended to a checkpoint
+file, so an interrupted run resumes where it stopped. Chunks duplicating an
+already stored chunk are not embedded (see data_ingestion.dedup).
+'''
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from data_ingestion.text_extraction import DocumentExtractor
+from data_ingestion.chunking_embedding import TokenChunker, Embedder, iter_chunks, token_length_stats
+from data_ingestion.vector_store import VectorStore, DATA_PATH
+from data_ingestion.manifest import IngestionManifest, chunk_guid
+from data_ingestion.dedup import ChunkDeduplicator, source_ref
+from data_ingestion.ingestion_pipeline import chunk_metadata
+from utils.logging_config import configure_logging_from_env, get_logger
+
+logger = get_logger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
+def discover_files(paths: Iterable[str]) -> List[str]:
+    """
+    Expand files and directories into a sorted list of supported file paths.
+
+    :param paths: Files and/or directories.
+    :return: Absolute paths of supported documents.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names if n.lower().endswith(SUPPORTED_EXTENSIONS))
+        elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+            files.append(path)
+        else:
+            logger.warning("Skipping unsupported path: %s", path)
+    return sorted(os.path.abspath(f) for f in files)
+
+
+def _extract_and_chunk(file_path: str) -> Tuple[List[Tuple[str, int, tuple]], List[int]]:
+    """
+    Worker: extract and chunk one file.
+
+    Returns (chunk text, page, byte offset) tuples and the chunks' token counts.
+    """
+    extractor = DocumentExtractor(pdf_workers=1)  # parallelism is across files here
+    chunker = _worker_chunker()
+    chunker.reset_stats()  # drop lengths left by a file that failed midway
+    offsets = deque()
+
+    def segments():
+        for index, segment in enumerate(extractor.extract(file_path)):
+            offsets.append((index, segment.get("offset")))
+            yield segment["text"]
+
+    chunks = []
+    for c, segment_index in iter_chunks(chunker, segments()):
+        while len(offsets) > 1 and offsets[0][0] < segment_index:
+            offsets.popleft()
+        chunks.append((c, segment_index + 1, offsets[0][1] if offsets else None))
+    return chunks, chunker.reset_stats()
+
+
+_chunker = None
+
+
+def _worker_chunker() -> TokenChunker:
+    # one tokenizer per worker process, reused across files; its token-length
+    # stats are taken per file, so they do not accumulate in long runs
+    global _chunker
+    if _chunker is None:
+        _chunker = TokenChunker()
+    return _chunker
+
+
+class Checkpoint:
+    """
+    Append-only record of files completed by a bulk run.
+
+    Each entry keeps the file's size and mtime at ingestion, so a file changed
+    since then is not taken as done when the run resumes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, Tuple] = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.done[entry["file_path"]] = (entry.get("size"), entry.get("mtime"))
+
+    def is_done(self, file_path: str) -> bool:
+        """
+        Return True if `file_path` was completed and has not changed since.
+        """
+        recorded = self.done.get(file_path)
+        if recorded is None:
+            return False
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False
+        return recorded == (st.st_size, st.st_mtime)
+
+    def mark_done(self, file_path: str, chunks: int, info: Dict) -> None:
+        """
+        :param info: Stat info the file was ingested with (size and mtime, as from `IngestionManifest.check`).
+        """
+        self.done[file_path] = (info["size"], info["mtime"])
+        with open(self.path, 'a') as f:
+            entry = {"file_path": file_path, "chunks": chunks, "size": info["size"], "mtime": info["mtime"]}
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BulkIngestor:
+    """
+    Ingest many files with cross-file parallelism and a shared embedding stage.
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        batch_size: int = 64,
+        checkpoint_path: str = None,
+        manifest: IngestionManifest = None,
+        progress_every: float = 10.0,
+        dedup: ChunkDeduplicator = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.checkpoint = Checkpoint(checkpoint_path or os.path.join(DATA_PATH, "bulk_ingest.checkpoint.jsonl"))
+        self.manifest = manifest or IngestionManifest()
+        self.dedup = dedup or ChunkDeduplicator()
+        self.progress_every = progress_every
+        self.embedder = Embedder()
+        self.vector_store = VectorStore()
+
+    def run(self, paths: Iterable[str], force: bool = False) -> Dict:
+        """
+        Ingest every supported file under `paths`.
+
+        :param paths: Files and/or directories.
+        :param force: Re-ingest files even if the manifest or checkpoint says they are unchanged.
+        :return: Summary with file/chunk counts, elapsed time, rates and the
+            chunk token-length distribution.
+        """
+        files = discover_files(paths)
+        todo = []
+        infos = {}
+        skipped = 0
+        for f in files:
+            if not force and self.checkpoint.is_done(f):
+                skipped += 1
+                continue
+            unchanged, info = self.manifest.check(f)
+            if unchanged and not force:
+                skipped += 1
+                continue
+            infos[f] = info
+            todo.append(f)
+        logger.info("Bulk ingest: %d files found, %d to ingest, %d skipped", len(files), len(todo), skipped)
+
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._docs_done = 0
+        self._chunks_done = 0
+        self._duplicates = 0
+        self._failed = []
+        self._token_lengths = []
+        self._total = len(todo)
+
+        # per-file bookkeeping until all of its new chunks are stored
+        self._open_files: Dict[str, Dict] = {}
+        self._buffer: List[Tuple[str, tuple]] = []
+        # canonical chunks waiting in the buffer, which later duplicates may refer to
+        self._fresh = set()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            queue_files = deque(todo)
+            while queue_files or pending:
+                while queue_files and len(pending) < 2 * self.workers:
+                    f = queue_files.popleft()
+                    pending.append((f, executor.submit(_extract_and_chunk, f)))
+                file_path, future = pending.popleft()
+                try:
+                    chunks, lengths = future.result()
+                except Exception as e:
+                    logger.error("Extraction failed for %s: %s", file_path, e)
+                    self._failed.append(file_path)
+                    continue
+                self._token_lengths.extend(lengths)
+                self._plan_file(file_path, infos[file_path], chunks)
+                while len(self._buffer) >= self.batch_size:
+                    self._flush(self.batch_size)
+                self._report()
+        while self._buffer:
+            self._flush(self.batch_size)
+        self.dedup.save()
+
+        summary = self._summary(skipped)
+        if not self._failed:
+            self.checkpoint.clear()
+        logger.info(
+            "Bulk ingest finished: %d docs, %d chunks in %.1fs (%.2f docs/s, %.1f chunks/s), %d failed",
+            summary["docs"], summary["chunks"], summary["elapsed_s"],
+            summary["docs_per_s"], summary["chunks_per_s"], len(self._failed),
+        )
+        logger.info("Chunk token lengths: %s", summary["chunk_tokens"])
+        return summary
+
+    def _plan_file(self, file_path: str, info: Dict, chunks: List[Tuple[str, int, tuple]]) -> None:
+        entry = self.manifest.get(file_path)
+        known_ids = {
+            g for g in entry["chunk_ids"] if self.vector_store.get_data(self.dedup.resolve(g)) is not None
+        } if entry else set()
+        occurrences = {}
+        seen_ids = []
+        pending = {}
+        new = 0
+        for chunk_index, (text, page, byte_offset) in enumerate(chunks, 1):
+            n = occurrences.get(text, 0)
+            occurrences[text] = n + 1
+            guid = chunk_guid(file_path, text, n)
+            seen_ids.append(guid)
+            metadata = chunk_metadata(file_path, text, chunk_index, page, byte_offset)
+            if guid in known_ids:
+                self.dedup.attach(self.vector_store, pending, guid, metadata)
+                continue
+            if self.dedup.match(guid, text, self._exists) is not None or self.vector_store.get_data(guid) is not None:
+                action = "duplicate"
+            else:
+                action = "new"
+                self._fresh.add(guid)
+            # duplicates are buffered too, so they are attached after their canonical chunk is stored
+            self._buffer.append((file_path, (guid, text, metadata, action)))
+            new += 1
+        if pending:
+            self.vector_store.update_many((g, None, None, m) for g, m in pending.items())
+        self._open_files[file_path] = {
+            "info": info,
+            "seen_ids": seen_ids,
+            "removed": known_ids.difference(seen_ids),
+            "remaining": new,
+        }
+        if new == 0:
+            self._finish_file(file_path)
+
+    def _exists(self, guid: str) -> bool:
+        return guid in self._fresh or self.vector_store.get_data(guid) is not None
+
+    def _flush(self, n: int) -> None:
+        batch, self._buffer = self._buffer[:n], self._buffer[n:]
+        new = [item for _, item in batch if item[3] == "new"]
+        embeddings = self.embedder.embed_batch([text for _, text, _, _ in new])
+        records = []
+        for (guid, text, metadata, _), embedding in zip(new, embeddings):
+            records.append((guid, text, embedding, dict(metadata, sources=[source_ref(guid, metadata)])))
+            self._fresh.discard(guid)
+        if records:
+            self.vector_store.add_many(records)
+        pending = {}
+        for _, (guid, _, metadata, action) in batch:
+            if action == "duplicate":
+                self.dedup.attach(self.vector_store, pending, guid, metadata)
+        if pending:
+            self.vector_store.update_many((g, None, None, m) for g, m in pending.items())
+        self._chunks_done += len(records)
+        self._duplicates += len(batch) - len(records)
+        for file_path, _ in batch:
+            state = self._open_files[file_path]
+            state["remaining"] -= 1
+            if state["remaining"] == 0:
+                self._finish_file(file_path)
+
+    def _finish_file(self, file_path: str) -> None:
+        state = self._open_files.pop(file_path)
+        if state["removed"]:
+            pending = {}
+            deletions = [g for g in (self.dedup.detach(self.vector_store, pending, r) for r in state["removed"]) if g]
+            if pending:
+                self.vector_store.update_many((g, None, None, m) for g, m in pending.items())
+            if deletions:
+                self.vector_store.delete_many(deletions)
+        self.manifest.update(file_path, state["info"], state["seen_ids"])
+        self.checkpoint.mark_done(file_path, len(state["seen_ids"]), state["info"])
+        self._docs_done += 1
+
+    def _report(self) -> None:
+        now = time.perf_counter()
+        if now - self._last_report < self.progress_every:
+            return
+        self._last_report = now
+        self.dedup.save()
+        elapsed = now - self._start
+        logger.info(
+            "Progress: %d/%d docs, %d chunks, %d duplicates | %.2f docs/s, %.1f chunks/s",
+            self._docs_done, self._total, self._chunks_done, self._duplicates,
+            self._docs_done / elapsed, self._chunks_done / elapsed,
+        )
+
+    def _summary(self, skipped: int) -> Dict:
+        elapsed = time.perf_counter() - self._start
+        return {
+            "docs": self._docs_done,
+            "chunks": self._chunks_done,
+            "duplicates": self._duplicates,
+            "skipped": skipped,
+            "failed": list(self._failed),
+            "elapsed_s": elapsed,
+            "docs_per_s": self._docs_done / elapsed if elapsed else 0.0,
+            "chunks_per_s": self._chunks_done / elapsed if elapsed else 0.0,
+            # workers chunk with the same settings as this process's default chunker
+            "chunk_tokens": token_length_stats(self._token_lengths, _worker_chunker().target_tokens),
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest a directory tree or list of documents into the vector store.")
+    parser.add_argument("paths", nargs="+", help="Files and/or directories to ingest")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding batch")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file used to resume interrupted runs")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files even if unchanged")
+    args = parser.parse_args(argv)
+
+    configure_logging_from_env()
+    ingestor = BulkIngestor(workers=args.workers, batch_size=args.batch_size, checkpoint_path=args.checkpoint)
+    summary = ingestor.run(args.paths, force=args.force)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import re
 from embedding.modernbert import EmbeddingModel
 import numpy as np
 
@@ -19,13 +20,206 @@ class Chunker:
             current_chunks = [chunk for chunk in current_chunks if chunk.strip()]
             # Add the chunks to the list
             chunks.extend(current_chunks)
-        # Remove duplicates
+        # Duplicates are removed corpus-wide at ingestion time (data_ingestion.dedup)
         return chunks
-    
+
+    def chunk_segments(self, segments: list) -> list:
+        """
+        Chunk consecutive document segments (pages, paragraphs).
+
+        :param segments: Segment texts.
+        :return: List of (chunk, index of the segment the chunk starts in) tuples.
+        """
+        return [(c, i) for i, text in enumerate(segments) for c in self.chunk_text([text])]
+
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"[.!?][\"')\]]*\s+")
+
+
+class TokenChunker:
+    """
+    Chunker that sizes chunks in embedding-model tokens.
+
+    Each document is tokenized once with a fast tokenizer; chunk boundaries are
+    picked from the token offsets, preferring a paragraph break near
+    `target_tokens`, then a sentence break, and cutting at `max_tokens` only when
+    neither exists. Consecutive chunks overlap by about `overlap_tokens`,
+    starting on a sentence boundary when one falls inside the overlap.
+
+    The tokenizer is loaded on first use unless one is passed in. The token
+    count of every chunk produced is recorded, and `token_length_report`
+    summarizes them.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "nomic-ai/modernbert-embed-base",
+        tokenizer=None,
+        target_tokens: int = 256,
+        max_tokens: int = 480,
+        overlap_tokens: int = 32,
+    ):
+        self._model_name = model_name
+        self._provided_tokenizer = tokenizer
+        self.tokenizer = None
+        self.target_tokens = target_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, target_tokens // 2)
+        self._lengths = []
+
+    def _ensure_tokenizer_loaded(self):
+        if self.tokenizer is not None:
+            return
+        if self._provided_tokenizer is not None:
+            self.tokenizer = self._provided_tokenizer
+        else:
+            from transformers import AutoTokenizer
+
+            self.tokenizer = AutoTokenizer.from_pretrained(self._model_name, use_fast=True)
+
+    def chunk_spans(self, text: str) -> list:
+        """
+        Split one document into chunk spans.
+
+        :param text: Document text.
+        :return: List of (start char, end char, token count) tuples.
+        """
+        self._ensure_tokenizer_loaded()
+        enc = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = np.asarray(enc["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+        n = len(offsets)
+        if n == 0:
+            return []
+        starts = offsets[:, 0]
+        # token index at which each paragraph/sentence following a break begins
+        para = np.unique(np.searchsorted(starts, [m.end() for m in _PARAGRAPH_BREAK.finditer(text)]))
+        sent = np.unique(np.searchsorted(starts, [m.end() for m in _SENTENCE_BREAK.finditer(text)]))
+
+        spans = []
+        s = 0
+        while s < n:
+            if n - s <= self.max_tokens:
+                end = n
+            else:
+                lo, hi, ideal = s + self.target_tokens // 2, s + self.max_tokens, s + self.target_tokens
+                end = hi
+                for candidates in (para, sent):
+                    window = candidates[np.searchsorted(candidates, lo, side="right"):np.searchsorted(candidates, hi, side="right")]
+                    if len(window):
+                        end = int(window[np.argmin(np.abs(window - ideal))])
+                        break
+            spans.append((int(offsets[s, 0]), int(offsets[end - 1, 1]), end - s))
+            if end >= n:
+                break
+            next_s = end - self.overlap_tokens
+            snap = sent[np.searchsorted(sent, next_s):np.searchsorted(sent, end)]
+            s = max(int(snap[0]) if len(snap) else next_s, s + 1)
+        return spans
+
+    def chunk_text(self, texts: list) -> list:
+        """
+        Chunk texts joined as one document (so short paragraphs are merged).
+
+        :param texts: Text segments of one document.
+        :return: List of chunk strings.
+        """
+        return [c for c, _ in self.chunk_segments(texts)]
+
+    def chunk_segments(self, segments: list) -> list:
+        """
+        Chunk consecutive document segments (pages, paragraphs) as one text.
+
+        :param segments: Segment texts.
+        :return: List of (chunk, index of the segment the chunk starts in) tuples.
+        """
+        parts = [t or "" for t in segments]
+        bounds = np.cumsum([len(t) + 2 for t in parts])  # "\n\n" separators
+        text = "\n\n".join(parts)
+        chunks = []
+        for start, end, n_tokens in self.chunk_spans(text):
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append((chunk, int(np.searchsorted(bounds, start, side="right"))))
+                self._lengths.append(n_tokens)
+        return chunks
+
+    def token_length_report(self) -> dict:
+        """
+        Token-length distribution of all chunks produced so far.
+
+        :return: Dict with count, min, mean, p50, p95, max and the share over target.
+        """
+        return token_length_stats(self._lengths, self.target_tokens)
+
+    def reset_stats(self) -> list:
+        """
+        Forget the recorded chunk token lengths.
+
+        :return: The lengths recorded since the last reset.
+        """
+        lengths, self._lengths = self._lengths, []
+        return lengths
+
+
+def token_length_stats(lengths: list, target_tokens: int) -> dict:
+    """
+    Summarize chunk token lengths, e.g. collected from several chunkers.
+
+    :param lengths: Token count of each chunk.
+    :param target_tokens: Target chunk size the share over target is measured against.
+    :return: Dict with count, min, mean, p50, p95, max and the share over target.
+    """
+    if not lengths:
+        return {"count": 0}
+    lengths = np.asarray(lengths)
+    return {
+        "count": int(len(lengths)),
+        "min": int(lengths.min()),
+        "mean": float(lengths.mean()),
+        "p50": float(np.percentile(lengths, 50)),
+        "p95": float(np.percentile(lengths, 95)),
+        "max": int(lengths.max()),
+        "over_target": float((lengths > target_tokens).mean()),
+    }
+
+
+def iter_chunks(chunker, segments, buffer_chars: int = 8000):
+    """
+    Stream chunks from an iterator of segment texts.
+
+    Segments are buffered until about `buffer_chars` characters so small
+    segments (DOCX paragraphs, short pages) can be merged into full-size chunks,
+    then chunked together; memory stays bounded by the buffer size.
+
+    :param chunker: Chunker or TokenChunker.
+    :param segments: Iterable of segment texts.
+    :param buffer_chars: Characters to buffer before chunking.
+    :return: Iterator of (chunk, segment index) tuples.
+    """
+    buffer = []
+    base = 0
+    size = 0
+    for text in segments:
+        buffer.append(text)
+        size += len(text)
+        if size >= buffer_chars:
+            for chunk, i in chunker.chunk_segments(buffer):
+                yield chunk, base + i
+            base += len(buffer)
+            buffer, size = [], 0
+    if buffer:
+        for chunk, i in chunker.chunk_segments(buffer):
+            yield chunk, base + i
+
 class Embedder:
 
-    def __init__(self):
-        self.model = EmbeddingModel()
+    def __init__(self, model=None):
+        """
+        :param model: EmbeddingModel to use, or any object with the same `encode`/`encode_batch`
+            interface (e.g. a fake model for offline tests and benchmarks); loaded by default.
+        """
+        self.model = model if model is not None else EmbeddingModel()
 
     def embed(self, chunks: list) -> list:
         embeddings = []
@@ -39,6 +233,17 @@ class Embedder:
                 continue
             embeddings.append(embedding)
         return embeddings
+
+    def embed_batch(self, chunks: list) -> list:
+        """
+        Embed several chunks in one batched forward pass.
+
+        :param chunks: Chunk strings.
+        :return: One embedding per chunk, in order.
+        """
+        if not chunks:
+            return []
+        return list(self.model.encode_batch(chunks, "search_document"))
     
 
 if __name__ == "__main__":
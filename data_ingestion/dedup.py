@@ -0,0 +1,294 @@
+import os
+import re
+import json
+import copy
+import hashlib
+import threading
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+_WORD = re.compile(r"\w+")
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_MASK64 = (1 << 64) - 1
+# odd multiplier and per-permutation seeds for MinHash over 64-bit shingle hashes
+_MINHASH_MULT = 0x9E3779B97F4A7C15
+_MINHASH_SEEDS = [int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(), "big") for i in range(64)]
+
+
+def normalize(text):
+    """
+    Normalize chunk text for exact-duplicate hashing (case and whitespace insensitive).
+    """
+    return " ".join(text.lower().split())
+
+
+def _shingle_hashes(text):
+    words = _WORD.findall(text.lower())
+    if len(words) < 8:
+        return None
+    return [
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + 3]).encode(), digest_size=8).digest(), "big")
+        for i in range(len(words) - 2)
+    ]
+
+
+def simhash(text):
+    """
+    64-bit SimHash of a text over word 3-shingles.
+
+    :param text: Chunk text.
+    :return: Fingerprint as an int, or None if the text is too short to fingerprint.
+    """
+    hashes = _shingle_hashes(text)
+    if hashes is None:
+        return None
+    weights = [0] * 64
+    for h in hashes:
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def minhash(text, num_perm=16):
+    """
+    MinHash signature of a text's set of word 3-shingles.
+
+    :param text: Chunk text.
+    :param num_perm: Signature length (at most 64).
+    :return: List of 32-bit ints, or None if the text is too short to fingerprint.
+    """
+    hashes = _shingle_hashes(text)
+    if hashes is None:
+        return None
+    hashes = set(hashes)
+    return [
+        min(((h ^ seed) * _MINHASH_MULT & _MASK64) >> 32 for h in hashes)
+        for seed in _MINHASH_SEEDS[:num_perm]
+    ]
+
+
+def source_ref(guid, metadata):
+    """
+    Reference from a stored chunk back to one place it occurs in the corpus.
+
+    The owner of an uploaded document is kept, so access is checked per occurrence.
+    """
+    ref = {
+        "chunk_id": guid,
+        "file_path": metadata.get("file_path"),
+        "chunk_index": metadata.get("chunk_index"),
+        "page": metadata.get("page"),
+    }
+    if metadata.get("user_id") is not None:
+        ref["user_id"] = metadata["user_id"]
+    return ref
+
+
+class ChunkDeduplicator:
+    """
+    Global exact and near-duplicate chunk index used at ingestion time.
+
+    Exact duplicates are found by a hash of the normalized text. Near-duplicate
+    candidates are SimHash fingerprints within `max_distance` bits, looked up
+    through 4 x 16-bit LSH bands (with at most 3 differing bits at least one band
+    matches exactly); a candidate is accepted only if the MinHash estimate of
+    the shingle-set Jaccard similarity reaches `min_jaccard`, which rejects
+    templated text (tables, logs) whose fingerprints collide.
+
+    A duplicate chunk is not embedded or stored: its content-derived GUID becomes
+    an alias of the canonical chunk, and the canonical chunk's metadata lists
+    every occurrence under "sources".
+    """
+
+    def __init__(self, path=None, max_distance=3, min_jaccard=0.8):
+        self.path = path or os.path.join(DATA_PATH, "dedup_index.json")
+        self.max_distance = max_distance
+        self.min_jaccard = min_jaccard
+        self.exact = {}
+        self.fingerprints = {}
+        self.signatures = {}
+        self.aliases = {}
+        self._bands = {}
+        # reverse indexes, so forgetting a chunk touches only its own entries
+        self._exact_keys = {}
+        self._aliases_of = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.exact = data.get("exact", {})
+            self.aliases = data.get("aliases", {})
+            self.signatures = data.get("signatures", {})
+            for guid, fp in data.get("fingerprints", {}).items():
+                self._index_fingerprint(guid, fp)
+            for key, guid in self.exact.items():
+                self._exact_keys.setdefault(guid, set()).add(key)
+            for alias, canonical in self.aliases.items():
+                self._aliases_of.setdefault(canonical, set()).add(alias)
+
+    def _band_keys(self, fp):
+        mask = (1 << _BAND_BITS) - 1
+        return [f"{b}:{(fp >> (b * _BAND_BITS)) & mask}" for b in range(_BANDS)]
+
+    def _index_fingerprint(self, guid, fp):
+        self.fingerprints[guid] = fp
+        for key in self._band_keys(fp):
+            self._bands.setdefault(key, set()).add(guid)
+
+    def _set_alias(self, guid, canonical):
+        self._drop_alias(guid)
+        self.aliases[guid] = canonical
+        self._aliases_of.setdefault(canonical, set()).add(guid)
+
+    def _drop_alias(self, guid):
+        canonical = self.aliases.pop(guid, None)
+        if canonical is not None:
+            others = self._aliases_of.get(canonical)
+            if others is not None:
+                others.discard(guid)
+                if not others:
+                    del self._aliases_of[canonical]
+
+    def resolve(self, guid):
+        """
+        Return the canonical GUID a chunk GUID is stored under.
+        """
+        return self.aliases.get(guid, guid)
+
+    def match(self, guid, text, exists=None):
+        """
+        Find the canonical chunk `text` duplicates, or register it as canonical.
+
+        :param guid: Content-derived GUID of the chunk.
+        :param text: Chunk text.
+        :param exists: Optional predicate telling whether a canonical GUID is actually
+            stored; index entries failing it (e.g. from an interrupted run) are ignored.
+        :return: Canonical GUID if the chunk is a duplicate of another chunk, else None.
+        """
+        exact_key = hashlib.sha1(normalize(text).encode()).hexdigest()
+        fp = simhash(text)
+        signature = minhash(text) if fp is not None else None
+        with self._lock:
+            canonical = self.exact.get(exact_key)
+            if canonical is not None and exists is not None and canonical != guid and not exists(canonical):
+                canonical = None
+            if canonical is None and fp is not None:
+                candidates = set()
+                for key in self._band_keys(fp):
+                    candidates.update(self._bands.get(key, ()))
+                best = None
+                for cand in candidates:
+                    if cand == guid or (exists is not None and not exists(cand)):
+                        continue
+                    distance = bin(self.fingerprints[cand] ^ fp).count("1")
+                    if distance > self.max_distance or (best is not None and distance >= best[0]):
+                        continue
+                    other = self.signatures.get(cand)
+                    if other is None or sum(a == b for a, b in zip(signature, other)) < self.min_jaccard * len(signature):
+                        continue
+                    best = (distance, cand)
+                canonical = best[1] if best else None
+            if canonical is not None and canonical != guid:
+                self._set_alias(guid, canonical)
+                return canonical
+            previous = self.exact.get(exact_key)
+            if previous is not None and previous != guid:
+                self._exact_keys.get(previous, set()).discard(exact_key)
+            self.exact[exact_key] = guid
+            self._exact_keys.setdefault(guid, set()).add(exact_key)
+            if fp is not None:
+                self._index_fingerprint(guid, fp)
+                self.signatures[guid] = signature
+            return None
+
+    def forget(self, guid):
+        """
+        Remove a canonical chunk (and any aliases pointing at it) from the index.
+        """
+        with self._lock:
+            for key in self._exact_keys.pop(guid, ()):
+                if self.exact.get(key) == guid:
+                    del self.exact[key]
+            fp = self.fingerprints.pop(guid, None)
+            self.signatures.pop(guid, None)
+            if fp is not None:
+                for key in self._band_keys(fp):
+                    self._bands.get(key, set()).discard(guid)
+            for alias in self._aliases_of.pop(guid, ()):
+                if self.aliases.get(alias) == guid:
+                    del self.aliases[alias]
+
+    def _current_metadata(self, vector_store, pending, canonical):
+        current = pending.get(canonical)
+        if current is None:
+            data = vector_store.get_data(canonical)
+            if data is None:
+                return None
+            current = copy.deepcopy(data["metadata"]) or {}
+            if "sources" not in current:
+                # records written before dedup reference only themselves
+                current["sources"] = [source_ref(canonical, current)]
+        return current
+
+    def attach(self, vector_store, pending, guid, metadata):
+        """
+        Record an occurrence of chunk `guid` in its canonical chunk's sources.
+
+        :param vector_store: Store holding the canonical chunk.
+        :param pending: Dict canonical GUID -> metadata being accumulated for one
+            `update_many` call, so several occurrences in a batch are merged.
+        :param guid: Content-derived GUID of the occurrence.
+        :param metadata: Metadata of the occurrence.
+        """
+        canonical = self.resolve(guid)
+        current = self._current_metadata(vector_store, pending, canonical)
+        if current is None:
+            return
+        sources = [s for s in current["sources"] if s["chunk_id"] != guid]
+        sources.append(source_ref(guid, metadata))
+        if canonical == guid:
+            current.update(metadata)
+        current["sources"] = sources
+        pending[canonical] = current
+
+    def detach(self, vector_store, pending, guid):
+        """
+        Remove the occurrence `guid` from its canonical chunk.
+
+        :return: The canonical GUID if no occurrences remain and it should be deleted, else None.
+        """
+        canonical = self.resolve(guid)
+        with self._lock:
+            self._drop_alias(guid)
+        current = self._current_metadata(vector_store, pending, canonical)
+        if current is None:
+            return None
+        sources = [s for s in current["sources"] if s["chunk_id"] != guid]
+        if not sources:
+            pending.pop(canonical, None)
+            self.forget(canonical)
+            return canonical
+        if canonical == guid:
+            # the primary occurrence went away; promote the next one
+            current.update({k: v for k, v in sources[0].items() if k != "chunk_id"})
+        current["sources"] = sources
+        pending[canonical] = current
+        return None
+
+    def save(self):
+        """
+        Atomically write the index to disk.
+        """
+        with self._lock:
+            data = {
+                "exact": self.exact,
+                "fingerprints": self.fingerprints,
+                "signatures": self.signatures,
+                "aliases": self.aliases,
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
@@ -1,23 +1,125 @@
-from text_extraction import DocumentExtractor
-from chunking_embedding import Chunker, Embedder
-from vector_store import VectorStore
-import uuid
-from utils.logging_config import configure_logging_from_env, get_logger
-
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import queue
+import threading
+import time
+from collections import deque
+from data_ingestion.text_extraction import DocumentExtractor
+from data_ingestion.chunking_embedding import TokenChunker, Embedder, iter_chunks
+from data_ingestion.vector_store import VectorStore
+from data_ingestion.manifest import IngestionManifest, chunk_guid
+from data_ingestion.dedup import ChunkDeduplicator, source_ref
+from utils.logging_config import configure_logging_from_env, get_logger
+
+
+_DONE = object()
+
+
+class _StageStats:
+    """Counters for one pipeline stage: work time vs. time blocked on its queues."""
 
-class IngestionPipeline:
     def __init__(self):
+        self.items = 0
+        self.busy = 0.0
+        self.stall = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "busy_s": self.busy,
+            "stall_s": self.stall,
+            "items_per_s": self.items / self.busy if self.busy else 0.0,
+        }
+
+
+def _put(q: queue.Queue, item, stop: threading.Event, stats: _StageStats) -> bool:
+    """Put with backpressure; returns False if the pipeline was stopped."""
+    t0 = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    finally:
+        stats.stall += time.perf_counter() - t0
+
+
+def _get(q: queue.Queue, stop: threading.Event, stats: _StageStats):
+    """Get from an upstream stage; returns None if the pipeline was stopped."""
+    t0 = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+    finally:
+        stats.stall += time.perf_counter() - t0
+
+
+def _timed_iter(iterable, stats: _StageStats):
+    """Yield from `iterable`, charging the time spent producing items as busy time."""
+    it = iter(iterable)
+    while True:
+        t0 = time.perf_counter()
+        stall0 = stats.stall
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            # time blocked on queues inside the iterator is already counted as stall
+            stats.busy += time.perf_counter() - t0 - (stats.stall - stall0)
+        yield item
+
+
+def chunk_metadata(file_path: str, text: str, chunk_index: int, page: int, byte_offset=None, user_id=None) -> dict:
+    """Metadata stored alongside each chunk in the vector store.
+
+    `byte_offset` is the (start, end) byte range of the segment the chunk starts
+    in, for formats streamed by offset (TXT). `user_id` is the owner of an
+    uploaded document; chunks without one are shared with every user.
+    """
+    metadata = {
+        "file_path": file_path,
+        "length": len(text),
+        "chunk_index": chunk_index,
+        "page": page,
+    }
+    if byte_offset is not None:
+        metadata["byte_offset"] = list(byte_offset)
+    if user_id is not None:
+        metadata["user_id"] = user_id
+    return metadata
+
+
+class IngestionPipeline:
+    def __init__(
+        self,
+        batch_size: int = 32,
+        queue_size: int = 4,
+        manifest: IngestionManifest = None,
+        dedup: ChunkDeduplicator = None,
+        chunker: TokenChunker = None,
+        embedder: Embedder = None,
+    ):
         # configure based on env and create a module logger
         configure_logging_from_env(log_file=None)
         self.logger = get_logger(__name__)
         self.logger.info("Initializing IngestionPipeline")
         self.extractor = DocumentExtractor()
-        self.chunker = Chunker()
-        self.embedder = Embedder()
+        self.chunker = chunker or TokenChunker()
+        self.embedder = embedder or Embedder()
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.manifest = manifest or IngestionManifest()
+        self.dedup = dedup or ChunkDeduplicator()
         self.logger.info("IngestionPipeline components initialized successfully")
 
     def _setup_logging(self):
@@ -25,54 +127,223 @@ class IngestionPipeline:
         # is performed centrally via utils.logging_config.configure_logging_from_env
         pass
 
-    def run(self, file_path: str):
+    def run(self, file_path: str, force: bool = False, progress=None, user_id: str = None) -> dict:
         """
         Run the ingestion pipeline.
 
+        Extraction, chunking, embedding and store writes run as concurrent stages
+        connected by bounded queues, so at most `queue_size` pages/batches are in
+        flight between two stages regardless of document size.
+
+        Re-ingestion is incremental: files unchanged since the manifest entry are
+        skipped, chunk GUIDs are derived from content so unchanged chunks keep
+        their stored embedding, and chunks no longer present are deleted.
+
+        Chunks that exactly or nearly duplicate an already stored chunk (from any
+        file) are not embedded; they are recorded as an extra source of that chunk.
+
         :param file_path: Path to the document.
+        :param force: Re-ingest even if the manifest says the file is unchanged.
+        :param progress: Optional callback `progress(counts)` invoked after each batch
+            is committed to the store, with the running "new"/"unchanged" counts.
+        :param user_id: Owner of the document; its chunks are only retrieved for this
+            user (see `Retriever.retrieve`). Without one the document is shared.
+        :return: Per-stage statistics (items, busy and stall seconds, throughput)
+            plus "skipped", "new", "duplicate", "unchanged" and "deleted" chunk counts.
         """
         try:
             self.logger.info(f"Starting ingestion pipeline for file: {file_path}")
-            
-            # Extract text and images
-            self.logger.debug("Extracting text from document")
-            text = self.extractor.extract_text(file_path)
-            self.logger.info(f"Successfully extracted {len(text)} text segments")
-            
-            self.logger.debug("Extracting images from document")
-            images = self.extractor.extract_images(file_path)
-            self.logger.info(f"Successfully extracted {len(images)} images")
-
-            # Chunk text
-            self.logger.debug("Chunking extracted text")
-            chunks = self.chunker.chunk_text(text)
-            self.logger.info(f"Created {len(chunks)} chunks from text")
-
-            # Create embeddings
-            self.logger.debug("Generating embeddings for chunks")
-            embeddings = self.embedder.embed(chunks)
-            self.logger.info(f"Generated {len(embeddings)} embeddings")
-
-            # Store in vector database
+            abs_path = os.path.abspath(file_path)
+            unchanged, file_info = self.manifest.check(abs_path)
+            if unchanged and not force:
+                self.logger.info(f"Skipping unchanged file: {file_path}")
+                return {"skipped": True}
+
             self.logger.debug("Initializing vector store")
             vector_store = VectorStore()
-            
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings), 1):
-                try:
-                    guid = str(uuid.uuid4())
-                    metadata = {
-                        "file_path": file_path,
-                        "length": len(chunk),
-                        "chunk_index": i
-                    }
-                    vector_store.add_data(guid, chunk, embedding, metadata)
-                    self.logger.debug(f"Added chunk {i}/{len(chunks)} with GUID: {guid}")
-                except Exception as e:
-                    self.logger.error(f"Failed to add chunk {i} to vector store: {str(e)}")
-                    raise
-            
-            self.logger.info("Ingestion pipeline completed successfully")
-            
+
+            # chunks recorded in the manifest but missing from the store are re-embedded
+            entry = self.manifest.get(abs_path)
+            known_ids = {
+                g for g in entry["chunk_ids"] if vector_store.get_data(self.dedup.resolve(g)) is not None
+            } if entry else set()
+            seen_ids = []
+            # canonical chunks created by this run, stored by the time a duplicate refers to them
+            fresh = set()
+
+            def exists(guid):
+                return guid in fresh or vector_store.get_data(guid) is not None
+
+            stats = {name: _StageStats() for name in ("extract", "chunk", "embed", "store")}
+            stop = threading.Event()
+            errors = []
+            pages = queue.Queue(maxsize=self.queue_size)
+            batches = queue.Queue(maxsize=self.queue_size)
+            embedded = queue.Queue(maxsize=self.queue_size)
+
+            def stage(name, target):
+                def runner():
+                    try:
+                        target(stats[name])
+                    except Exception as e:
+                        errors.append(e)
+                        stop.set()
+                return threading.Thread(target=runner, name=f"ingest-{name}", daemon=True)
+
+            image_count = [0]
+
+            def extract(st):
+                # single pass over the document; image bytes are never read here
+                for segment in _timed_iter(self.extractor.extract(file_path), st):
+                    st.items += 1
+                    image_count[0] += len(segment["images"])
+                    if not _put(pages, (segment["text"], segment.get("offset")), stop, st):
+                        return
+                _put(pages, _DONE, stop, st)
+
+            def chunk(st):
+                # byte offsets of the segments still buffered by the chunker
+                offsets = deque()
+
+                def segments():
+                    index = 0
+                    while True:
+                        item = _get(pages, stop, st)
+                        if item is _DONE or item is None:
+                            return
+                        text, offset = item
+                        offsets.append((index, offset))
+                        index += 1
+                        yield text
+
+                batch = []
+                chunk_index = 0
+                occurrences = {}
+                # short segments are merged, so each chunk records the page it starts on
+                for c, segment_index in _timed_iter(iter_chunks(self.chunker, segments()), st):
+                    page_num = segment_index + 1
+                    while len(offsets) > 1 and offsets[0][0] < segment_index:
+                        offsets.popleft()
+                    byte_offset = offsets[0][1] if offsets else None
+                    chunk_index += 1
+                    n = occurrences.get(c, 0)
+                    occurrences[c] = n + 1
+                    guid = chunk_guid(abs_path, c, n)
+                    seen_ids.append(guid)
+                    if guid in known_ids:
+                        action = "unchanged"
+                    elif self.dedup.match(guid, c, exists) is not None or vector_store.get_data(guid) is not None:
+                        action = "duplicate"
+                    else:
+                        action = "new"
+                        fresh.add(guid)
+                    batch.append((guid, c, page_num, chunk_index, byte_offset, action))
+                    st.items += 1
+                    if len(batch) >= self.batch_size:
+                        if not _put(batches, batch, stop, st):
+                            return
+                        batch = []
+                if stop.is_set():
+                    return
+                if batch:
+                    _put(batches, batch, stop, st)
+                _put(batches, _DONE, stop, st)
+
+            def embed(st):
+                while True:
+                    batch = _get(batches, stop, st)
+                    if batch is _DONE or batch is None:
+                        break
+                    # only new or modified chunks that duplicate nothing are embedded
+                    new_texts = [c for _, c, *_, action in batch if action == "new"]
+                    t0 = time.perf_counter()
+                    new_embeddings = iter(self.embedder.embed_batch(new_texts))
+                    st.busy += time.perf_counter() - t0
+                    st.items += len(new_texts)
+                    embeddings = [next(new_embeddings) if action == "new" else None for *_, action in batch]
+                    if not _put(embedded, (batch, embeddings), stop, st):
+                        return
+                _put(embedded, _DONE, stop, st)
+
+            threads = [stage("extract", extract), stage("chunk", chunk), stage("embed", embed)]
+            for t in threads:
+                t.start()
+
+            # Store writes happen on the calling thread.
+            st = stats["store"]
+            counts = {"new": 0, "duplicate": 0, "unchanged": 0, "deleted": 0}
+            try:
+                while True:
+                    item = _get(embedded, stop, st)
+                    if item is _DONE or item is None:
+                        break
+                    batch, embeddings = item
+                    records = []
+                    occurrences = []
+                    for (guid, chunk_text, page_num, chunk_index, byte_offset, action), embedding in zip(batch, embeddings):
+                        metadata = chunk_metadata(file_path, chunk_text, chunk_index, page_num, byte_offset, user_id)
+                        counts[action] += 1
+                        if action == "new":
+                            metadata["sources"] = [source_ref(guid, metadata)]
+                            records.append((guid, chunk_text, embedding, metadata))
+                        else:
+                            occurrences.append((guid, metadata))
+                    t0 = time.perf_counter()
+                    if records:
+                        vector_store.add_many(records)
+                    # duplicates and unchanged chunks only update the sources of their canonical chunk
+                    pending = {}
+                    for guid, metadata in occurrences:
+                        self.dedup.attach(vector_store, pending, guid, metadata)
+                    if pending:
+                        vector_store.update_many((g, None, None, m) for g, m in pending.items())
+                    st.busy += time.perf_counter() - t0
+                    st.items += len(batch)
+                    self.logger.debug(f"Stored batch of {len(records)} new and {len(occurrences)} existing chunks")
+                    if progress is not None:
+                        progress(dict(counts))
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                for t in threads:
+                    t.join()
+
+            # a failed extraction must not look like a shorter document: keep the
+            # stored chunks and the manifest entry as they are
+            if errors:
+                raise errors[0]
+
+            removed = known_ids.difference(seen_ids)
+            if removed:
+                # a chunk is only deleted once no file references it any more
+                pending = {}
+                deletions = [g for g in (self.dedup.detach(vector_store, pending, r) for r in removed) if g]
+                if pending:
+                    vector_store.update_many((g, None, None, m) for g, m in pending.items())
+                if deletions:
+                    vector_store.delete_many(deletions)
+            counts["deleted"] = len(removed)
+            self.manifest.update(abs_path, file_info, seen_ids)
+            self.dedup.save()
+
+            self.logger.info(f"Found {image_count[0]} image references (not loaded)")
+            report = {name: s.as_dict() for name, s in stats.items()}
+            for name, r in report.items():
+                self.logger.info(
+                    f"Stage {name}: {r['items']} items, busy {r['busy_s']:.2f}s, "
+                    f"stalled {r['stall_s']:.2f}s, {r['items_per_s']:.1f} items/s"
+                )
+            report["chunk_tokens"] = self.chunker.token_length_report()
+            self.chunker.reset_stats()
+            self.logger.info(f"Chunk token lengths: {report['chunk_tokens']}")
+            self.logger.info(
+                f"Ingestion pipeline completed successfully: {counts['new']} new, {counts['duplicate']} duplicate, "
+                f"{counts['unchanged']} unchanged, {counts['deleted']} deleted chunks"
+            )
+            report.update(counts, skipped=False)
+            return report
+
         except Exception as e:
             self.logger.error(f"Ingestion pipeline failed: {str(e)}")
             raise
@@ -0,0 +1,107 @@
+import os
+import json
+import uuid
+import hashlib
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+# Namespace for content-derived chunk GUIDs.
+CHUNK_NAMESPACE = uuid.UUID("6f1c2d4e-8a3b-4c5d-9e7f-0a1b2c3d4e5f")
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """
+    Hash a file's content without reading it into memory at once.
+
+    :param file_path: Path to the file.
+    :param block_size: Bytes read per block.
+    :return: Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_guid(file_path, text, occurrence=0):
+    """
+    Deterministic GUID for a chunk, derived from its file and content.
+
+    :param file_path: Absolute path of the source file.
+    :param text: Chunk text.
+    :param occurrence: How many identical chunks precede this one in the file.
+    :return: GUID string, stable across re-ingestions of unchanged content.
+    """
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{file_path}\n{occurrence}\n{text}"))
+
+
+class IngestionManifest:
+    """
+    JSON manifest of ingested files: size, mtime, content hash and chunk GUIDs.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_PATH, "ingest_manifest.json")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+
+    def get(self, file_path):
+        """
+        Return the manifest entry for a file, or None.
+        """
+        return self.entries.get(os.path.abspath(file_path))
+
+    def check(self, file_path):
+        """
+        Compare a file with its manifest entry.
+
+        Size and mtime are checked first; the content hash is only computed when
+        they differ, so unchanged files are skipped without reading them.
+
+        :param file_path: Path to the file.
+        :return: Tuple (unchanged, stat info dict with size, mtime and sha256).
+        """
+        st = os.stat(file_path)
+        info = {"size": st.st_size, "mtime": st.st_mtime, "sha256": None}
+        entry = self.get(file_path)
+        if entry and entry["size"] == info["size"] and entry["mtime"] == info["mtime"]:
+            info["sha256"] = entry["sha256"]
+            return True, info
+        info["sha256"] = file_sha256(file_path)
+        if entry and entry["sha256"] == info["sha256"]:
+            # touched but identical: remember the new mtime so the next check is cheap
+            self.update(file_path, info, entry.get("chunk_ids", []))
+            return True, info
+        return False, info
+
+    def update(self, file_path, info, chunk_ids):
+        """
+        Record a file as ingested with the given chunk GUIDs and persist the manifest.
+        """
+        self.entries[os.path.abspath(file_path)] = {
+            "size": info["size"],
+            "mtime": info["mtime"],
+            "sha256": info["sha256"],
+            "chunk_ids": list(chunk_ids),
+        }
+        self.save()
+
+    def remove(self, file_path):
+        """
+        Forget a file and persist the manifest.
+        """
+        self.entries.pop(os.path.abspath(file_path), None)
+        self.save()
+
+    def save(self):
+        """
+        Atomically write the manifest to disk.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
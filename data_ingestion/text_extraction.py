@@ -2,16 +2,57 @@
 This module is intended to provide extractor classes for pdf, docx and txt documents.
 '''
 
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import os
+import re
+import mmap
 import logging
+import zipfile
 import pdfplumber
 from docx import Document
 
 
 
 
+class ImageRef:
+    """
+    Reference to an image embedded in a document.
+
+    Extraction only records where the image lives; the bytes are read from the
+    raw document stream when `load()` is called. References are picklable so
+    they can be returned from extraction worker processes.
+    """
+
+    def __init__(self, file_path: str, index: int, key, loader, meta: Optional[Dict] = None):
+        """
+        :param file_path: Path to the document containing the image.
+        :param index: Page (PDF) or paragraph (DOCX) index the image appears in.
+        :param key: Loader-specific location of the image inside the document.
+        :param loader: Module-level function `loader(file_path, key) -> bytes`.
+        :param meta: Optional metadata (bbox, size, name).
+        """
+        self.file_path = file_path
+        self.index = index
+        self.key = key
+        self.loader = loader
+        self.meta = meta or {}
+
+    def load(self) -> bytes:
+        """
+        Read the image bytes from the document.
+
+        :return: Raw image bytes.
+        """
+        return self.loader(self.file_path, self.key)
+
+    def __repr__(self) -> str:
+        return f"ImageRef({self.file_path!r}, index={self.index}, key={self.key!r})"
+
+
 class Extractor(ABC):
     """
     Abstract base class for document extractors.
@@ -37,11 +78,87 @@ class Extractor(ABC):
         """
         pass
 
+    def extract(self, file_path: str) -> Iterator[Dict]:
+        """
+        Stream the document in one pass as segments of text and image references.
+
+        Each segment is a dict with the segment `index`, its `text` and the list
+        of `images` (ImageRef) it contains. The default has no images and falls
+        back to `extract_text`.
+
+        :param file_path: Path to the document.
+        :return: Iterator over segments.
+        """
+        for index, text in enumerate(self.extract_text(file_path)):
+            yield {"index": index, "text": text, "images": []}
+
+    def iter_text(self, file_path: str) -> Iterator[str]:
+        """
+        Stream text segments from a document one at a time.
+
+        :param file_path: Path to the document.
+        :return: Iterator over extracted text strings.
+        """
+        for segment in self.extract(file_path):
+            yield segment["text"]
+
+def _load_pdf_image(file_path: str, key) -> bytes:
+    """
+    Read the raw stream of image `key` = (page, image index) from a PDF.
+    """
+    page_num, image_num = key
+    with pdfplumber.open(file_path) as pdf:
+        return pdf.pages[page_num].images[image_num]["stream"].get_data()
+
+
+def _read_pdf_page(file_path: str, page_num: int, page) -> Dict:
+    """
+    Extract one page's text and image references from already parsed page objects.
+    """
+    images = [
+        ImageRef(
+            file_path,
+            page_num,
+            (page_num, image_num),
+            _load_pdf_image,
+            {"bbox": (img["x0"], img["top"], img["x1"], img["bottom"]), "srcsize": img.get("srcsize"), "name": img.get("name")},
+        )
+        for image_num, img in enumerate(page.images)
+    ]
+    segment = {"index": page_num, "text": page.extract_text() or "", "images": images}
+    page.flush_cache()
+    return segment
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Dict]:
+    """
+    Worker for parallel PDF extraction: open the file and extract pages [start, end).
+    """
+    with pdfplumber.open(file_path) as pdf:
+        return [_read_pdf_page(file_path, start + i, page) for i, page in enumerate(pdf.pages[start:end])]
+
+
 class PdfExtractor(Extractor):
     """
     Extractor class for PDF documents.
+
+    Large files are extracted in parallel: pages are sharded into ranges and each
+    worker process opens the file and extracts its range. Small files, or
+    `workers=1`, use the serial path. Workers are spawned rather than forked, as
+    the extractor also runs inside the app server, whose other threads may hold
+    locks a forked child would inherit.
     """
 
+    def __init__(self, workers: Optional[int] = None, min_pages_parallel: int = 32, pages_per_shard: int = 8):
+        """
+        :param workers: Number of worker processes (defaults to the CPU count).
+        :param min_pages_parallel: Files with fewer pages are extracted serially.
+        :param pages_per_shard: Number of pages each worker task extracts.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_pages_parallel = min_pages_parallel
+        self.pages_per_shard = pages_per_shard
+
     def extract_text(self, file_path: str) -> List[str]:
         """
         Extract text from a PDF document.
@@ -49,36 +166,82 @@ class PdfExtractor(Extractor):
         :param file_path: Path to the PDF document.
         :return: List of extracted text strings.
         """
+        return list(self.iter_text(file_path))
+
+    def extract(self, file_path: str) -> Iterator[Dict]:
+        """
+        Stream a PDF document page by page, parsing each page once.
+
+        Each page's parsed objects are released once its text and image
+        references are read, so memory does not grow with the number of pages.
+
+        :param file_path: Path to the PDF document.
+        :return: Iterator over page segments.
+        :raises Exception: If the file cannot be read or parsed, so a failed
+            extraction is never mistaken for a short document.
+        """
         try:
             with pdfplumber.open(file_path) as pdf:
-                text = []
-                for page in pdf.pages:
-                    text.append(page.extract_text())
-                return text
+                num_pages = len(pdf.pages)
+                if self.workers <= 1 or num_pages < self.min_pages_parallel:
+                    for page_num, page in enumerate(pdf.pages):
+                        yield _read_pdf_page(file_path, page_num, page)
+                    return
+            yield from self._extract_parallel(file_path, num_pages)
         except Exception as e:
             logging.error(f"Error extracting text from PDF: {e}")
-            return []
+            raise
+
+    def _extract_parallel(self, file_path: str, num_pages: int) -> Iterator[Dict]:
+        """
+        Yield page segments in page order while shards are extracted by a process pool.
+
+        Only `2 * workers` shards are in flight at once, so results waiting to be
+        consumed stay bounded for very long documents.
+        """
+        shards = [
+            (start, min(start + self.pages_per_shard, num_pages))
+            for start in range(0, num_pages, self.pages_per_shard)
+        ]
+        workers = min(self.workers, len(shards))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            pending = deque()
+            next_shard = 0
+            while next_shard < len(shards) or pending:
+                while next_shard < len(shards) and len(pending) < 2 * workers:
+                    start, end = shards[next_shard]
+                    pending.append(executor.submit(_extract_page_range, file_path, start, end))
+                    next_shard += 1
+                yield from pending.popleft().result()
         
     def extract_images(self, file_path: str) -> List:
         """
         Extract images from a PDF document.
 
+        Images are read from their raw PDF streams rather than rasterized.
+
         :param file_path: Path to the PDF document.
-        :return: List of extracted image bytes.
+        :return: List of (page number, image bytes) tuples.
         """
         try:
             with pdfplumber.open(file_path) as pdf:
                 images = []
                 for page_num, page in enumerate(pdf.pages):
                     for img in page.images:
-                        x0, y0, x1, y1 = img['bbox']
-                        image = page.within_bbox((x0, y0, x1, y1)).to_image()
-                        images.append((page_num, image.original))
+                        images.append((page_num, img["stream"].get_data()))
+                    page.flush_cache()
                 return images
         except Exception as e:
             logging.error(f"Error extracting images from PDF: {e}")
             return []
-        
+
+def _load_docx_image(file_path: str, key) -> bytes:
+    """
+    Read the image part `key` (its name inside the DOCX zip) from a DOCX file.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        return archive.read(key)
+
 class DocxExtractor(Extractor):
     """
     Extractor class for DOCX documents.
@@ -91,19 +254,35 @@ class DocxExtractor(Extractor):
         :param file_path: Path to the DOCX document.
         :return: List of extracted text strings.
         """
+        return list(self.iter_text(file_path))
+
+    def extract(self, file_path: str) -> Iterator[Dict]:
+        """
+        Stream a DOCX document paragraph by paragraph with the images each one embeds.
+
+        :param file_path: Path to the DOCX document.
+        :return: Iterator over paragraph segments.
+        :raises Exception: If the file cannot be read or parsed.
+        """
         try:
             doc = Document(file_path)
-            text = []
-            for paragraph in doc.paragraphs:
-                # add paragraoh titles
-                if paragraph.style.name.startswith('Heading'):
-                    text.append(f"Title: {paragraph.text}")
-                else:
-                    text.append(paragraph.text)
-            return text
+            rels = doc.part.rels
         except Exception as e:
             logging.error(f"Error extracting text from DOCX: {e}")
-            return []
+            raise
+        for paragraph_num, paragraph in enumerate(doc.paragraphs):
+            # add paragraoh titles
+            if paragraph.style.name.startswith('Heading'):
+                text = f"Title: {paragraph.text}"
+            else:
+                text = paragraph.text
+            images = []
+            for r_id in paragraph._element.xpath('.//a:blip/@r:embed'):
+                rel = rels.get(r_id)
+                if rel is not None and "image" in rel.reltype:
+                    partname = str(rel.target_part.partname).lstrip("/")
+                    images.append(ImageRef(file_path, paragraph_num, partname, _load_docx_image, {"name": partname}))
+            yield {"index": paragraph_num, "text": text, "images": images}
         
     def extract_images(self, file_path: str) -> List:
         """
@@ -124,25 +303,88 @@ class DocxExtractor(Extractor):
             logging.error(f"Error extracting images from DOCX: {e}")
             return []
     
+_TXT_PARAGRAPH_BREAK = re.compile(rb"\n[ \t\r\f\v]*\n")
+
+
 class TxtExtractor(Extractor):
     """
     Extractor class for TXT documents.
+
+    The file is memory-mapped and scanned for blank-line paragraph breaks, so
+    only the current paragraph is ever decoded; paragraphs longer than
+    `max_segment_bytes` are split at a line break (or whitespace) to keep
+    segments bounded for files without blank lines, such as logs.
     """
 
+    def __init__(self, max_segment_bytes: int = 64 * 1024):
+        """
+        :param max_segment_bytes: Upper bound on the size of one yielded segment.
+        """
+        self.max_segment_bytes = max_segment_bytes
+
     def extract_text(self, file_path: str) -> List[str]:
         """
         Extract text from a TXT document.
 
         :param file_path: Path to the TXT document.
-        :return: List of extracted text strings.
+        :return: List of paragraph strings.
+        """
+        return [segment["text"] for segment in self.extract(file_path)]
+
+    def extract(self, file_path: str) -> Iterator[Dict]:
+        """
+        Stream a TXT document paragraph by paragraph.
+
+        Each segment carries `offset`, the (start, end) byte range of the
+        paragraph in the file.
+
+        :param file_path: Path to the TXT document.
+        :return: Iterator over paragraph segments.
+        :raises OSError: If the file cannot be read.
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                text = file.readlines()
-            return text
+            f = open(file_path, 'rb')
         except Exception as e:
             logging.error(f"Error extracting text from TXT: {e}")
-            return []
+            raise
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return  # empty files cannot be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                index = 0
+                for start, end in self._paragraph_spans(data):
+                    text = data[start:end].decode('utf-8', errors='replace').strip()
+                    if text:
+                        yield {"index": index, "text": text, "images": [], "offset": (start, end)}
+                        index += 1
+
+    def _paragraph_spans(self, data) -> Iterator[tuple]:
+        size = len(data)
+        pos = 0
+        while pos < size:
+            limit = min(pos + self.max_segment_bytes, size)
+            match = _TXT_PARAGRAPH_BREAK.search(data, pos, limit)
+            if match:
+                yield pos, match.start()
+                pos = match.end()
+                continue
+            if limit == size:
+                yield pos, size
+                return
+            # no paragraph break within the limit: cut at the last line break, else whitespace
+            cut = data.rfind(b"\n", pos, limit)
+            if cut <= pos:
+                cut = max(data.rfind(b" ", pos, limit), data.rfind(b"\t", pos, limit))
+            if cut <= pos:
+                cut = limit
+                while cut > pos and (data[cut] & 0xC0) == 0x80:
+                    cut -= 1  # do not split a UTF-8 sequence
+                if cut == pos:
+                    # no sequence start in the window (not valid UTF-8): cut anyway so we advance
+                    cut = limit
+            yield pos, cut
+            pos = cut
+
     def extract_images(self, file_path: str) -> List:
         return []
 
@@ -151,9 +393,12 @@ class DocumentExtractor:
     Factory class to create document extractors based on file type.
     """
 
-    def __init__(self):
+    def __init__(self, pdf_workers: Optional[int] = None):
+        """
+        :param pdf_workers: Worker processes for PDF extraction (defaults to the CPU count, 1 disables parallelism).
+        """
         self.extractors = {
-            'pdf': PdfExtractor(),
+            'pdf': PdfExtractor(workers=pdf_workers),
             'docx': DocxExtractor(),
             'txt': TxtExtractor()
         }
@@ -179,6 +424,15 @@ class DocumentExtractor:
         """
         extractor = self.get_extractor(file_path)
         return extractor.extract_text(file_path)
+
+    def iter_text(self, file_path: str) -> Iterator[str]:
+        """
+        Stream text segments from a document.
+        :param file_path: Path to the document.
+        :return: Iterator over extracted text strings.
+        """
+        extractor = self.get_extractor(file_path)
+        return extractor.iter_text(file_path)
     
     def extract_images(self, file_path: str) -> List:
         """
@@ -189,17 +443,12 @@ class DocumentExtractor:
         extractor = self.get_extractor(file_path)
         return extractor.extract_images(file_path)
     
-    def extract(self, file_path: str) -> Dict:
+    def extract(self, file_path: str) -> Iterator[Dict]:
         """
-        Extract text and images from a document.
+        Stream text and image references from a document in a single pass.
         :param file_path: Path to the document.
-        :return: Dictionary with extracted text and images.
+        :return: Iterator over segments ({"index", "text", "images"}); image
+            bytes are only read when `ImageRef.load()` is called.
         """
         extractor = self.get_extractor(file_path)
-        text = extractor.extract_text(file_path)
-        images = extractor.extract_images(file_path)
-        return {
-            'text': text,
-            'images': images
-        }
-        
+        return extractor.extract(file_path)
@@ -1,24 +1,52 @@
 import os
 import json 
 import uuid
+import threading
+from collections import Counter
 import numpy as np
 
+from utils.logging_config import get_logger
+from utils.tracing import current_span, traced
+
+logger = get_logger(__name__)
+
 DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data')
 
 class VectorStore:
 
     def __init__(self):
+        # (normalized embedding matrix, row guids) used by search, rebuilt after writes;
+        # published as one tuple so concurrent searches never pair rows with another build's guids
+        self._index = None
         file_in_folder : list = os.listdir(DATA_PATH)
         if "vector_store.json" not in file_in_folder:
             self.vector_store = {
                 "mock_guid" : {"text": None, "embedding" : None, "metadata": None}
             }
-
-            with open(os.path.join(DATA_PATH, "vector_store.json"), 'w') as f:
-                json.dump(self.vector_store, f)
+            self._save_vector_store()
         else:
             with open(os.path.join(DATA_PATH, "vector_store.json"), 'r') as f:
                 self.vector_store = json.load(f)
+        self._mtime = os.stat(os.path.join(DATA_PATH, "vector_store.json")).st_mtime_ns
+
+    def reload_if_changed(self):
+        """
+        Reload the store if another process or instance wrote the file since it was loaded.
+
+        :return: True if the store was reloaded.
+        """
+        path = os.path.join(DATA_PATH, "vector_store.json")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with open(path, 'r') as f:
+            self.vector_store = json.load(f)
+        self._mtime = mtime
+        self._index = None
+        return True
 
 
     def add_data(self, guid, text, embedding, metadata):
@@ -38,6 +66,53 @@ class VectorStore:
         self._save_vector_store()
         print(f"Added data with GUID: {guid}")
     
+    def add_many(self, records):
+        """
+        Add several records and persist the store once.
+
+        :param records: Iterable of (guid, text, embedding, metadata) tuples.
+        """
+        count = 0
+        for guid, text, embedding, metadata in records:
+            self.vector_store[guid] = {
+                "text": text,
+                "embedding": embedding,
+                "metadata": metadata
+            }
+            count += 1
+        self._save_vector_store()
+        print(f"Added {count} records")
+
+    def update_many(self, updates):
+        """
+        Update several records and persist the store once.
+
+        :param updates: Iterable of (guid, text, embedding, metadata) tuples; None fields are left unchanged.
+        """
+        for guid, text, embedding, metadata in updates:
+            if guid not in self.vector_store:
+                continue
+            if text is not None:
+                self.vector_store[guid]["text"] = text
+            if embedding is not None:
+                self.vector_store[guid]["embedding"] = embedding
+            if metadata is not None:
+                self.vector_store[guid]["metadata"] = metadata
+        self._save_vector_store()
+
+    def delete_many(self, guids):
+        """
+        Delete several records and persist the store once.
+
+        :param guids: Iterable of GUIDs to delete.
+        """
+        count = 0
+        for guid in guids:
+            if self.vector_store.pop(guid, None) is not None:
+                count += 1
+        self._save_vector_store()
+        print(f"Deleted {count} records")
+
     def get_data(self, guid):
         """
         Retrieve data from the vector store.
@@ -50,14 +125,27 @@ class VectorStore:
     def _save_vector_store(self):
         """
         Save the vector store to a JSON file.
+
+        The file is written next to the store and moved into place, so readers
+        in other processes or instances never load a half-written store.
         """
         def default(o):
             if isinstance(o, np.ndarray):
                 return o.tolist()
             raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
-        
-        with open(os.path.join(DATA_PATH, "vector_store.json"), 'w') as f:
-            json.dump(self.vector_store, f, default=default)
+
+        path = os.path.join(DATA_PATH, "vector_store.json")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.vector_store, f, default=default)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._mtime = os.stat(path).st_mtime_ns
+        self._index = None
 
 
     def delete_data(self, guid):
@@ -94,6 +182,7 @@ class VectorStore:
         else:
             print(f"GUID {guid} not found in vector store.")    
 
+    @traced("vector_store.search")
     def search(self, query_embedding, top_k=5):
         """
         Search for the top_k most similar embeddings in the vector store.
@@ -102,16 +191,58 @@ class VectorStore:
         :param top_k: The number of top results to return.
         :return: List of tuples containing GUID and similarity score.
         """
-        similarities = []
-        for guid, data in self.vector_store.items():
-            if data["embedding"] is not None:
-                similarity = np.dot(query_embedding, data["embedding"]) / (np.linalg.norm(query_embedding) * np.linalg.norm(data["embedding"]))
-                similarities.append((guid, similarity))
-
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        index = self._search_index()
+        current_span().set(vectors=0 if index is None else int(index[0].shape[0]), top_k=top_k)
+        if index is None:
+            return []
+        if index[0].shape[1] != query.shape[0]:
+            logger.warning(
+                "Query embedding has dimension %d but stored embeddings have %d; no results",
+                query.shape[0], index[0].shape[1],
+            )
+            return []
+        matrix, guids = index
+        norm = np.linalg.norm(query)
+        similarities = matrix @ (query / norm if norm else query)
+        k = min(top_k, len(similarities))
+        if k <= 0:
+            return []
+        top = np.argpartition(-similarities, k - 1)[:k]
         # Sort by similarity score
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        
-        return similarities[:top_k]
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        return [(guids[i], float(similarities[i])) for i in top]
+
+    def _search_index(self):
+        index = self._index
+        if index is None:
+            store = self.vector_store
+            guids, rows = [], []
+            for guid, data in store.items():
+                if data["embedding"] is not None:
+                    # embeddings are stored as (d,) or (1, d) lists
+                    guids.append(guid)
+                    rows.append(np.asarray(data["embedding"], dtype=np.float32).reshape(-1))
+            if not rows:
+                return None
+            dims = Counter(r.shape[0] for r in rows)
+            if len(dims) > 1:
+                # one malformed record must not disable search; index the most common dimension
+                dim = dims.most_common(1)[0][0]
+                skipped = [g for g, r in zip(guids, rows) if r.shape[0] != dim]
+                logger.warning(
+                    "Skipping %d records whose embedding dimension is not %d: %s",
+                    len(skipped), dim, ", ".join(skipped[:20]) + (" ..." if len(skipped) > 20 else ""),
+                )
+                guids, rows = zip(*[(g, r) for g, r in zip(guids, rows) if r.shape[0] == dim])
+                guids = list(guids)
+            matrix = np.vstack(rows)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            index = (matrix / np.where(norms == 0, 1.0, norms), guids)
+            # a reload during the build replaced the records; keep the result for this search only
+            if self.vector_store is store:
+                self._index = index
+        return index
     
     def test(self):
         """
@@ -1,12 +1,14 @@
 from sentence_transformers import SentenceTransformer
 from numpy import ndarray
 from torch import Tensor
+from utils.tracing import current_span, traced
 
 class EmbeddingModel:
     def __init__(self, model_name: str = "nomic-ai/modernbert-embed-base"):
         
         self.model = SentenceTransformer(model_name)
 
+    @traced("embedding.encode")
     def encode(self, query : str, type_query : str) -> list:
         '''
         Encodes the query into a vector representation.
@@ -20,6 +22,22 @@ class EmbeddingModel:
         input_query = [f"{type_query}: {query}"]
         return self.model.encode(input_query)
 
+    @traced("embedding.encode_batch")
+    def encode_batch(self, queries : list, type_query : str, batch_size : int = 32) -> ndarray:
+        '''
+        Encodes several strings in batched forward passes.
+        :param queries: The strings to encode.
+        :param type_query: The type of the queries (e.g., "search_query" or "search_document").
+        :param batch_size: Number of strings per forward pass.
+        :return: Array of shape (len(queries), dim).
+        '''
+        if type_query not in ["search_query", "search_document"]:
+            raise ValueError("Type must be 'search_query' or 'search_document'")
+
+        current_span().set(texts=len(queries))
+        input_queries = [f"{type_query}: {q}" for q in queries]
+        return self.model.encode(input_queries, batch_size=batch_size)
+
     def similarity(self, query_embeddings : ndarray, doc_embeddings : ndarray) -> Tensor:
         return self.model.similarity(query_embeddings, doc_embeddings)
     
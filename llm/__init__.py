@@ -1,3 +1,4 @@
 from .llm import LLM
+from .tokenizer import TokenCounter
 
-__all__ = ["LLM"]
\ No newline at end of file
+__all__ = ["LLM", "TokenCounter"]
@@ -1,31 +1,145 @@
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama.llms import OllamaLLM
 
+from .scheduler import get_scheduler, INTERACTIVE
+from utils import tracing
+
+
+class _UsageCallback(BaseCallbackHandler):
+    """Collect the generation info (Ollama's token counts) of a streamed call's final chunk."""
+
+    def __init__(self):
+        self.info = {}
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                self.info.update(generation.generation_info or {})
+
 
 class LLM:
-    def __init__(self, model_id : str = "llama3.1:8b", temperature: float = 0.1):
+    def __init__(self, model_id : str = "llama3.1:8b", temperature: float = 0.1, keep_alive: str = "30m"):
         """
         Initialize the Llama31_8B class.
 
         :param port: The port number of the locally hosted Ollama server.
+        :param keep_alive: How long Ollama keeps the model (and its KV cache) loaded between calls.
         """
         self.model_id = model_id
         self.temperature = temperature
-        self.model = OllamaLLM(model=self.model_id, temperature=self.temperature)
+        self.keep_alive = keep_alive
+        self.model = OllamaLLM(model=self.model_id, temperature=self.temperature, keep_alive=self.keep_alive)
         self.template = "You are an AI assistant. Answer to the user question being precise and polite:\nUSER QUESTION: {question}"
         self.prompt = ChatPromptTemplate.from_template(self.template)
         self.chain = self.prompt | self.model
+        self.history_template = (
+            "You are an AI assistant. Answer to the user question being precise and polite, "
+            "taking the conversation so far into account.\n{history}\nUSER QUESTION: {question}"
+        )
+        self.history_chain = ChatPromptTemplate.from_template(self.history_template) | self.model
+
+    def _stream_chain(self, chain, inputs: dict, request, span=None) -> str:
+        # stream so a cancelled or expired request stops generating between chunks
+        parts = []
+        usage = _UsageCallback()
+        for chunk in chain.stream(inputs, config={"callbacks": [usage]}):
+            request.check()
+            parts.append(chunk)
+        if span is not None:
+            # counted by Ollama, as in `generate`; chunks are not tokens
+            span.set(prompt_tokens=usage.info.get("prompt_eval_count"), completion_tokens=usage.info.get("eval_count"))
+        return "".join(parts)
 
-    def chat(self, query: str) -> str:
+    def chat(
+        self,
+        query: str,
+        history: Optional[str] = None,
+        priority: int = INTERACTIVE,
+        timeout: Optional[float] = None,
+    ) -> str:
         """
         Send a query to the locally hosted Llama 3.1:8B model and return the response.
 
+        The call goes through the process-wide scheduler, which bounds how many
+        requests hit the Ollama server at once.
+
         :param query: The input prompt to send to the model.
+        :param history: Optional rendered conversation history (summary and recent turns).
+        :param priority: Scheduler priority (INTERACTIVE or BACKGROUND).
+        :param timeout: Seconds before the request is cancelled, including queueing time.
         :return: The model's response to the input prompt.
         """
-        
-        return self.chain.invoke({"question": query})
-        
+        if history:
+            chain, inputs = self.history_chain, {"history": history, "question": query}
+        else:
+            chain, inputs = self.chain, {"question": query}
+        with tracing.span("llm.chat", model=self.model_id) as span:
+            return get_scheduler().run(lambda request: self._stream_chain(chain, inputs, request, span), priority, timeout)
+
+    async def achat(
+        self,
+        query: str,
+        history: Optional[str] = None,
+        priority: int = INTERACTIVE,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Async variant of `chat`; cancelling the awaiting task cancels the request.
+        """
+        if history:
+            chain, inputs = self.history_chain, {"history": history, "question": query}
+        else:
+            chain, inputs = self.chain, {"question": query}
+        with tracing.span("llm.chat", model=self.model_id) as span:
+            return await get_scheduler().arun(
+                lambda request: self._stream_chain(chain, inputs, request, span), priority, timeout
+            )
+
+    def generate(
+        self,
+        prompt: str,
+        context: Optional[list] = None,
+        priority: int = INTERACTIVE,
+        timeout: Optional[float] = None,
+    ) -> tuple[str, list]:
+        """
+        Call Ollama's generate endpoint directly, continuing from a previous `context`.
+
+        Passing back the context returned by the previous turn lets Ollama skip
+        re-encoding the conversation so far.
+
+        :param prompt: The new prompt to append to the context.
+        :param context: Token context returned by a previous call, if any.
+        :param priority: Scheduler priority (INTERACTIVE or BACKGROUND).
+        :param timeout: Seconds before the request is cancelled, including queueing time.
+        :return: The response text and the updated token context.
+        """
+        import ollama
+
+        def call(request):
+            parts = []
+            new_context: list = []
+            for chunk in ollama.generate(
+                model=self.model_id,
+                prompt=prompt,
+                context=context,
+                keep_alive=self.keep_alive,
+                options={"temperature": self.temperature},
+                stream=True,
+            ):
+                request.check()
+                parts.append(chunk["response"])
+                if chunk.get("done"):
+                    new_context = list(chunk.get("context") or [])
+                    span.set(prompt_tokens=chunk.get("prompt_eval_count"), completion_tokens=chunk.get("eval_count"))
+            return "".join(parts), new_context
+
+        with tracing.span("llm.generate", model=self.model_id, continued=bool(context)) as span:
+            return get_scheduler().run(call, priority, timeout)
+
     def test(self):
         """
         Test the Llama31_8B model with a sample query.
@@ -38,4 +152,3 @@ class LLM:
 #     # Example usage
 #     llama = Llama31_8B()
 #     llama.test()
-        
\ No newline at end of file
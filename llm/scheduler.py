@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Lower values are served first.
+INTERACTIVE = 0
+BACKGROUND = 10
+
+
+class RequestCancelled(Exception):
+    """Raised when a queued or running LLM request was cancelled or timed out."""
+
+
+class LLMRequest:
+    """Handle on a scheduled LLM call.
+
+    The callable receives the request itself and should poll `cancelled`
+    between streamed chunks, so cancellation also stops running generations.
+    """
+
+    def __init__(self, fn: Callable[["LLMRequest"], Any], priority: int, timeout: Optional[float]):
+        self.fn = fn
+        self.priority = priority
+        self.submitted_at = time.monotonic()
+        self.deadline = self.submitted_at + timeout if timeout else None
+        self.started_at: Optional[float] = None
+        self._done = threading.Event()
+        self._cancelled = False
+        self._result = None
+        self._error: Optional[BaseException] = None
+
+    @property
+    def cancelled(self) -> bool:
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self._cancelled = True
+        return self._cancelled
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def check(self) -> None:
+        """Raise RequestCancelled if the request was cancelled or ran past its deadline."""
+        if self.cancelled:
+            raise RequestCancelled("LLM request cancelled or timed out")
+
+    def _finish(self, result=None, error: Optional[BaseException] = None) -> None:
+        self._result = result
+        self._error = error
+        self._done.set()
+
+    def result(self) -> Any:
+        """Block until the request completes.
+
+        If the waiting thread is interrupted (e.g. a Streamlit rerun when the user
+        abandons the request) the request is cancelled before re-raising.
+        """
+        try:
+            while not self._done.wait(0.1):
+                if self.cancelled and self.started_at is None:
+                    raise RequestCancelled("LLM request cancelled or timed out while queued")
+        except BaseException:
+            self.cancel()
+            raise
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    async def aresult(self) -> Any:
+        """Await the request without blocking the event loop."""
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self.result)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+
+
+class LLMScheduler:
+    """Process-wide limiter and priority queue in front of the local Ollama server.
+
+    At most `max_concurrency` requests run at once; the rest wait in a priority
+    queue (interactive chat ahead of background work, FIFO within a priority).
+    Cancelled or expired requests are dropped when they reach the head of the queue.
+    """
+
+    def __init__(self, max_concurrency: int = 1, metrics_window: int = 500):
+        self.max_concurrency = max_concurrency
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = 0
+        self._wait_times: deque = deque(maxlen=metrics_window)
+        self._counters = {"completed": 0, "failed": 0, "cancelled": 0}
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True)
+            for i in range(max_concurrency)
+        ]
+        for w in self._workers:
+            w.start()
+
+    def submit(self, fn: Callable[[LLMRequest], Any], priority: int = INTERACTIVE, timeout: Optional[float] = None) -> LLMRequest:
+        """Queue `fn` and return its request handle."""
+        request = LLMRequest(fn, priority, timeout)
+        with self._cond:
+            heapq.heappush(self._queue, (priority, next(self._seq), request))
+            self._cond.notify()
+        return request
+
+    def run(self, fn: Callable[[LLMRequest], Any], priority: int = INTERACTIVE, timeout: Optional[float] = None) -> Any:
+        """Queue `fn` and block until it returns."""
+        return self.submit(fn, priority, timeout).result()
+
+    async def arun(self, fn: Callable[[LLMRequest], Any], priority: int = INTERACTIVE, timeout: Optional[float] = None) -> Any:
+        """Queue `fn` and await its result."""
+        return await self.submit(fn, priority, timeout).aresult()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, request = heapq.heappop(self._queue)
+                if request.cancelled:
+                    self._counters["cancelled"] += 1
+                    request._finish(error=RequestCancelled("LLM request cancelled or timed out while queued"))
+                    continue
+                self._running += 1
+                request.started_at = time.monotonic()
+                self._wait_times.append(request.started_at - request.submitted_at)
+            try:
+                request._finish(result=request.fn(request))
+                outcome = "completed"
+            except RequestCancelled as e:
+                request._finish(error=e)
+                outcome = "cancelled"
+            except BaseException as e:
+                # whatever fn raises, the caller must not be left waiting on the request
+                logger.error("LLM request failed: %s", e)
+                request._finish(error=e)
+                outcome = "failed"
+            with self._cond:
+                self._running -= 1
+                self._counters[outcome] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, in-flight count, outcome counters and recent wait-time percentiles (seconds)."""
+        with self._cond:
+            waits = sorted(self._wait_times)
+            depth = len(self._queue)
+            running = self._running
+            counters = dict(self._counters)
+
+        def pct(p: float) -> float:
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            "queue_depth": depth,
+            "running": running,
+            "max_concurrency": self.max_concurrency,
+            "wait_p50": pct(0.50),
+            "wait_p95": pct(0.95),
+            "wait_max": waits[-1] if waits else 0.0,
+            **counters,
+        }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def _max_concurrency_from_env() -> int:
+    value = os.getenv("OLLAMA_MAX_CONCURRENCY", "1")
+    try:
+        concurrency = int(value)
+    except ValueError:
+        logger.warning("Invalid OLLAMA_MAX_CONCURRENCY=%r, using 1", value)
+        return 1
+    if concurrency < 1:
+        # no workers would serve the queue and every request would wait forever
+        logger.warning("OLLAMA_MAX_CONCURRENCY=%d is below 1, using 1", concurrency)
+        return 1
+    return concurrency
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler, sized by OLLAMA_MAX_CONCURRENCY (default 1, at least 1)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(max_concurrency=_max_concurrency_from_env())
+        return _scheduler
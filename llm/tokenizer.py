@@ -0,0 +1,94 @@
+import math
+from typing import List, Tuple
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Ollama model tags mapped to the Hugging Face tokenizer they were trained with.
+OLLAMA_TOKENIZERS = {
+    "qwen2.5:1.5b": "Qwen/Qwen2.5-1.5B-Instruct",
+    "llama3.2:3b": "meta-llama/Llama-3.2-3B-Instruct",
+    "llama3.1:8b": "meta-llama/Llama-3.1-8B-Instruct",
+    "mistral": "mistralai/Mistral-7B-Instruct-v0.3",
+}
+
+
+class TokenCounter:
+    """Count tokens the way the target Ollama model will see them.
+
+    The model's Hugging Face tokenizer is loaded on first use, so importing or
+    constructing a counter downloads nothing; tests can pass a tokenizer in.
+    When no tokenizer is mapped for the model or it cannot be loaded, counts
+    fall back to a deterministic chars-per-token estimate.
+    """
+
+    def __init__(
+        self,
+        model_id: str = "llama3.1:8b",
+        tokenizer=None,
+        chars_per_token: float = 4.0,
+    ):
+        self.model_id = model_id
+        self.chars_per_token = chars_per_token
+        self._provided_tokenizer = tokenizer
+        self.tokenizer = None
+        self._loaded = False
+
+    def _ensure_tokenizer_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self._provided_tokenizer is not None:
+            self.tokenizer = self._provided_tokenizer
+            return
+        repo = OLLAMA_TOKENIZERS.get(self.model_id)
+        if repo is None:
+            logger.info("No tokenizer mapping for %s, estimating token counts", self.model_id)
+            return
+        try:
+            from transformers import AutoTokenizer
+
+            self.tokenizer = AutoTokenizer.from_pretrained(repo)
+        except Exception as e:
+            logger.warning("Could not load tokenizer %s (%s), estimating token counts", repo, e)
+            self.tokenizer = None
+
+    def count(self, text: str) -> int:
+        """Return the number of tokens in `text`."""
+        if not text:
+            return 0
+        self._ensure_tokenizer_loaded()
+        if self.tokenizer is None:
+            return math.ceil(len(text) / self.chars_per_token)
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def offsets(self, text: str) -> List[Tuple[int, int]]:
+        """Return the (start, end) character span of each token in `text`.
+
+        Without a tokenizer (or with one that cannot report offsets) the spans
+        follow the chars-per-token estimate, so they agree with `count`.
+        """
+        if not text:
+            return []
+        self._ensure_tokenizer_loaded()
+        if self.tokenizer is not None:
+            try:
+                enc = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+                return [(int(s), int(e)) for s, e in enc["offset_mapping"]]
+            except (NotImplementedError, KeyError, TypeError):
+                pass  # slow tokenizers have no offset mapping
+        n = math.ceil(len(text) / self.chars_per_token)
+        return [(round(i * self.chars_per_token), min(round((i + 1) * self.chars_per_token), len(text))) for i in range(n)]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the longest prefix of `text` that fits in `max_tokens`."""
+        if max_tokens <= 0 or not text:
+            return ""
+        self._ensure_tokenizer_loaded()
+        if self.tokenizer is None:
+            return text[: int(max_tokens * self.chars_per_token)]
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= max_tokens:
+            return text
+        return self.tokenizer.decode(ids[:max_tokens])
@@ -0,0 +1,337 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Span attributes counted as tokens, mapped to the `kind` label of the token counter
+TOKEN_ATTRS = {"prompt_tokens": "prompt", "completion_tokens": "completion"}
+
+_current: contextvars.ContextVar = contextvars.ContextVar("tracing_span", default=None)
+
+
+class Span:
+    """One timed operation; spans opened while it is current become its children."""
+
+    __slots__ = ("name", "trace_id", "parent", "children", "attrs", "start", "duration", "error", "_token", "_t0")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.children: List["Span"] = []
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._token = None
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs) -> None:
+        """Attach attributes (sizes, token counts, cache hits) to the span."""
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start": self.start,
+            "duration_s": self.duration,
+            "attrs": self.attrs,
+            "error": self.error,
+            "children": [c.to_dict() for c in self.children],
+        }
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """Flatten the span tree depth-first into rows of name, depth, milliseconds and attributes."""
+        rows = []
+
+        def walk(span: "Span", depth: int):
+            rows.append({
+                "name": span.name,
+                "depth": depth,
+                "ms": (span.duration or 0.0) * 1000,
+                "attrs": span.attrs,
+                "error": span.error,
+            })
+            for child in span.children:
+                walk(child, depth + 1)
+
+        walk(self, 0)
+        return rows
+
+
+class _NoopSpan:
+    """Returned when tracing is off, so instrumented code needs no checks."""
+
+    name = None
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def breakdown(self) -> list:
+        return []
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanContext:
+    __slots__ = ("_tracer", "_name", "_force", "_attrs", "_span")
+
+    def __init__(self, tracer: "Tracer", name: str, force: bool, attrs: Dict[str, Any]):
+        self._tracer = tracer
+        self._name = name
+        self._force = force
+        self._attrs = attrs
+        self._span = None
+
+    def __enter__(self) -> Span:
+        self._span = self._tracer.start(self._name, force=self._force, **self._attrs)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        self._tracer.end(self._span, exc)
+        return False
+
+
+class Tracer:
+    """Lightweight in-process tracer.
+
+    Spans nest through a context variable, so a span opened inside another on
+    the same thread (or asyncio task) becomes its child. Each finished span
+    feeds a per-name latency histogram and token counters; each finished root
+    span (a request) is appended as one JSON line to `jsonl_path`, and the
+    histograms are rewritten in Prometheus text format to `metrics_path` at
+    most every `metrics_interval` seconds and at exit.
+
+    When disabled, spans are recorded only beneath a root started with
+    `force=True` (e.g. a request whose timing breakdown the UI shows); all
+    other instrumentation costs a context-variable lookup.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        jsonl_path: Optional[str] = None,
+        metrics_path: Optional[str] = None,
+        metrics_interval: float = 10.0,
+    ):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self._lock = threading.Lock()
+        # name -> [bucket counts..., +Inf count], sum, count
+        self._buckets: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+        self._tokens: Dict[tuple, int] = {}
+        self._last_metrics_write = 0.0
+        atexit.register(self._flush_metrics)
+
+    def start(self, name: str, force: bool = False, **attrs) -> Any:
+        """Open a span and make it current; it must be closed with `end`."""
+        parent = _current.get()
+        if parent is None and not (self.enabled or force):
+            return _NOOP
+        span = Span(name, parent, attrs)
+        if parent is not None:
+            parent.children.append(span)
+        span._token = _current.set(span)
+        return span
+
+    def end(self, span: Any, error: Optional[BaseException] = None) -> None:
+        if span is _NOOP:
+            return
+        span.duration = time.perf_counter() - span._t0
+        if error is not None:
+            span.error = type(error).__name__
+        try:
+            _current.reset(span._token)
+        except ValueError:
+            # ended from another context than it was started in
+            _current.set(span.parent)
+        self._record(span)
+        if span.parent is None:
+            self._export(span)
+
+    def span(self, name: str, force: bool = False, **attrs) -> Any:
+        """Context manager timing a block: `with tracer.span("stage", size=n) as s: ...`."""
+        if not (self.enabled or force) and _current.get() is None:
+            return _NOOP
+        return _SpanContext(self, name, force, attrs)
+
+    def _record(self, span: Span) -> None:
+        with self._lock:
+            buckets = self._buckets.get(span.name)
+            if buckets is None:
+                buckets = self._buckets[span.name] = [0] * (len(LATENCY_BUCKETS) + 1)
+                self._sums[span.name] = 0.0
+            i = 0
+            while i < len(LATENCY_BUCKETS) and span.duration > LATENCY_BUCKETS[i]:
+                i += 1
+            buckets[i] += 1
+            self._sums[span.name] += span.duration
+            for attr, kind in TOKEN_ATTRS.items():
+                value = span.attrs.get(attr)
+                if value:
+                    key = (span.name, kind)
+                    self._tokens[key] = self._tokens.get(key, 0) + int(value)
+
+    def _export(self, root: Span) -> None:
+        if self.jsonl_path:
+            try:
+                line = json.dumps({"trace_id": root.trace_id, **root.to_dict()}, default=str)
+                with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logger.warning("Could not write trace to %s: %s", self.jsonl_path, e)
+        if self.metrics_path and time.monotonic() - self._last_metrics_write >= self.metrics_interval:
+            self._flush_metrics()
+
+    def _flush_metrics(self) -> None:
+        if not self.metrics_path:
+            return
+        self._last_metrics_write = time.monotonic()
+        try:
+            self.write_prometheus(self.metrics_path)
+        except OSError as e:
+            logger.warning("Could not write metrics to %s: %s", self.metrics_path, e)
+
+    def histograms(self) -> Dict[str, Dict[str, Any]]:
+        """Per span name: count, sum and cumulative bucket counts, plus p50/p95 bucket-bound estimates."""
+        with self._lock:
+            snapshot = {name: (list(b), self._sums[name]) for name, b in self._buckets.items()}
+        result = {}
+        for name, (buckets, total) in snapshot.items():
+            count = sum(buckets)
+            cumulative, running = [], 0
+            for c in buckets:
+                running += c
+                cumulative.append(running)
+            bounds = list(LATENCY_BUCKETS) + [float("inf")]
+            result[name] = {
+                "count": count,
+                "sum_s": total,
+                "buckets": dict(zip(bounds, cumulative)),
+                "p50_s": next(b for b, c in zip(bounds, cumulative) if c >= 0.5 * count),
+                "p95_s": next(b for b, c in zip(bounds, cumulative) if c >= 0.95 * count),
+            }
+        return result
+
+    def prometheus_text(self) -> str:
+        """Histograms and token counters in the Prometheus text exposition format."""
+        lines = [
+            "# HELP span_duration_seconds Latency of traced operations.",
+            "# TYPE span_duration_seconds histogram",
+        ]
+        for name, h in sorted(self.histograms().items()):
+            label = _escape_label(name)
+            for bound, count in h["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'span_duration_seconds_bucket{{span="{label}",le="{le}"}} {count}')
+            lines.append(f'span_duration_seconds_sum{{span="{label}"}} {h["sum_s"]}')
+            lines.append(f'span_duration_seconds_count{{span="{label}"}} {h["count"]}')
+        lines += [
+            "# HELP span_tokens_total Tokens processed by traced operations.",
+            "# TYPE span_tokens_total counter",
+        ]
+        with self._lock:
+            tokens = sorted(self._tokens.items())
+        for (name, kind), count in tokens:
+            lines.append(f'span_tokens_total{{span="{_escape_label(name)}",kind="{kind}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Atomically replace `path` with the current metrics (for a node-exporter textfile collector)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self._sums.clear()
+            self._tokens.clear()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer."""
+    return _tracer
+
+
+def configure_tracing_from_env() -> Tracer:
+    """Configure the process-wide tracer from TRACING, TRACE_FILE and TRACE_METRICS_FILE."""
+    _tracer.enabled = os.getenv("TRACING", "False") == "True"
+    _tracer.jsonl_path = os.getenv("TRACE_FILE") or None
+    _tracer.metrics_path = os.getenv("TRACE_METRICS_FILE") or None
+    for path in (_tracer.jsonl_path, _tracer.metrics_path):
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return _tracer
+
+
+def span(name: str, force: bool = False, **attrs):
+    """Time a block with the process-wide tracer."""
+    return _tracer.span(name, force=force, **attrs)
+
+
+def current_span():
+    """The innermost open span (a no-op span when none is being recorded)."""
+    return _current.get() or _NOOP
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator timing every call of a function or method as a span.
+
+    Args:
+        name: Span name; defaults to the function's qualified name.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled and _current.get() is None:
+                return fn(*args, **kwargs)
+            s = _tracer.start(span_name)
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                _tracer.end(s, e)
+                raise
+            _tracer.end(s)
+            return result
+
+        return wrapper
+
+    return decorator
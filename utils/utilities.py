@@ -1,15 +1,23 @@
 import time
 from backend.question_answering import QA
+from llm.scheduler import BACKGROUND
 from typing import List, Dict
 
-def response_stream(AI : QA, prompt : str):
+def response_stream(AI : QA, prompt : str, mode : str = "plain"):
     """
     Function to stream the response from the AI model.
     """
-    response = AI.run(prompt)
+    response = AI.run(prompt, mode=mode)
+    yield from stream_text(response)
+
+
+def stream_text(response : str, delay : float = 0.05):
+    """
+    Function to stream an already generated response word by word.
+    """
     for word in response.split():
         yield word + " "
-        time.sleep(0.05)
+        time.sleep(delay)
 
 # Funzione per la modalità Deep Research
 def deep_research_response(AI: QA, prompt: str):
@@ -34,7 +42,9 @@ def generate_conversation_title(
     """
     Generate a concise conversation title using the LLM from a list of messages.
 
-    The function does not interact with storage; it only returns a title.
+    The function does not interact with storage; it only returns a title. It
+    runs under its own "title" mode, so the answer cache (which is shared across
+    users) never stores or serves these prompts.
     """
     try:
         recent = messages[-max_messages:] if len(messages) > max_messages else messages
@@ -45,7 +55,7 @@ def generate_conversation_title(
             "Do not include quotes or trailing punctuation.\n\n"
             f"Conversation messages:\n{convo_snippet}\n\nTitle:"
         )
-        raw_title = AI.run(title_prompt)
+        raw_title = AI.run(title_prompt, mode="title", priority=BACKGROUND)
         title = (raw_title or "").strip().splitlines()[0]
         # Cleanup
         title = title.strip("\"' ")
@@ -60,3 +70,20 @@ def generate_conversation_title(
         return title[:max_len]
     except Exception:
         return (fallback_content or "")[:max_len]
+
+
+def title_conversation(AI: QA, store, user_id: str, conversation_id: str, max_len: int = 80) -> str:
+    """
+    Generate a title for a conversation and store it, unless it already has one.
+
+    Meant to run as a background job after the first exchange.
+    """
+    conv = store.get_conversation(user_id, conversation_id)
+    if not conv or conv.get("title"):
+        return conv.get("title") if conv else ""
+    msgs = store.get_messages(user_id, conversation_id)
+    first_user = next((m["content"] for m in msgs if m["role"] == "user"), "")
+    title = generate_conversation_title(AI, msgs, first_user, max_len=max_len)
+    if title:
+        store.rename_conversation(user_id, conversation_id, title)
+    return title